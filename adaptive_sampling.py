@@ -0,0 +1,240 @@
+"""
+    This module is responsible for choosing how many neutron histories the Monte Carlo
+neutronics solver (MONK) runs at every coupling iteration.
+
+    With monk_neutron_sampling, monk_settling_stages, monk_actual_stages and monk_stdv fixed,
+every iteration costs as much as the last one, although in the first iterations the power is
+far from the converged one because of the thermal-hydraulic feedback, and precise tallies are
+wasted. The AdaptiveSampling controller starts with few histories and increases them as the
+coupling residual shrinks, keeping the statistical noise of the power a fraction of the
+coupling error:
+
+    - the residual is the relative L2 norm of the power change between iterations;
+    - the noise is the relative L2 norm of the standard deviations of the node powers (from the
+      relative standard deviation of every node, see PowerMap.update), which decreases as
+      1/sqrt(histories).
+
+    Once the residual is no larger than (a margin times) the noise expected in the difference
+of 2 independent estimates, the coupling error is buried in the statistical noise: more
+iterations with few histories cannot improve the power. From then on the iterations are
+averaged (every node weighted by its inverse variance) and the controller asks for the histories
+needed to bring the relative standard deviation of every node of the average (or of a
+percentile of the nodes) down to monk_stdv, and stops there; if the coupling error shows up
+again above the (now smaller) noise, the average starts over. The histories never grow
+more than a factor from 1 iteration to the next, so that consecutive noise levels stay
+comparable. What is minimized is the total number of histories of the run, not the histories of
+each iteration.
+"""
+
+import numpy as np
+
+
+class AdaptiveSampling(object):
+
+    """
+        This class controls the histories of the Monte Carlo solver over the coupling iterations.
+
+    Attributes:
+        - histories: an int of the histories of the next iteration
+        - total_histories: an int of the histories of all iterations so far
+        - record: a list of (histories, residual, noise) of every iteration
+        - noise_dominated: a bool, True while the coupling error is below the statistical noise
+        - converged: a bool, True once the averaged power is within the target deviation
+        - power: the best estimate of the power so far (the average of the noise-dominated
+          iterations, or the last power before that)
+        - deviation: an array of the relative standard deviation of every node of power
+    """
+
+    def __init__(self, *, initial_histories=20000, neutrons_per_stage=1000, settling_stages=10,
+                 max_histories=20000000, growth=4.0, noise_fraction=0.25, noise_dominance=1.5, target_stdv=0.0001,
+                 target_percentile=100.0):
+
+        """
+            Initializes the AdaptiveSampling object.
+
+        :param initial_histories: int, histories of the first iteration
+        :param neutrons_per_stage: int, histories of a stage (monk_neutron_sampling)
+        :param settling_stages: int, stages discarded before the tallies start (monk_settling_stages)
+        :param max_histories: int, upper bound of the histories of an iteration
+        :param growth: float, maximum ratio of the histories of consecutive iterations
+        :param noise_fraction: float, noise allowed as a fraction of the residual before the noise dominates
+        :param noise_dominance: float, the noise dominates once residual <= noise_dominance * expected noise
+        :param target_stdv: float, relative standard deviation of every node of the final power (monk_stdv)
+        :param target_percentile: float, percentile of the nodes within target_stdv (100 for every node)
+        """
+
+        self.neutrons_per_stage = neutrons_per_stage
+        self.settling_stages = settling_stages
+        self.max_histories = max_histories
+        self.growth = growth
+        self.noise_fraction = noise_fraction
+        self.noise_dominance = noise_dominance
+        self.target_stdv = target_stdv
+        self.target_percentile = target_percentile
+
+        self.histories = self._round(initial_histories)
+        self.total_histories = 0
+        self.record = []
+
+        self.noise_dominated = False
+        self.converged = False
+        self.power = None
+        self.deviation = None
+
+        self._previous_power = None
+        self._previous_noise = None
+        self._weights = None  # sums of the inverse relative variances of every node of the averaged iterations
+
+    def _round(self, histories):
+
+        """This method rounds histories to whole stages, within the bounds"""
+
+        stages = int(np.ceil(min(histories, self.max_histories) / self.neutrons_per_stage))
+
+        return max(stages, 1) * self.neutrons_per_stage
+
+    def monk_parameters(self):
+
+        """
+            This method returns the MONK parameters of the next iteration, as in input_file.py.
+
+        :return: dictionary
+        """
+
+        return {'monk_neutron_sampling': self.neutrons_per_stage, 'monk_settling_stages': self.settling_stages,
+                'monk_actual_stages': self.histories // self.neutrons_per_stage, 'monk_stdv': self.target_stdv}
+
+    @staticmethod
+    def noise(power, relative_deviation):
+
+        """
+            This function returns the relative L2 norm of the standard deviations of the node powers.
+
+        :param power: array of the node powers
+        :param relative_deviation: array of the relative standard deviations of the node powers
+        :return: float
+        """
+
+        norm = np.linalg.norm(power)
+
+        return float(np.linalg.norm(power * relative_deviation) / norm) if norm else 0.0
+
+    def update(self, power, relative_deviation):
+
+        """
+            This method takes the result of an iteration (run with self.histories) and decides the
+        histories of the next one.
+
+        :param power: array of the node powers of the iteration (before relaxation)
+        :param relative_deviation: array of the relative standard deviation of every node power
+        :return: bool, True when the run is converged (no more iterations needed)
+        """
+
+        power = np.asarray(power, dtype=np.float64)
+        relative_deviation = np.broadcast_to(np.asarray(relative_deviation, dtype=np.float64), power.shape)
+        noise = self.noise(power, relative_deviation)
+        histories = self.histories
+
+        self.total_histories += histories
+
+        if self._previous_power is None:
+            residual = np.inf
+        else:
+            norm = np.linalg.norm(power)
+            residual = float(np.linalg.norm(power - self._previous_power) / norm) if norm else 0.0
+
+        self.record.append((histories, residual, noise))
+
+        # the difference of 2 independent estimates has the noise of both
+        expected = np.inf if self._previous_noise is None else np.hypot(noise, self._previous_noise)
+        self.noise_dominated = residual <= self.noise_dominance * expected
+
+        if self.noise_dominated:
+            self._average(power, relative_deviation)
+
+            if np.percentile(self.deviation, self.target_percentile) <= self.target_stdv:
+                self.converged = True
+                wanted = 0
+            else:
+                # every node needs 1 more iteration of deviation 1 / sqrt(remaining) to reach the target,
+                # and deviations scale as 1 / sqrt(histories)
+                remaining = 1 / self.target_stdv ** 2 - self._weights
+                ratios = np.where(remaining > 0, relative_deviation ** 2 * remaining, 0.0)
+                wanted = histories * np.percentile(ratios, self.target_percentile)
+        else:
+            # the coupling error is still visible: earlier iterations are not averaged
+            self._weights = None
+            self.power = power
+            self.deviation = np.array(relative_deviation)
+            wanted = histories
+
+            if np.isfinite(residual) and noise > 0:
+                wanted = max(histories * (noise / (self.noise_fraction * residual)) ** 2, histories)
+
+        # noise levels of consecutive iterations stay comparable, so that the residual is meaningful
+        self.histories = self._round(min(wanted, self.growth * histories))
+
+        self._previous_power = power
+        self._previous_noise = noise
+
+        return self.converged
+
+    def _average(self, power, relative_deviation):
+
+        """This method adds an iteration to the average of the power, every node weighted by its inverse variance"""
+
+        # nodes without deviation (without power) are exact: a large weight that never overflows
+        with np.errstate(divide='ignore'):
+            weight = np.where(relative_deviation > 0, 1 / relative_deviation ** 2, 1E100)
+
+        if self._weights is None:
+            self.power = power.copy()
+            self._weights = weight
+        else:
+            self.power = (self._weights * self.power + weight * power) / (self._weights + weight)
+            self._weights = self._weights + weight
+
+        self.deviation = 1 / np.sqrt(self._weights)
+
+
+class SyntheticMonteCarlo(object):
+
+    """
+        This class is a stand-in for a Monte Carlo neutronics solver coupled to thermal-hydraulics,
+    for testing the controller: the exact power depends linearly on the temperature (Doppler
+    feedback), the temperature depends linearly on the power, and the power returned has a
+    Gaussian noise of relative standard deviation noise_per_history / sqrt(histories).
+
+    Attributes:
+        - shape: an array of the power shape without feedback
+        - feedback: a float of the relative power change per K
+        - heating: a float of the temperature rise per relative power
+        - noise_per_history: a float
+    """
+
+    def __init__(self, nodes=1000, *, feedback=-5E-4, heating=300.0, noise_per_history=3.0, seed=0):
+
+        self.random = np.random.default_rng(seed)
+        self.shape = 1 + 0.5 * np.sin(np.linspace(0, np.pi, nodes))
+        self.feedback = feedback
+        self.heating = heating
+        self.noise_per_history = noise_per_history
+
+    def exact_power(self, temperature):
+
+        power = self.shape * (1 + self.feedback * temperature)
+
+        return power / power.mean()
+
+    def temperature(self, power):
+
+        return self.heating * power
+
+    def solve(self, temperature, histories):
+
+        """This method returns a noisy power and its relative standard deviation"""
+
+        relative_deviation = np.full(self.shape.size, self.noise_per_history / np.sqrt(histories))
+        power = self.exact_power(temperature) * (1 + relative_deviation * self.random.standard_normal(self.shape.size))
+
+        return power, relative_deviation
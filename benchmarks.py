@@ -0,0 +1,333 @@
+"""
+    This module is a reproducible benchmark suite of the geometry and state operations of a core.
+
+    Every case runs at several core sizes: a single pin, an assembly (17 x 17 pins), a quarter
+core (8 x 8 assemblies) and a full core (15 x 15 assemblies), all made of the IFBA duplex pin of
+geometry_starter (3 elements, (3, 1, 1) radial nodes). For each case and size the time is
+measured over a few repetitions (after 1 warm-up run) and the peak memory allocated during 1
+extra run is measured with tracemalloc. Setup (building the core the case works on, opening the
+files it writes) is never part of the measurement. Cases that hold files are context managers,
+which remove their temporary directory once measured.
+
+    Results are saved as JSON, together with the versions of Python and NumPy and the machine,
+so that runs of different releases can be compared (see compare).
+
+    Usage: python benchmarks.py [output.json] [baseline.json]
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from copy import deepcopy
+
+import numpy as np
+
+from geometry_starter import SimplifiedGeometry, pin_type
+from iteration_store import IterationStore
+from layering import equal_thickness, equal_volume, nodalize, nodalize_batch
+from node_table import NodeTable
+
+benchmark_version = 1
+
+# number of pins on each side of the (square) core
+core_sizes = {'single_pin': 1, 'assembly': 17, 'quarter_core': 8 * 17, 'full_core': 15 * 17}
+
+duplex_pin = pin_type(outer_radii=(0.34, 0.4096, 0.4106), inner_radius=0.15, densities=(10270, 10230, 3000),
+                      temperatures=(1200, 900, 600), compositions=({'UO2': 100}, {'Th': 100}, {'ZrB2': 100}),
+                      radial_nodes=(3, 1, 1))
+
+
+def core_geometry(pins_per_side, axial_nodes=1):
+
+    """
+        This function returns the ExpandedGeometry of a square core of duplex pins (with no
+    symmetry, so that every pin is stored).
+
+    :param pins_per_side: int
+    :param axial_nodes: int
+    :return: ExpandedGeometry
+    """
+
+    layout = [['duplex'] * pins_per_side for _ in range(pins_per_side)]
+
+    return SimplifiedGeometry({'duplex': duplex_pin}, layout, axial_nodes).expand_geometry()
+
+
+def core_fuels(pins_per_side, axial_nodes=1):
+
+    """This function returns the list of the Fuel of every pin (and axial level) of a materialized core"""
+
+    geometry = core_geometry(pins_per_side, axial_nodes)
+    geometry.materialize()
+
+    return [geometry.fuel(row, column, axial) for row in range(pins_per_side) for column in range(pins_per_side)
+            for axial in range(axial_nodes)]
+
+
+def element_radii(pins):
+
+    """This function returns the outer radii, inner radii and nodes of every element of pins duplex pins"""
+
+    inner_radii = (duplex_pin.inner_radius, ) + duplex_pin.outer_radii[:-1]
+
+    return duplex_pin.outer_radii * pins, inner_radii * pins, duplex_pin.radial_nodes * pins
+
+
+# each case receives the pins per side of the core and returns the function to be measured,
+# with everything it needs already built
+
+def nodalize_equal_volume(pins_per_side):
+
+    outer_radii, inner_radii, radial_nodes = element_radii(pins_per_side ** 2)
+
+    return lambda: [nodalize(outer_radius, nodes, equal_volume, inner_radius=inner_radius)
+                    for outer_radius, inner_radius, nodes in zip(outer_radii, inner_radii, radial_nodes)]
+
+
+def nodalize_equal_thickness(pins_per_side):
+
+    outer_radii, inner_radii, radial_nodes = element_radii(pins_per_side ** 2)
+
+    return lambda: [nodalize(outer_radius, nodes, equal_thickness, inner_radius=inner_radius)
+                    for outer_radius, inner_radius, nodes in zip(outer_radii, inner_radii, radial_nodes)]
+
+
+def nodalize_batch_equal_volume(pins_per_side):
+
+    outer_radii, inner_radii, radial_nodes = (np.array(values) for values in element_radii(pins_per_side ** 2))
+
+    return lambda: nodalize_batch(outer_radii, radial_nodes, equal_volume, inner_radii=inner_radii)
+
+
+def fuel_construction(pins_per_side):
+
+    def construct():
+        geometry = core_geometry(pins_per_side)
+        geometry.materialize()
+        return geometry
+
+    return construct
+
+
+def fuel_power_update(pins_per_side):
+
+    fuels = core_fuels(pins_per_side)
+    fuels[0].table.power[:] = 1.0
+
+    def update():
+        for fuel in fuels:
+            fuel.power_update()
+
+    return update
+
+
+def table_rod_power(pins_per_side):
+
+    fuels = core_fuels(pins_per_side)
+    fuels[0].table.power[:] = 1.0
+
+    return fuels[0].table.rod_power
+
+
+def fuel_deepcopy(pins_per_side):
+
+    fuels = core_fuels(pins_per_side)
+
+    return lambda: deepcopy(fuels)
+
+
+@contextmanager
+def iteration_store_advance(pins_per_side):
+
+    table = core_fuels(pins_per_side)[0].table
+
+    with tempfile.TemporaryDirectory() as directory, \
+            IterationStore(os.path.join(directory, 'iterations.h5'), table) as store:
+        # steady state of a coupled run: every advance waits for the write of the previous iteration
+        yield store.advance
+
+
+@contextmanager
+def node_table_save(pins_per_side):
+
+    table = core_fuels(pins_per_side)[0].table
+
+    with tempfile.TemporaryDirectory() as directory:
+        def save():
+            for field, array in table.to_arrays().items():
+                np.save(os.path.join(directory, field + '.npy'), array)
+
+        yield save
+
+
+@contextmanager
+def node_table_load(pins_per_side):
+
+    table = core_fuels(pins_per_side)[0].table
+
+    with tempfile.TemporaryDirectory() as directory:
+        for field, array in table.to_arrays().items():
+            np.save(os.path.join(directory, field + '.npy'), array)
+
+        yield lambda: NodeTable.from_arrays({field: np.load(os.path.join(directory, field + '.npy'))
+                                             for field in NodeTable.float_fields + NodeTable.index_fields},
+                                            table.compositions)
+
+
+cases = {'nodalize_equal_volume': nodalize_equal_volume,
+         'nodalize_equal_thickness': nodalize_equal_thickness,
+         'nodalize_batch_equal_volume': nodalize_batch_equal_volume,
+         'fuel_construction': fuel_construction,
+         'fuel_power_update': fuel_power_update,
+         'table_rod_power': table_rod_power,
+         'fuel_deepcopy': fuel_deepcopy,
+         'iteration_store_advance': iteration_store_advance,
+         'node_table_save': node_table_save,
+         'node_table_load': node_table_load}
+
+
+@contextmanager
+def prepared(case, pins_per_side):
+
+    """
+        This function prepares a case at a core size and yields the function measured. Cases
+    that hold files are context managers, and are exited (removing their files) at the end.
+
+    :param case: function(pins_per_side) returning the function measured, or a context manager
+    :param pins_per_side: int
+    :return: context manager yielding a function with no arguments
+    """
+
+    function = case(pins_per_side)
+
+    if not hasattr(function, '__enter__'):
+        yield function
+        return
+
+    with function as entered:
+        yield entered
+
+
+def measure(function, repeats=3):
+
+    """
+        This function measures a function: the times of repeats runs (after 1 warm-up run) in s
+    and the peak memory allocated during 1 more run in bytes.
+
+    :param function: function with no arguments
+    :param repeats: int
+    :return: dictionary
+    """
+
+    function()
+
+    times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+
+    try:
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'time_min': min(times), 'time_median': statistics.median(times), 'time_max': max(times),
+            'repeats': repeats, 'peak_memory': peak_memory}
+
+
+def run(selected_cases=None, sizes=None, repeats=3, log=print):
+
+    """
+        This function runs benchmark cases at core sizes.
+
+    :param selected_cases: iterable of case names (defaults to all cases)
+    :param sizes: iterable of core size names (defaults to all sizes)
+    :param repeats: int
+    :param log: function called with a line of progress for every result (None for silence)
+    :return: dictionary of the results
+    """
+
+    results = {'benchmark_version': benchmark_version,
+               'python': platform.python_version(), 'numpy': np.__version__,
+               'machine': platform.machine(), 'processor': platform.processor(), 'system': platform.system(),
+               'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'results': {}}
+
+    for case in (cases if selected_cases is None else selected_cases):
+        for size in (core_sizes if sizes is None else sizes):
+            with prepared(cases[case], core_sizes[size]) as function:
+                result = measure(function, repeats)
+
+            result['pins'] = core_sizes[size] ** 2
+
+            results['results']['{}/{}'.format(case, size)] = result
+
+            if log is not None:
+                log('{:<30} {:<14} {:>12.6f} s {:>14,d} B'.format(case, size, result['time_median'],
+                                                                   result['peak_memory']))
+
+    return results
+
+
+def save(path, results):
+
+    """This function saves results as JSON"""
+
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def load(path):
+
+    """This function loads results saved as JSON"""
+
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def compare(baseline, current, tolerance=0.1):
+
+    """
+        This function compares 2 sets of results and returns the regressions: every case (and
+    size) in both whose median time or peak memory grew more than tolerance (relative).
+
+    :param baseline: dictionary of results
+    :param current: dictionary of results
+    :param tolerance: float
+    :return: dictionary of (baseline, current) by case and measure
+    """
+
+    regressions = {}
+
+    for key in sorted(set(baseline['results']) & set(current['results'])):
+        for measure_name in ('time_median', 'peak_memory'):
+            old = baseline['results'][key][measure_name]
+            new = current['results'][key][measure_name]
+
+            if new > old * (1 + tolerance):
+                regressions[key, measure_name] = (old, new)
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    output = sys.argv[1] if len(sys.argv) > 1 else 'benchmarks.json'
+
+    benchmark_results = run()
+    save(output, benchmark_results)
+
+    if len(sys.argv) > 2:
+        for (name, measured), (before, after) in compare(load(sys.argv[2]), benchmark_results).items():
+            print('REGRESSION {} {}: {:g} -> {:g}'.format(name, measured, before, after))
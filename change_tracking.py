@@ -0,0 +1,289 @@
+"""
+    This module is responsible for tracking which nodes of a NodeTable changed, so that derived
+quantities are only recomputed where something changed.
+
+    In late coupling iterations only a few nodes change temperature, density or power by more
+than a tolerance. A ChangeTracker keeps the values of every node at the last time its derived
+quantities were computed (the reference), and compares the current state against them in 1
+vectorized pass per field: nodes beyond the tolerance of any field (or whose composition row
+changed, or that were marked explicitly, for example after depletion changed the number
+densities of their row) are dirty. Dirtiness propagates up the hierarchy: the elements and rods
+of dirty nodes are dirty as well.
+
+    Depletion rewrites the number densities of composition rows in place, without changing any
+field of the nodes: the tracker keeps a copy of the versions of the composition rows (like the
+cross-section cache) and marks the nodes that use the rows whose version changed.
+
+    When the nodes that may have changed are known (the nodes written by the solvers of the
+iteration), detect only compares those, and the cost of an iteration scales with the number of
+changed nodes instead of the size of the core.
+
+    Only dirty nodes get a new reference, and the element and rod power sums are updated by
+the power changes of the dirty nodes alone. Nodes that drift slowly, below the tolerance at
+every iteration, keep their old reference until the accumulated drift crosses the tolerance, so
+the error of any derived quantity stays bounded by the tolerances.
+"""
+
+import numpy as np
+
+
+class ChangeTracker(object):
+
+    """
+        This class tracks the changed nodes of a NodeTable and keeps the power sums of its
+    elements and rods up to date.
+
+    Attributes:
+        - table: the NodeTable tracked
+        - tolerances: a dictionary of the tolerance of every tracked field (absolute, or relative
+          for the fields in relative)
+        - relative: a tuple of the fields with relative tolerances
+        - changed: a dictionary of the arrays of the nodes beyond the tolerance of each field
+        - dirty_nodes / dirty_elements / dirty_rods: arrays of the indices found dirty by detect
+        - marked_nodes: an array of the nodes found dirty by detect because they were marked or
+          because the version of their composition row changed
+        - element_power / rod_power: arrays of the power of every element and rod in W, from the
+          reference power of the nodes
+    """
+
+    default_tolerances = {'temperature': 0.5, 'density': 0.1, 'power': 1E-4, 'composition': 0}
+
+    def __init__(self, node_table, tolerances=None, relative=('power', )):
+
+        """
+            Initializes the ChangeTracker object, taking the current state as the reference.
+
+        :param node_table: NodeTable
+        :param tolerances: dictionary of the tolerance of every tracked field
+        :param relative: tuple of the fields with relative tolerances
+        """
+
+        self.table = node_table
+        self.tolerances = dict(self.default_tolerances if tolerances is None else tolerances)
+        self.relative = tuple(relative)
+
+        self._reference = {field: getattr(node_table, field).copy() for field in self.tolerances}
+        self._size = len(node_table)
+        self._marked = []
+        self._detected_marks = 0
+
+        self._compositions = node_table.compositions
+        self._versions = node_table.compositions.versions.copy()
+        self._row_order = None
+        self._row_starts = None
+
+        self.element_power = node_table.element_power()
+        self.rod_power = node_table.rod_power()
+
+        self.changed = {field: np.zeros(0, dtype=np.int64) for field in self.tolerances}
+        self.dirty_nodes = np.zeros(0, dtype=np.int64)
+        self.dirty_elements = np.zeros(0, dtype=np.int64)
+        self.dirty_rods = np.zeros(0, dtype=np.int64)
+        self.marked_nodes = np.zeros(0, dtype=np.int64)
+
+    def _grow(self):
+
+        """This method makes room for nodes appended to the table since the last call (they are dirty)"""
+
+        tracked = self._size
+        size = len(self.table)
+
+        if size == tracked:
+            return
+
+        for field, reference in self._reference.items():
+            grown = np.zeros(size, dtype=reference.dtype)
+            grown[:tracked] = reference
+            # a reference of -1 or NaN is never equal to a real value
+            grown[tracked:] = -1 if field in self.table.index_fields else np.nan
+            self._reference[field] = grown
+
+        self._size = size
+        self._marked.append(np.arange(tracked, size))
+        self._row_order = None
+
+        self.element_power = np.append(self.element_power, np.zeros(self.table.elements - self.element_power.size))
+        self.rod_power = np.append(self.rod_power, np.zeros(self.table.rods - self.rod_power.size))
+
+    def mark(self, nodes):
+
+        """This method marks nodes as dirty, whatever their state (their number densities changed, for example)"""
+
+        self._grow()
+        self._marked.append(np.atleast_1d(np.asarray(nodes, dtype=np.int64)))
+
+    def _row_nodes(self, rows):
+
+        """
+            This method returns the nodes whose reference composition is one of rows, from an
+        index of the nodes sorted by reference composition (built again after compositions change).
+
+        :param rows: array of int
+        :return: array of int
+        """
+
+        if 'composition' not in self._reference:
+            return np.flatnonzero(np.isin(self.table.composition, rows))
+
+        if self._row_order is None:
+            reference = self._reference['composition']
+            self._row_order = np.argsort(reference, kind='stable')
+            self._row_starts = np.searchsorted(reference[self._row_order], np.arange(reference.max(initial=-1) + 2))
+
+        rows = rows[rows < self._row_starts.size - 1]
+        starts = self._row_starts[rows]
+        counts = self._row_starts[rows + 1] - starts
+
+        # gathers the runs of the rows from the sorted nodes in 1 pass
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+
+        return self._row_order[offsets + np.arange(offsets.size)]
+
+    def _modified_nodes(self):
+
+        """This method returns the nodes of the composition rows whose version changed since the last detect"""
+
+        compositions = self.table.compositions
+        versions = compositions.versions
+
+        if compositions is not self._compositions:
+            # every row may have a different content
+            nodes = np.arange(self._size)
+        else:
+            known = min(versions.size, self._versions.size)
+            nodes = self._row_nodes(np.flatnonzero(versions[:known] != self._versions[:known]))
+
+        self._compositions = compositions
+        self._versions = versions.copy()
+
+        return nodes
+
+    def detect(self, candidates=None):
+
+        """
+            This method compares the state of the table with the reference and finds the dirty
+        nodes, elements and rods. Nodes that were marked, or that use a composition row whose
+        version changed, are dirty whatever their state.
+
+        :param candidates: array of the only nodes whose fields may have changed since the last commit,
+                           including nodes given new composition rows (defaults to all nodes)
+        :return: array of the dirty nodes
+        """
+
+        self._grow()
+
+        self._marked.append(self._modified_nodes())
+        self._detected_marks = len(self._marked)
+        self.marked_nodes = np.unique(np.concatenate(self._marked))
+
+        if candidates is not None:
+            candidates = np.unique(np.asarray(candidates, dtype=np.int64))
+
+        for field, tolerance in self.tolerances.items():
+            current = getattr(self.table, field)
+            reference = self._reference[field]
+
+            if candidates is not None:
+                current = current[candidates]
+                reference = reference[candidates]
+
+            if field in self.table.index_fields:
+                changed = current != reference
+            elif field in self.relative:
+                changed = ~(np.abs(current - reference) <= tolerance * np.abs(reference))
+            else:
+                changed = ~(np.abs(current - reference) <= tolerance)
+
+            self.changed[field] = np.flatnonzero(changed) if candidates is None else candidates[changed]
+
+        self.dirty_nodes = np.unique(np.concatenate([self.marked_nodes] + list(self.changed.values())))
+
+        elements = self.table.element[self.dirty_nodes]
+        rods = self.table.rod[self.dirty_nodes]
+        self.dirty_elements = np.unique(elements[elements >= 0])
+        self.dirty_rods = np.unique(rods[rods >= 0])
+
+        return self.dirty_nodes
+
+    def commit(self):
+
+        """
+            This method takes the current state of the dirty nodes as their reference and
+        updates the element and rod power sums, after their derived quantities were recomputed.
+        """
+
+        nodes = self.dirty_nodes
+
+        if 'power' in self._reference:
+            reference_power = self._reference['power'][nodes]
+            delta = self.table.power[nodes] - np.where(np.isnan(reference_power), 0.0, reference_power)
+
+            elements = self.table.element[nodes]
+            rods = self.table.rod[nodes]
+            np.add.at(self.element_power, elements[elements >= 0], delta[elements >= 0])
+            np.add.at(self.rod_power, rods[rods >= 0], delta[rods >= 0])
+
+        if 'composition' in self._reference and self.changed['composition'].size:
+            self._row_order = None
+
+        for field, reference in self._reference.items():
+            reference[nodes] = getattr(self.table, field)[nodes]
+
+        # marks made after detect stay for the next detect
+        del self._marked[:self._detected_marks]
+        self._detected_marks = 0
+
+    def update(self, candidates=None):
+
+        """
+            This method detects and commits at once, for stages that only need the power sums.
+
+        :param candidates: array of the only nodes whose fields may have changed (defaults to all nodes)
+        :return: array of the dirty rods
+        """
+
+        self.detect(candidates)
+        self.commit()
+
+        return self.dirty_rods
+
+    def update_fuels(self, fuels):
+
+        """
+            This method updates the power of the Fuel objects (and of their elements) of the
+        rods found dirty, instead of calling power_update on every Fuel of the core.
+
+        :param fuels: dictionary (or sequence) of Fuel by rod index
+        """
+
+        for rod in self.dirty_rods.tolist():
+            try:
+                fuel = fuels[rod]
+            except (KeyError, IndexError):
+                continue
+
+            for element in fuel.elements:
+                element.power = float(self.element_power[element.index])
+
+            fuel.power = float(self.rod_power[rod])
+
+    def atombarn(self, number_densities):
+
+        """
+            This method updates the (nodes x nuclides) number densities of the dirty nodes whose
+        density or composition changed (or that were marked), in place.
+
+        :param number_densities: array returned by NodeTable.atombarn
+        :return: array of the nodes updated
+        """
+
+        if 'density' in self.tolerances and 'composition' in self.tolerances:
+            # temperature and power alone do not change number densities
+            nodes = np.union1d(np.union1d(self.changed['density'], self.changed['composition']), self.marked_nodes)
+        else:
+            nodes = self.dirty_nodes
+
+        number_densities[nodes] = self.table.compositions.node_atombarn(self.table.composition[nodes],
+                                                                        self.table.density[nodes])
+
+        return nodes
@@ -0,0 +1,485 @@
+"""
+    This module is responsible for saving the full state of a coupled run at regular iterations
+and for resuming the run from the last of these checkpoints.
+
+    A checkpoint holds the geometry (the ExpandedGeometry arrays and its pin types), the node
+state of the NodeTable (radii, densities, temperatures, power, element, rod and composition of
+every node), the CompositionTable, the iteration counter and a dictionary of metadata given by
+the caller (residuals, for example). It is 1 binary file:
+
+    - a header: the magic bytes, the version of the format and the length of the index;
+    - the index: JSON with the iteration, the metadata, the small (text) arrays, the checkpoint
+      this one is a delta against (if any) and, for every array, its dtype, shape, encoding and
+      where its bytes lie in the file;
+    - the arrays, every one starting on a 64-byte boundary.
+
+    Arrays are stored raw (which is memory-mapped on restart) or compressed with zlib after
+shuffling their bytes (the n-th bytes of every value together, which compresses floats much
+better). A delta checkpoint stores the compressed XOR of every array with the same array of the
+previous checkpoint: unchanged values are zeros, which compress to almost nothing (the geometry,
+the radii and most compositions never change). Every full_every checkpoints a full 1 is written,
+so that restarting never reads a long chain of deltas.
+
+    Checkpoints are written by a background thread, while the run goes on: the state is copied
+when it is saved (a copy costs much less than compressing and writing), and the file is written
+under a temporary name and renamed, so a checkpoint file is always complete.
+
+    Restarting only reads the index; every array is memory-mapped (copy-on-write) or
+decompressed when it is first used, so a resumed run starts computing without rebuilding the
+geometry nor reading arrays it does not use.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import re
+import struct
+import zlib
+
+import numpy as np
+
+from composition_table import CompositionTable
+from geometry_starter import ExpandedGeometry, PinTemplate, pin_type
+from instrumentation import timed
+from node_table import NodeTable
+
+checkpoint_version = 1
+
+_magic = b'PYNCCCKP'
+_header = struct.Struct('<8sIQ')  # magic, version, length of the index
+_alignment = 64
+_name = re.compile(r'^checkpoint_(\d+)\.ckpt$')
+
+
+class CheckpointError(ValueError):
+
+    """This exception is raised for checkpoint files that cannot be read"""
+
+
+def _align(offset):
+
+    return -(-offset // _alignment) * _alignment
+
+
+def _shuffle(array):
+
+    """This function returns the bytes of an array with the n-th bytes of every value together"""
+
+    array = np.ascontiguousarray(array)
+
+    return array.reshape(-1).view(np.uint8).reshape(-1, array.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle(data, dtype, shape):
+
+    """This function is the inverse of _shuffle"""
+
+    dtype = np.dtype(dtype)
+    values = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1).T
+
+    return np.ascontiguousarray(values).view(dtype).reshape(shape)
+
+
+def _xor(array, base):
+
+    """This function returns the bitwise XOR of 2 arrays of the same dtype and shape (as their dtype)"""
+
+    array = np.ascontiguousarray(array)
+    base = np.ascontiguousarray(base)
+
+    return np.bitwise_xor(array.view(np.uint8), base.view(np.uint8)).view(array.dtype)
+
+
+def state_arrays(state):
+
+    """
+        This function returns the arrays of the state of a run, named as in the checkpoint files
+    (and as in the geometry artifacts of input_pipeline), and the geometry description.
+
+    :param state: ExpandedGeometry (materialized) or NodeTable
+    :return: dictionary of arrays by name, dictionary (or None without geometry)
+    """
+
+    geometry = None
+
+    if isinstance(state, ExpandedGeometry):
+        geometry = {'axial_nodes': state.axial_nodes,
+                    'templates': [(template.name, template.pin._asdict()) for template in state.templates]}
+        arrays = {'cell_index': state.cell_index, 'cell_types': state.cell_types, 'rod_cells': state.rod_cells()}
+        node_table = state.node_table
+    else:
+        arrays = {}
+        node_table = state
+
+    arrays.update(('node_' + field, array) for field, array in node_table.to_arrays().items())
+    arrays.update(('composition_' + name, array) for name, array in node_table.compositions.to_arrays().items())
+
+    return arrays, geometry
+
+
+def _json_value(value):
+
+    """This function converts the NumPy values of metadata to JSON values (it is the default of json.dumps)"""
+
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+
+    raise TypeError('{} is not a JSON value'.format(type(value).__name__))
+
+
+def checkpoint_path(directory, iteration):
+
+    """This function returns the path of the checkpoint of an iteration"""
+
+    return os.path.join(directory, 'checkpoint_{:06d}.ckpt'.format(iteration))
+
+
+def checkpoints(directory):
+
+    """
+        This function returns the paths of the checkpoints of a directory, by iteration.
+
+    :param directory: str
+    :return: list of str
+    """
+
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+    found = sorted((int(match.group(1)), match.group(0)) for match in map(_name.match, names) if match)
+
+    return [os.path.join(directory, name) for _, name in found]
+
+
+def latest_checkpoint(directory):
+
+    """This function returns the Checkpoint of the last iteration of a directory (None if there is none)"""
+
+    paths = checkpoints(directory)
+
+    return Checkpoint(paths[-1]) if paths else None
+
+
+class CheckpointWriter(object):
+
+    """
+        This class writes the checkpoints of a run in the background.
+
+    Attributes:
+        - directory: the directory of the checkpoint files
+        - every: an int, a checkpoint is saved every this many iterations
+        - compression: an int of the zlib level (None stores the arrays raw, for memory mapping)
+        - full_every: an int, every this many checkpoints is a full 1 (the others are deltas,
+          if compressed; 1 writes only full checkpoints)
+        - keep: an int of the full checkpoints kept with their deltas (None keeps everything)
+        - written: a list of the paths written so far
+    """
+
+    def __init__(self, directory, *, every=1, compression=6, full_every=10, keep=None):
+
+        """
+            Initializes the CheckpointWriter object.
+
+        :param directory: str
+        :param every: int
+        :param compression: int or None
+        :param full_every: int
+        :param keep: int or None
+        """
+
+        self.directory = directory
+        self.every = every
+        self.compression = compression
+        self.full_every = full_every
+        self.keep = keep
+        self.written = []
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._previous = None  # (path, arrays) of the last checkpoint, the base of the next delta
+        self._chain = 0  # checkpoints written since the last full 1
+        self._full = []  # paths of the full checkpoints written
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def due(self, iteration):
+
+        """This method tells whether the checkpoint of an iteration should be saved"""
+
+        return iteration % self.every == 0
+
+    @timed('checkpoint.save')
+    def save(self, state, iteration, metadata=None, *, force=False):
+
+        """
+            This method copies the state and writes its checkpoint in the background, if it is due
+        (or forced).
+
+        :param state: ExpandedGeometry (materialized) or NodeTable
+        :param iteration: int
+        :param metadata: dictionary of JSON values (NumPy numbers and arrays are converted, other values
+                         raise TypeError here rather than in the writer thread)
+        :param force: bool, save even if the checkpoint is not due
+        :return: str, path of the checkpoint (None if it is not due)
+        """
+
+        if not force and not self.due(iteration):
+            return None
+
+        # a copy in JSON values, as it is read back (and later changes of the caller are not saved)
+        metadata = json.loads(json.dumps(dict(metadata or {}), default=_json_value))
+
+        arrays, geometry = state_arrays(state)
+        arrays = {name: np.array(array) for name, array in arrays.items()}
+        path = checkpoint_path(self.directory, iteration)
+
+        # the arrays of the previous checkpoint must stay untouched until this 1 is written
+        self.wait()
+        self._pending = self._writer.submit(self._write, path, iteration, arrays, geometry, metadata)
+
+        return path
+
+    @timed('checkpoint.wait')
+    def wait(self):
+
+        """This method blocks until the background write (if any) is finished"""
+
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    @timed('checkpoint.write')
+    def _write(self, path, iteration, arrays, geometry, metadata):
+
+        """This method encodes and writes 1 checkpoint (runs in the writer thread)"""
+
+        delta = (self.compression is not None and self._previous is not None and self._chain + 1 < self.full_every)
+        base_arrays = self._previous[1] if delta else {}
+
+        index = {'version': checkpoint_version, 'iteration': iteration, 'metadata': metadata, 'geometry': geometry,
+                 'base': os.path.basename(self._previous[0]) if delta else None, 'strings': {}, 'arrays': {}}
+        blobs = []
+        offset = 0
+
+        for name, array in arrays.items():
+            if array.dtype.kind in 'US':
+                index['strings'][name] = array.tolist()
+                continue
+
+            base = base_arrays.get(name)
+
+            if self.compression is None:
+                encoding, data = 'raw', np.ascontiguousarray(array).tobytes()
+            elif base is not None and base.dtype == array.dtype and base.shape == array.shape:
+                encoding, data = 'xor', zlib.compress(_shuffle(_xor(array, base)), self.compression)
+            else:
+                encoding, data = 'zlib', zlib.compress(_shuffle(array), self.compression)
+
+            offset = _align(offset)
+            index['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'encoding': encoding,
+                                     'offset': offset, 'bytes': len(data)}
+            blobs.append((offset, data))
+            offset += len(data)
+
+        encoded_index = json.dumps(index).encode()
+        start = _align(_header.size + len(encoded_index))
+        temporary = path + '.tmp'
+
+        with open(temporary, 'wb') as checkpoint:
+            checkpoint.write(_header.pack(_magic, checkpoint_version, len(encoded_index)))
+            checkpoint.write(encoded_index)
+
+            for blob_offset, data in blobs:
+                checkpoint.seek(start + blob_offset)
+                checkpoint.write(data)
+
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+
+        os.replace(temporary, path)
+
+        self._previous = (path, arrays)
+        self._chain = self._chain + 1 if delta else 0
+        self.written.append(path)
+
+        if not delta:
+            self._full.append(path)
+            self._prune()
+
+    def _prune(self):
+
+        """This method removes the checkpoints older than the keep last full checkpoints"""
+
+        if self.keep is None or len(self._full) <= self.keep:
+            return
+
+        oldest = self.written.index(self._full[-self.keep])
+
+        for path in self.written[:oldest]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        self.written = self.written[oldest:]
+        self._full = self._full[-self.keep:]
+
+    def close(self):
+
+        """This method finishes the pending write and stops the writer thread"""
+
+        self.wait()
+        self._writer.shutdown()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exception):
+
+        self.close()
+
+
+class Checkpoint(object):
+
+    """
+        This class reads a checkpoint file lazily.
+
+    Attributes:
+        - path: the path of the file
+        - version: an int of the version of the format of the file
+        - iteration: an int of the iteration of the checkpoint
+        - metadata: the dictionary given when it was saved
+        - base: the path of the checkpoint this 1 is a delta against (None for a full checkpoint)
+        - names: a tuple of the names of the arrays
+    """
+
+    def __init__(self, path):
+
+        """
+            Initializes the Checkpoint object, reading only the header and the index.
+
+        :param path: str
+        """
+
+        self.path = path
+
+        with open(path, 'rb') as checkpoint:
+            header = checkpoint.read(_header.size)
+
+            if len(header) != _header.size:
+                raise CheckpointError('{} is not a checkpoint (too short)'.format(path))
+
+            magic, self.version, length = _header.unpack(header)
+
+            if magic != _magic:
+                raise CheckpointError('{} is not a checkpoint'.format(path))
+
+            if self.version > checkpoint_version:
+                raise CheckpointError('{} has version {}, newer than {}'.format(path, self.version,
+                                                                                checkpoint_version))
+
+            index = json.loads(checkpoint.read(length).decode())
+
+        self._start = _align(_header.size + length)
+        self._index = index['arrays']
+        self._strings = index['strings']
+        self._geometry = index['geometry']
+        self._arrays = {}
+        self._base = None
+
+        self.iteration = index['iteration']
+        self.metadata = index['metadata']
+        self.base = None if index['base'] is None else os.path.join(os.path.dirname(path), index['base'])
+        self.names = tuple(self._index) + tuple(self._strings)
+
+    def _read(self, entry):
+
+        with open(self.path, 'rb') as checkpoint:
+            checkpoint.seek(self._start + entry['offset'])
+            data = checkpoint.read(entry['bytes'])
+
+        if len(data) != entry['bytes']:
+            raise CheckpointError('{} is truncated'.format(self.path))
+
+        return zlib.decompress(data)
+
+    def array(self, name):
+
+        """
+            This method returns an array of the checkpoint. Raw arrays are memory-mapped
+        copy-on-write (changing them never changes the file), others are decompressed (and
+        applied to their base) the first time they are asked for.
+
+        :param name: str
+        :return: array
+        """
+
+        if name in self._arrays:
+            return self._arrays[name]
+
+        if name in self._strings:
+            return np.array(self._strings[name])
+
+        try:
+            entry = self._index[name]
+        except KeyError:
+            raise KeyError('{} has no array {}'.format(self.path, name)) from None
+
+        shape = tuple(entry['shape'])
+
+        if entry['encoding'] == 'raw':
+            if entry['bytes']:
+                array = np.memmap(self.path, mode='c', dtype=entry['dtype'], shape=shape,
+                                  offset=self._start + entry['offset'])
+            else:
+                array = np.zeros(shape, dtype=entry['dtype'])
+        elif entry['encoding'] == 'zlib':
+            array = _unshuffle(self._read(entry), entry['dtype'], shape)
+        elif entry['encoding'] == 'xor':
+            if self._base is None:
+                self._base = Checkpoint(self.base)
+
+            array = _xor(_unshuffle(self._read(entry), entry['dtype'], shape), self._base.array(name))
+        else:
+            raise CheckpointError('{} has an unknown encoding {}'.format(self.path, entry['encoding']))
+
+        self._arrays[name] = array
+
+        return array
+
+    def compositions(self):
+
+        """This method returns the CompositionTable of the checkpoint"""
+
+        return CompositionTable.from_arrays({name[len('composition_'):]: self.array(name) for name in self.names
+                                             if name.startswith('composition_')})
+
+    def node_table(self):
+
+        """This method returns the NodeTable of the checkpoint, with the arrays of the checkpoint as storage"""
+
+        return NodeTable.from_arrays({name[len('node_'):]: self.array(name) for name in self.names
+                                      if name.startswith('node_')}, self.compositions())
+
+    def geometry(self):
+
+        """
+            This method returns the (materialized) ExpandedGeometry of the checkpoint, without
+        expanding the geometry again (only the pin templates are rebuilt).
+
+        :return: ExpandedGeometry
+        """
+
+        if self._geometry is None:
+            raise CheckpointError('{} has no geometry (it was saved from a NodeTable)'.format(self.path))
+
+        templates = [PinTemplate(name, pin_type(**{key: tuple(value) if isinstance(value, list) else value
+                                                   for key, value in pin.items()}))
+                     for name, pin in self._geometry['templates']]
+
+        return ExpandedGeometry(templates, self.array('cell_index'), self.array('cell_types'),
+                                self._geometry['axial_nodes'], node_table=self.node_table(),
+                                rod_cells=self.array('rod_cells'))
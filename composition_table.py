@@ -0,0 +1,415 @@
+"""
+    This module is responsible for the central table of compositions of a core.
+
+    Compositions are stored as a dense matrix of number densities in atoms/barn-cm, with one
+column per nuclide (the Atom objects of the materials module) and one row per distinct
+composition. Nodes do not hold compositions: they hold the index of a row of this table.
+
+    Fresh nodes with the same composition share one row, whatever their densities: the row
+holds the number densities at a reference density, and those of a node are scaled to its own
+density (node_atombarn). Once a node has to diverge (with burnup, for example) its row is
+detached, copy-on-write: the node gets a row of its own, which is a copy of the shared one, and
+only then is it modified. Rows no node points at any more are reused for new compositions.
+
+    Every row has a version, which changes whenever the content of the row does (a new
+composition in a reused row, a detached copy, or modified, called by whoever rewrites rows in
+place): caches keyed on rows, such as the cross sections, compare versions to tell stale rows.
+"""
+
+import json
+
+import numpy as np
+
+from materials import avogadro, compounds, nuclides as known_nuclides
+
+
+class CompositionTable(object):
+
+    """
+        This class stores the number densities of every distinct composition of a core.
+
+    Attributes:
+        - nuclides: a tuple of the names of the nuclides (columns of the table)
+        - number_densities: a (compositions x nuclides) array in atoms/barn-cm
+        - reference_density: an array of the mass density (kg/m3) the number densities refer to
+        - references: an array of the number of nodes pointing at each row
+        - sources: a list of the mass % dictionaries each row was created from (see mass_percent
+          for the current content of a row)
+        - versions: an array of the version of every row, changed with the content of the row
+    """
+
+    def __init__(self, nuclides=None, capacity=16):
+
+        """
+            Initializes an empty CompositionTable object.
+
+        :param nuclides: dictionary of Atom by name (defaults to all nuclides in materials)
+        :param capacity: int, number of compositions preallocated (the table grows as needed)
+        """
+
+        nuclides = known_nuclides if nuclides is None else nuclides
+
+        self.nuclides = tuple(nuclides)
+        self._columns = {name: column for column, name in enumerate(self.nuclides)}
+        self._masses = np.array([nuclides[name].mass.value for name in self.nuclides])
+
+        self.size = 0
+        self.sources = []
+
+        self._keys = {}
+        self._row_keys = {}
+        self._free = {}  # rows without references, in order of release (a dictionary as ordered set)
+
+        self._capacity = max(int(capacity), 1)
+        self._number_densities = np.zeros((self._capacity, len(self.nuclides)))
+        self._reference_density = np.zeros(self._capacity)
+        self._references = np.zeros(self._capacity, dtype=np.int64)
+        self._versions = np.zeros(self._capacity, dtype=np.int64)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+
+        """
+            This method creates a CompositionTable from the arrays returned by to_arrays (for
+        example arrays memory-mapped from a file).
+
+        :param arrays: dictionary of arrays by name
+        :return: CompositionTable
+        """
+
+        table = cls({name: known_nuclides[name] for name in arrays['nuclides'].tolist()}, 1)
+
+        table.size = int(arrays['reference_density'].size)
+        table._capacity = max(table.size, 1)
+        table._number_densities = arrays['number_densities']
+        table._reference_density = arrays['reference_density']
+        table._references = arrays['references']
+        table._versions = np.zeros(table._capacity, dtype=np.int64)
+        table.sources = json.loads(str(arrays['sources']))
+
+        for row in arrays['interned'].tolist():
+            key = tuple(sorted(table.sources[row].items()))
+            table._keys[key] = row
+            table._row_keys[row] = key
+
+        table._free = dict.fromkeys(np.flatnonzero(table.references == 0).tolist())
+
+        return table
+
+    def assign(self, other):
+
+        """
+            This method replaces the content of the table by a copy of the content of another
+        (a table restored from a checkpoint, for example), in place: nodes and caches keep the
+        table, and the version of every row changes, so that caches keyed on rows see them as
+        changed.
+
+        :param other: CompositionTable with the same nuclides
+        """
+
+        if other.nuclides != self.nuclides:
+            raise ValueError('the tables must have the same nuclides')
+
+        previous = self.size
+        self._reserve(max(other.size - self.size, 0))
+
+        self._number_densities[:other.size] = other.number_densities
+        self._reference_density[:other.size] = other.reference_density
+        self._references[:other.size] = other.references
+        self._references[other.size:] = 0
+        self._versions[:max(previous, other.size)] += 1
+
+        self.size = other.size
+        self.sources = [dict(source) for source in other.sources]
+        self._keys = dict(other._keys)
+        self._row_keys = dict(other._row_keys)
+        self._free = dict(other._free)
+
+    def to_arrays(self):
+
+        """This method returns a dictionary of arrays with the whole content of the table"""
+
+        return {'nuclides': np.array(self.nuclides), 'number_densities': self.number_densities,
+                'reference_density': self.reference_density, 'references': self.references,
+                'sources': np.array(json.dumps(self.sources)),
+                'interned': np.array(sorted(self._row_keys), dtype=np.int64)}
+
+    def __len__(self):
+
+        return self.size
+
+    def subset(self, rows):
+
+        """
+            This method returns a new CompositionTable with a copy of some rows, in the given
+        order and without references (for a copy of some nodes, see NodeTable.extract).
+
+        :param rows: array of int
+        :return: CompositionTable
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+
+        table = CompositionTable({name: known_nuclides[name] for name in self.nuclides}, rows.size)
+        table.size = rows.size
+        table._number_densities[:rows.size] = self.number_densities[rows]
+        table._reference_density[:rows.size] = self.reference_density[rows]
+        table.sources = [dict(self.sources[row]) for row in rows.tolist()]
+
+        for new_row, row in enumerate(rows.tolist()):
+            if row in self._row_keys:
+                key = self._row_keys[row]
+                table._keys[key] = new_row
+                table._row_keys[new_row] = key
+
+        return table
+
+    @property
+    def number_densities(self):
+        return self._number_densities[:self.size]
+
+    @property
+    def reference_density(self):
+        return self._reference_density[:self.size]
+
+    @property
+    def references(self):
+        return self._references[:self.size]
+
+    @property
+    def versions(self):
+        return self._versions[:self.size]
+
+    def _reserve(self, rows):
+
+        """This method grows (doubling) the preallocated arrays to fit more rows"""
+
+        required = self.size + rows
+
+        if required <= self._capacity:
+            return
+
+        capacity = self._capacity
+
+        while capacity < required:
+            capacity *= 2
+
+        number_densities = np.zeros((capacity, len(self.nuclides)))
+        number_densities[:self.size] = self.number_densities
+        reference_density = np.zeros(capacity)
+        reference_density[:self.size] = self.reference_density
+        references = np.zeros(capacity, dtype=np.int64)
+        references[:self.size] = self.references
+        versions = np.zeros(capacity, dtype=np.int64)
+        versions[:self.size] = self.versions
+
+        self._number_densities = number_densities
+        self._reference_density = reference_density
+        self._references = references
+        self._versions = versions
+        self._capacity = capacity
+
+    def column(self, nuclide):
+
+        """This method returns the column of a nuclide in the number_densities matrix"""
+
+        return self._columns[nuclide]
+
+    def atombarn(self, composition, density):
+
+        """
+            This method converts a mass % composition to number densities in atoms/barn-cm.
+        The keys of the composition are either nuclides (such as 'U235') or compounds of the
+        materials module (such as 'UO2').
+
+        :param composition: dictionary of mass % by nuclide or compound
+        :param density: float, mass density in kg/m3
+        :return: array of number densities, one per nuclide
+        """
+
+        number_densities = np.zeros(len(self.nuclides))
+        total = sum(composition.values())
+
+        for name, mass_percent in composition.items():
+            try:
+                atoms = compounds[name]
+            except KeyError:
+                if name not in self._columns:
+                    raise KeyError('{} is neither a nuclide nor a compound'.format(name))
+                atoms = {name: 1.0}
+
+            columns = [self._columns[nuclide] for nuclide in atoms]
+            counts = np.array(list(atoms.values()))
+            molar_mass = counts @ self._masses[columns]
+
+            # g/cm3 * mol/g * atoms/mol gives atoms/cm3, and 1 barn is 1E-24 cm2
+            formula_units = (density / 1000) * (mass_percent / total) * avogadro / molar_mass * 1E-24
+
+            number_densities[columns] += formula_units * counts
+
+        return number_densities
+
+    def mass_percent(self, row):
+
+        """
+            This method returns the current content of a row (depleted or not) as a composition.
+
+        :param row: int
+        :return: dictionary of mass % by nuclide
+        """
+
+        masses = self.number_densities[row] * self._masses
+        total = masses.sum()
+
+        if not total:
+            return {}
+
+        return {nuclide: float(100 * mass / total) for nuclide, mass in zip(self.nuclides, masses) if mass}
+
+    def _allocate(self, rows):
+
+        """This method returns rows for new content: released rows first, then new rows at the end"""
+
+        reused = []
+
+        while self._free and len(reused) < rows:
+            row = next(iter(self._free))
+            del self._free[row]
+
+            if self._references[row] == 0:
+                # the row may no longer be found by the composition it was interned with
+                self._keys.pop(self._row_keys.pop(row, None), None)
+                reused.append(row)
+
+        added = rows - len(reused)
+        self._reserve(added)
+        self.sources.extend({} for _ in range(added))
+        self.size += added
+
+        rows = np.concatenate([np.array(reused, dtype=np.int64), np.arange(self.size - added, self.size)])
+        self._versions[rows] += 1
+
+        return rows
+
+    def modified(self, rows):
+
+        """
+            This method changes the version of rows whose number densities or reference density
+        were rewritten in place (by depletion, for example), so that caches keyed on rows see them
+        as changed.
+
+        :param rows: array of int
+        """
+
+        self._versions[np.unique(np.asarray(rows, dtype=np.int64))] += 1
+
+    def intern(self, composition, density):
+
+        """
+            This method returns the row of a fresh composition, adding it to the table (at the
+        given density, its reference density) if there is no such row yet. Rows are shared at any
+        density, since node_atombarn scales them. It does not add a reference to the row.
+
+        :param composition: dictionary of mass % by nuclide or compound
+        :param density: float, mass density in kg/m3
+        :return: int
+        """
+
+        key = tuple(sorted(composition.items()))
+
+        try:
+            row = self._keys[key]
+        except KeyError:
+            pass
+        else:
+            # a released row is found again before it is reused
+            self._free.pop(row, None)
+            return row
+
+        row = int(self._allocate(1)[0])
+        self._number_densities[row] = self.atombarn(composition, density)
+        self._reference_density[row] = density
+        self.sources[row] = composition
+
+        self._keys[key] = row
+        self._row_keys[row] = key
+
+        return row
+
+    def acquire(self, rows):
+
+        """This method adds one reference to each row in rows (repetitions count)"""
+
+        rows = np.asarray(rows, dtype=np.int64)
+        np.add.at(self._references, rows, 1)
+
+        if self._free:
+            for row in np.unique(rows).tolist():
+                self._free.pop(row, None)
+
+    def release(self, rows):
+
+        """
+            This method removes one reference from each row in rows (repetitions count). Rows left
+        without references are reused by later compositions.
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+        np.subtract.at(self._references, rows, 1)
+
+        unused = np.unique(rows)
+        self._free.update(dict.fromkeys(unused[self._references[unused] == 0].tolist()))
+
+    def detach(self, rows):
+
+        """
+            Copy-on-write: receives the rows of nodes that are about to change composition and
+        returns rows that each node owns alone (one per item of rows, in the same order). A node
+        keeps its row if no other node points at it, otherwise it gets a copy of the row.
+
+        :param rows: array of int
+        :return: array of int
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+
+        requests = np.bincount(rows, minlength=self.size)
+
+        first = np.zeros(rows.size, dtype=bool)
+        first[np.unique(rows, return_index=True)[1]] = True
+
+        # the first requesting node keeps the row if every node pointing at it is requesting
+        keep = first & (self._references[rows] == requests[rows])
+        copied = ~keep
+
+        for row in np.unique(rows[keep]):
+            # the row is about to diverge, so it can no longer be shared by fresh nodes
+            self._keys.pop(self._row_keys.pop(int(row), None), None)
+
+        new_rows = self._allocate(int(np.count_nonzero(copied)))
+
+        detached = rows.copy()
+        detached[copied] = new_rows
+
+        self._number_densities[new_rows] = self._number_densities[rows[copied]]
+        self._reference_density[new_rows] = self._reference_density[rows[copied]]
+        self._references[new_rows] = 1
+        self.release(rows[copied])
+
+        for new_row, row in zip(new_rows.tolist(), rows[copied].tolist()):
+            self.sources[new_row] = self.sources[row]
+
+        return detached
+
+    def node_atombarn(self, rows, densities):
+
+        """
+            This method returns the number densities of many nodes at once, scaled from the
+        reference density of their rows to their own (current) mass densities.
+
+        :param rows: array of int
+        :param densities: array of float, mass densities in kg/m3
+        :return: (nodes x nuclides) array in atoms/barn-cm
+        """
+
+        return self.number_densities[rows] * (densities / self.reference_density[rows])[:, np.newaxis]
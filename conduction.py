@@ -0,0 +1,345 @@
+"""
+    This module is responsible for the radial heat conduction in fuel rods: from the power of
+the fuel nodes and the coolant conditions, it computes the temperature of every fuel node and
+the inner and outer temperatures of the cladding.
+
+    Each rod is discretized in finite volumes: the fuel nodes given by layering.nodalize (or
+layering.nodalize_batch), the gap, which is a conductance between the pellet and the cladding,
+and a few equal-thickness cladding nodes, cooled at the outer surface by a heat transfer
+coefficient. This gives 1 tridiagonal system per rod.
+
+    All rods are solved together: rods with fewer nodes are padded on the inner side with
+decoupled dummy nodes, so the systems of all rods are stacked in 2D arrays and solved by a
+Thomas algorithm vectorized over the rods (the only Python loop is over the nodes of a rod).
+Conductivities depend on temperature, and on the material of each fuel node (a duplex or IFBA
+pin has several), so the systems are assembled and solved again until the temperatures stop
+changing. Fuel materials without a conductivity correlation are rejected.
+"""
+
+import numpy as np
+
+from layering import nodalize_batch, equal_thickness, volume_averaged
+
+
+def uo2_conductivity(temperature):
+
+    """
+        This function returns the thermal conductivity of UO2 (95% of theoretical density)
+    in W/m-K, with the phonon and electronic terms of the MATPRO/Fink correlation.
+
+    :param temperature: array of float, in K
+    :return: array of float
+    """
+
+    return 1 / (0.0375 + 2.165E-4 * temperature) + 4.715E9 / temperature ** 2 * np.exp(-16361 / temperature)
+
+
+def zircaloy_conductivity(temperature):
+
+    """
+        This function returns the thermal conductivity of Zircaloy in W/m-K (MATPRO).
+
+    :param temperature: array of float, in K
+    :return: array of float
+    """
+
+    return 7.51 + 2.09E-2 * temperature - 1.45E-5 * temperature ** 2 + 7.67E-9 * temperature ** 3
+
+
+# conductivity of the fuel materials, by the main component of the composition of the node
+fuel_conductivities = {'UO2': uo2_conductivity}
+
+
+def thomas(lower, diagonal, upper, rhs):
+
+    """
+        This function solves many tridiagonal systems at once with the Thomas algorithm. Each
+    row of the arguments is one system: lower[:, 0] and upper[:, -1] are not used.
+
+    :param lower: 2D array
+    :param diagonal: 2D array
+    :param upper: 2D array
+    :param rhs: 2D array
+    :return: 2D array of the solutions
+    """
+
+    nodes = diagonal.shape[1]
+
+    modified_upper = np.empty_like(diagonal)
+    modified_rhs = np.empty_like(diagonal)
+
+    modified_upper[:, 0] = upper[:, 0] / diagonal[:, 0]
+    modified_rhs[:, 0] = rhs[:, 0] / diagonal[:, 0]
+
+    for node in range(1, nodes):
+        denominator = diagonal[:, node] - lower[:, node] * modified_upper[:, node - 1]
+        modified_upper[:, node] = upper[:, node] / denominator
+        modified_rhs[:, node] = (rhs[:, node] - lower[:, node] * modified_rhs[:, node - 1]) / denominator
+
+    solution = np.empty_like(diagonal)
+    solution[:, -1] = modified_rhs[:, -1]
+
+    for node in range(nodes - 2, -1, -1):
+        solution[:, node] = modified_rhs[:, node] - modified_upper[:, node] * solution[:, node + 1]
+
+    return solution
+
+
+def node_materials(node_table, nodes):
+
+    """
+        This function returns the material of nodes of a NodeTable: the component with the
+    largest share of the composition the row of the node was created with ('UO2' for {'UO2': 100}).
+
+    :param node_table: NodeTable
+    :param nodes: array of int
+    :return: array of str
+    """
+
+    sources = node_table.compositions.sources
+    row_materials = {row: max(sources[row], key=sources[row].get) if sources[row] else ''
+                     for row in np.unique(node_table.composition[nodes]).tolist()}
+
+    return np.array([row_materials[row] for row in node_table.composition[nodes].tolist()], dtype=str)
+
+
+class RodConduction(object):
+
+    """
+        This class solves the radial heat conduction of many fuel rods together.
+
+    Attributes:
+        - rods: an int of the number of rods
+        - offsets: the offsets of the fuel nodes of each rod in the flat node arrays
+        - nodes: an array of the rows of the NodeTable of the fuel nodes (None unless created by from_table)
+        - materials: a tuple of the materials of the fuel nodes (None if they are all of fuel_conductivity)
+        - clad_nodes: an int of the number of cladding nodes of each rod
+        - gap_conductance: the gap conductance in W/m2-K
+        - length: the length of the rods (axial node height) in m
+    """
+
+    def __init__(self, node_inner_radii, node_outer_radii, offsets, clad_inner_radius, clad_outer_radius, *,
+                 clad_nodes=2, fuel_conductivity=uo2_conductivity, clad_conductivity=zircaloy_conductivity,
+                 gap_conductance=5000.0, length=1.0, materials=None, conductivities=None):
+
+        """
+            Initializes the RodConduction object, laying out the (padded) systems of all rods.
+
+        :param node_inner_radii: flat array of the inner radii of the fuel nodes of every rod
+        :param node_outer_radii: flat array of the outer radii of the fuel nodes of every rod
+        :param offsets: array, the fuel nodes of rod i are offsets[i]:offsets[i + 1]
+        :param clad_inner_radius: float or array (one per rod), as in HollowRod
+        :param clad_outer_radius: float or array (one per rod), as in HollowRod
+        :param clad_nodes: int
+        :param fuel_conductivity: function(temperature) in W/m-K of every fuel node (without materials)
+        :param clad_conductivity: function(temperature) in W/m-K
+        :param gap_conductance: float or array (one per rod) in W/m2-K
+        :param length: float or array (one per rod) in m
+        :param materials: flat array of the material of every fuel node (None: all of fuel_conductivity)
+        :param conductivities: dictionary of function(temperature) in W/m-K by material (defaults to
+                               fuel_conductivities)
+        """
+
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.rods = self.offsets.size - 1
+        self.nodes = None
+        self.clad_nodes = clad_nodes
+        self.fuel_conductivity = fuel_conductivity
+        self.clad_conductivity = clad_conductivity
+        self.gap_conductance = np.broadcast_to(np.asarray(gap_conductance, dtype=np.float64), (self.rods, ))
+        self.length = np.broadcast_to(np.asarray(length, dtype=np.float64), (self.rods, ))
+
+        node_inner_radii = np.asarray(node_inner_radii, dtype=np.float64)
+        node_outer_radii = np.asarray(node_outer_radii, dtype=np.float64)
+
+        self.clad_inner_radius = np.broadcast_to(np.asarray(clad_inner_radius, dtype=np.float64), (self.rods, ))
+        self.clad_outer_radius = np.broadcast_to(np.asarray(clad_outer_radius, dtype=np.float64), (self.rods, ))
+
+        fuel_nodes = np.diff(self.offsets)
+        self.fuel_columns = int(fuel_nodes.max())
+        self.columns = self.fuel_columns + clad_nodes
+
+        # fuel nodes are right-aligned, so that the cladding is in the same columns for all rods
+        rod_of_node = np.repeat(np.arange(self.rods), fuel_nodes)
+        self.fuel_column = np.arange(self.offsets[-1]) - self.offsets[rod_of_node] \
+            + (self.fuel_columns - fuel_nodes)[rod_of_node]
+        self.fuel_row = rod_of_node
+
+        inner = np.zeros((self.rods, self.columns))
+        outer = np.zeros((self.rods, self.columns))
+        inner[self.fuel_row, self.fuel_column] = node_inner_radii
+        outer[self.fuel_row, self.fuel_column] = node_outer_radii
+
+        clad_inner, clad_outer, _ = nodalize_batch(self.clad_outer_radius, np.full(self.rods, clad_nodes),
+                                                   equal_thickness, inner_radii=self.clad_inner_radius)
+        inner[:, self.fuel_columns:] = clad_inner.reshape(self.rods, clad_nodes)
+        outer[:, self.fuel_columns:] = clad_outer.reshape(self.rods, clad_nodes)
+
+        self.real = outer > 0.0
+        self.fuel = np.zeros((self.rods, self.columns), dtype=bool)
+        self.fuel[self.fuel_row, self.fuel_column] = True
+
+        # the conductivity function of every fuel node, -1 for the cladding and dummy nodes
+        self.material = np.full((self.rods, self.columns), -1, dtype=np.int64)
+
+        if materials is None:
+            self.materials = None
+            self._conductivities = [fuel_conductivity]
+            self.material[self.fuel] = 0
+        else:
+            conductivities = fuel_conductivities if conductivities is None else conductivities
+            self.materials, material_index = np.unique(np.asarray(materials, dtype=str), return_inverse=True)
+            self.materials = tuple(self.materials.tolist())
+            unknown = [material for material in self.materials if material not in conductivities]
+
+            if unknown:
+                raise ValueError('no conductivity for the fuel materials {}'.format(unknown))
+
+            self._conductivities = [conductivities[material] for material in self.materials]
+            self.material[self.fuel_row, self.fuel_column] = material_index.ravel()
+
+        # the dummy nodes get an arbitrary shell, they are decoupled from the real nodes anyway
+        inner[~self.real] = 1.0
+        outer[~self.real] = 2.0
+
+        self.inner_radii = inner
+        self.outer_radii = outer
+        self.centre_radii = volume_averaged(outer, inner)
+
+        self.pellet_radius = outer[:, self.fuel_columns - 1]
+
+    @classmethod
+    def from_table(cls, node_table, clad_inner_radius, clad_outer_radius, **options):
+
+        """
+            This method creates the RodConduction of all rods of a NodeTable. The rows of the
+        table of the fuel nodes (in the order of the flat arrays of solve) are kept as nodes. Unless
+        a fuel_conductivity or materials are given, the material of every node is the main
+        component of its composition (see node_materials).
+
+        :param node_table: NodeTable
+        :param clad_inner_radius: float or array (one per rod)
+        :param clad_outer_radius: float or array (one per rod)
+        :return: RodConduction
+        """
+
+        starts, stops = node_table.rod_bounds()
+        offsets = np.append(0, np.cumsum(stops - starts))
+        nodes = np.flatnonzero(node_table.rod >= 0)
+
+        if 'materials' not in options and 'fuel_conductivity' not in options:
+            options['materials'] = node_materials(node_table, nodes)
+
+        conduction = cls(node_table.inner_radius[nodes], node_table.outer_radius[nodes], offsets,
+                         clad_inner_radius, clad_outer_radius, **options)
+        conduction.nodes = nodes
+
+        return conduction
+
+    @staticmethod
+    def _shell_resistance(outer_radius, inner_radius, conductivity, length):
+
+        """This function returns the thermal resistance (in K/W) of cylindrical shells"""
+
+        return np.log(outer_radius / inner_radius) / (2 * np.pi * conductivity * length)
+
+    def assemble(self, temperature, power, coolant_temperature, heat_transfer_coefficient):
+
+        """
+            This method assembles the tridiagonal systems of all rods at given temperatures
+        (used for the conductivities).
+
+        :param temperature: 2D array of the (padded) node temperatures in K
+        :param power: 2D array of the (padded) node powers in W
+        :param coolant_temperature: array of the coolant temperature of every rod in K
+        :param heat_transfer_coefficient: array of the heat transfer coefficient of every rod in W/m2-K
+        :return: lower, diagonal, upper, rhs
+        """
+
+        conductivity = self.clad_conductivity(temperature)
+
+        for material, function in enumerate(self._conductivities):
+            nodes = self.material == material
+            conductivity[nodes] = function(temperature[nodes])
+
+        length = self.length[:, np.newaxis]
+
+        # resistances from the centre of each node to its faces (the inner half of a central
+        # node, of inner radius 0, is never used)
+        outward = self._shell_resistance(self.outer_radii, self.centre_radii, conductivity, length)
+        inward = self._shell_resistance(self.centre_radii, np.where(self.inner_radii > 0, self.inner_radii,
+                                                                    self.centre_radii), conductivity, length)
+
+        resistance = outward[:, :-1] + inward[:, 1:]
+        resistance[:, self.fuel_columns - 1] += 1 / (self.gap_conductance * 2 * np.pi * self.pellet_radius
+                                                     * self.length)
+
+        coupled = self.real[:, :-1] & self.real[:, 1:]
+        conductance = np.where(coupled, 1 / np.where(coupled, resistance, 1.0), 0.0)
+
+        film = 1 / (outward[:, -1] + 1 / (heat_transfer_coefficient * 2 * np.pi * self.clad_outer_radius * self.length))
+
+        lower = np.zeros((self.rods, self.columns))
+        upper = np.zeros((self.rods, self.columns))
+        lower[:, 1:] = -conductance
+        upper[:, :-1] = -conductance
+
+        diagonal = np.zeros((self.rods, self.columns))
+        diagonal[:, 1:] += conductance
+        diagonal[:, :-1] += conductance
+        diagonal[:, -1] += film
+        diagonal[~self.real] = 1.0
+
+        rhs = np.where(self.real, power, 0.0)
+        rhs[:, -1] += film * coolant_temperature
+
+        return lower, diagonal, upper, rhs
+
+    def solve(self, power, coolant_temperature, heat_transfer_coefficient, *,
+              temperature=None, tolerance=0.1, max_iterations=20):
+
+        """
+            This method solves the temperatures of all rods.
+
+        :param power: flat array of the power of every fuel node in W
+        :param coolant_temperature: float or array (one per rod) in K
+        :param heat_transfer_coefficient: float or array (one per rod) in W/m2-K
+        :param temperature: flat array of the initial guess of the fuel node temperatures in K
+        :param tolerance: float, maximum temperature change in K between conductivity updates
+        :param max_iterations: int
+        :return: flat array of the fuel node temperatures, and arrays of the cladding inner and
+                 outer temperatures of every rod
+        """
+
+        coolant_temperature = np.broadcast_to(np.asarray(coolant_temperature, dtype=np.float64), (self.rods, ))
+        heat_transfer_coefficient = np.broadcast_to(np.asarray(heat_transfer_coefficient, dtype=np.float64),
+                                                    (self.rods, ))
+
+        padded_power = np.zeros((self.rods, self.columns))
+        padded_power[self.fuel_row, self.fuel_column] = power
+
+        padded_temperature = np.repeat(coolant_temperature[:, np.newaxis], self.columns, axis=1)
+
+        if temperature is not None:
+            padded_temperature[self.fuel_row, self.fuel_column] = temperature
+
+        for _ in range(max_iterations):
+            solution = thomas(*self.assemble(padded_temperature, padded_power,
+                                             coolant_temperature, heat_transfer_coefficient))
+            change = np.max(np.abs(solution - padded_temperature)[self.real], initial=0.0)
+            padded_temperature = np.where(self.real, solution, padded_temperature)
+
+            if change <= tolerance:
+                break
+
+        rod_power = padded_power.sum(axis=1)
+        film_resistance = 1 / (heat_transfer_coefficient * 2 * np.pi * self.clad_outer_radius * self.length)
+
+        clad_outer_temperature = coolant_temperature + rod_power * film_resistance
+
+        first_clad = padded_temperature[:, self.fuel_columns]
+        clad_inward = self._shell_resistance(self.centre_radii[:, self.fuel_columns], self.clad_inner_radius,
+                                             self.clad_conductivity(first_clad), self.length)
+        clad_inner_temperature = first_clad + rod_power * clad_inward
+
+        return padded_temperature[self.fuel_row, self.fuel_column], clad_inner_temperature, clad_outer_temperature
@@ -0,0 +1,246 @@
+"""
+    This module is responsible for the full 3D state of a core: every rod, every axial level and
+every radial node, seen as (rod, axial, radial) arrays.
+
+    Rods with fewer radial nodes than others are padded (the mask tells the real nodes). A state
+either has arrays of its own, laid out in memory axial level by axial level so that the (rod,
+radial) slice of a level is contiguous, or is a view of the NodeTable of a geometry, which it
+never copies. The thermal-hydraulics and conduction solvers march from the bottom of the core to
+its top through the sweep generator, which yields 1 level at a time and never creates
+temporaries of the whole core: levels are views of the arrays where possible, and otherwise
+(rods chosen by an index array, or a NodeTable whose rods do not form a regular (rod, axial,
+radial) grid) they are gathered, and written back once the next level is requested. The
+floating point type of a state with arrays of its own can be reduced (float32) for the fields
+where precision allows it, to fit the full core in the memory of 1 machine.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from layering import axialize
+
+axial_level = namedtuple('axial_level', ['index', 'bottom', 'top', 'fields'])
+
+
+class CoreState(object):
+
+    """
+        This class stores (or looks into) the 3D state of a core.
+
+    Attributes:
+        - rods / axial_nodes / radial_nodes: ints of the size of each dimension
+        - bottoms / tops: arrays of the bottom and top of every axial level in m
+        - mask: a (rods x radial) array, True for the real radial nodes of each rod
+        - fields: a dictionary of (rod, axial, radial) arrays by name (empty for a view of a NodeTable)
+        - node_table: the NodeTable the state is a view of (None for a state with arrays of its own)
+    """
+
+    float_fields = ('inner_radius', 'outer_radius', 'temperature', 'density', 'power')
+
+    def __init__(self, rods, axial_nodes, radial_nodes, height, *, dtype=np.float64, mask=None):
+
+        """
+            Initializes the CoreState object and allocates its fields (all 0).
+
+        :param rods: int
+        :param axial_nodes: int
+        :param radial_nodes: int, maximum number of radial nodes of a rod
+        :param height: float, active height of the rods in m
+        :param dtype: floating point type of temperature, density and power
+        :param mask: (rods x radial) array of bool (defaults to all nodes real)
+        """
+
+        self.rods = rods
+        self.axial_nodes = axial_nodes
+        self.radial_nodes = radial_nodes
+        self.bottoms, self.tops = axialize(height, axial_nodes)
+        self.mask = np.ones((rods, radial_nodes), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+        self.node_table = None
+        self._starts = None  # first NodeTable row of every (rod, axial level) of a view
+        self._steps = None  # NodeTable rows between rods and between levels, if they form a regular grid
+
+        self.fields = {}
+
+        for field in self.float_fields:
+            self.fields[field] = self._allocate(np.float64 if field.endswith('radius') else dtype)
+
+        self.fields['composition'] = self._allocate(np.int32)
+
+    def _allocate(self, dtype):
+
+        """This method returns a zero (rod, axial, radial) array stored axial level by axial level"""
+
+        return np.zeros((self.axial_nodes, self.rods, self.radial_nodes), dtype=dtype).transpose(1, 0, 2)
+
+    @property
+    def field_names(self):
+        return self.float_fields + ('composition', )
+
+    def _array(self, field):
+
+        """This method returns the (rod, axial, radial) array of a field, or None if it cannot be a view"""
+
+        if self.node_table is None:
+            return self.fields[field]
+
+        if self._steps is None:
+            return None
+
+        column = getattr(self.node_table, field)[self._starts[0, 0]:]
+        rod_step, level_step = self._steps
+        item = column.itemsize
+
+        return np.lib.stride_tricks.as_strided(column, (self.rods, self.axial_nodes, self.radial_nodes),
+                                               (rod_step * item, level_step * item, item), writeable=True)
+
+    def __getitem__(self, field):
+
+        array = self._array(field)
+
+        if array is None:
+            raise ValueError('the rods of the NodeTable do not form a regular grid: sweep the state instead')
+
+        return array
+
+    @property
+    def nbytes(self):
+
+        """This property is the number of bytes held by the state (not the NodeTable it is a view of)"""
+
+        extra = 0 if self._starts is None else self._starts.nbytes
+
+        return sum(array.nbytes for array in self.fields.values()) + self.mask.nbytes + extra
+
+    @classmethod
+    def from_geometry(cls, geometry, height):
+
+        """
+            This method creates the CoreState of an ExpandedGeometry: 1 rod per cell, looking
+        into the node state of every (cell, axial level) in its node_table (which must be
+        materialized). Nothing is copied: the state is a view of the node_table.
+
+        :param geometry: ExpandedGeometry
+        :param height: float, active height of the rods in m
+        :return: CoreState
+        """
+
+        table = geometry.node_table
+        cell_rods = geometry.cell_rods
+
+        if np.any(cell_rods < 0):
+            raise ValueError('the geometry must be materialized')
+
+        starts, stops = table.rod_bounds()
+        counts = (stops - starts)[cell_rods]
+
+        radial_nodes = int(counts.max())
+        mask = np.arange(radial_nodes)[np.newaxis, :] < counts[:, 0, np.newaxis]
+
+        state = cls.__new__(cls)
+        state.rods, state.axial_nodes = cell_rods.shape
+        state.radial_nodes = radial_nodes
+        state.bottoms, state.tops = axialize(height, state.axial_nodes)
+        state.mask = mask
+        state.fields = {}
+        state.node_table = table
+        state._starts = starts[cell_rods]
+        state._steps = None
+
+        # node (rod, axial, radial) is row starts[rod, axial] + radial: a strided view if that is affine
+        first = state._starts
+        rod_step = int(first[1, 0] - first[0, 0]) if state.rods > 1 else 0
+        level_step = int(first[0, 1] - first[0, 0]) if state.axial_nodes > 1 else 0
+
+        if np.all(counts == radial_nodes) and rod_step >= 0 and level_step >= 0 and np.array_equal(
+                first, first[0, 0] + rod_step * np.arange(state.rods)[:, np.newaxis]
+                + level_step * np.arange(state.axial_nodes)):
+            state._steps = rod_step, level_step
+
+        return state
+
+    def _gather(self, field, rods, level):
+
+        """This method returns the (rod, radial) array of a field at a level"""
+
+        array = self._array(field)
+
+        if array is not None:
+            return array[rods, level]
+
+        column = getattr(self.node_table, field)
+        rows = self._starts[rods, level][:, np.newaxis] + np.arange(self.radial_nodes)
+        real = self.mask[rods]
+
+        values = np.zeros(rows.shape, dtype=column.dtype)
+        values[real] = column[rows[real]]
+
+        return values
+
+    def _scatter(self, field, rods, level, values):
+
+        """This method writes back the (rod, radial) array of a field at a level returned by _gather"""
+
+        array = self._array(field)
+
+        if array is not None:
+            array[rods, level] = values
+            return
+
+        rows = self._starts[rods, level][:, np.newaxis] + np.arange(self.radial_nodes)
+        real = self.mask[rods]
+
+        getattr(self.node_table, field)[rows[real]] = values[real]
+
+    def sweep(self, fields=None, *, rods=slice(None), reverse=False):
+
+        """
+            This generator yields the axial levels of the core from the bottom to the top (or from
+        the top to the bottom with reverse). The fields of each level are (rod, radial) arrays:
+        changing them changes the state (levels that are not views are written back when the next
+        level is requested or the generator is closed), and nothing of the size of the core is
+        allocated.
+
+        :param fields: tuple of the names of the fields (defaults to all fields)
+        :param rods: slice (or index array) of the rods swept
+        :param reverse: bool
+        :return: generator of axial_level
+        """
+
+        fields = self.field_names if fields is None else tuple(fields)
+        levels = range(self.axial_nodes - 1, -1, -1) if reverse else range(self.axial_nodes)
+        rods = rods if isinstance(rods, slice) else np.asarray(rods)
+        gathered = {field: not isinstance(rods, slice) or self._array(field) is None for field in fields}
+
+        for level in levels:
+            arrays = {field: self._gather(field, rods, level) for field in fields}
+
+            try:
+                yield axial_level(level, self.bottoms[level], self.tops[level], arrays)
+            finally:
+                for field in fields:
+                    if gathered[field]:
+                        self._scatter(field, rods, level, arrays[field])
+
+    def march(self, step, initial, fields=None, *, rods=slice(None), reverse=False):
+
+        """
+            This method marches through the axial levels, carrying a value from each level to the
+        next (the coolant enthalpy of each rod, for example): carry = step(level, carry) for every
+        level from the bottom to the top.
+
+        :param step: function(axial_level, carry) returning the carry of the next level
+        :param initial: carry into the first level
+        :param fields: tuple of the names of the fields (defaults to all fields)
+        :param rods: slice (or index array) of the rods swept
+        :param reverse: bool
+        :return: carry out of the last level
+        """
+
+        carry = initial
+
+        for level in self.sweep(fields, rods=rods, reverse=reverse):
+            carry = step(level, carry)
+
+        return carry
@@ -0,0 +1,608 @@
+"""
+    This module is responsible for driving the coupling between the neutronics solver (wims11,
+monk...) and the thermal-hydraulics solver (cobraen...) as a Picard (fixed point) iteration:
+
+    - neutronics receives temperatures, densities and compositions and gives node powers;
+    - thermal-hydraulics receives node powers and gives temperatures and densities;
+
+until the power and temperature fields stop changing.
+
+    The solvers are external executables. Each one is described by an ExternalSolver: the
+command to run, a function that writes its input deck from arrays and a function that parses
+its output deck into arrays. The default deck format is a NumPy .npz file, which is what local
+stand-in solvers (used for testing) read and write.
+
+    Thermal-hydraulics is solved per block of rods on a process pool. Given the groups of rods
+coupled by their coolant (the assemblies, see assembly_rod_groups), blocks are made of whole
+groups, so that the flow between the channels of an assembly is never cut by a block boundary.
+Each worker writes its input deck, runs the solver and parses its output, so the deck I/O of a
+block overlaps with the solves of the other blocks, and results are gathered in the order they
+finish.
+
+    Every solve depends on the output of the other solver, but most of the neutronics deck
+does not: radii, compositions and number densities only change with depletion. That part of the
+next neutronics deck is written by a background thread while thermal-hydraulics runs, and only
+the temperatures and densities are added once they are known (decks in parts, see begin_deck).
+If the compositions change in between (depletion, for example), that deck is written again.
+
+    Decks are removed once their output is parsed, unless they are kept for inspection.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import os
+import subprocess
+import zipfile
+
+import numpy as np
+
+from instrumentation import instrumentation, timed
+from node_table import NodeTable
+
+
+def write_array_deck(path, arrays):
+
+    """
+        This function writes arrays to an input deck in the .npz format.
+
+    :param path: str
+    :param arrays: dictionary of arrays by name
+    """
+
+    with open(path, 'wb') as deck:
+        np.savez(deck, **arrays)
+
+
+def read_array_deck(path):
+
+    """
+        This function reads the arrays of an output deck in the .npz format.
+
+    :param path: str
+    :return: dictionary of arrays by name
+    """
+
+    with np.load(path) as deck:
+        return {name: deck[name] for name in deck.files}
+
+
+class ArrayDeck(object):
+
+    """
+        This class writes an input deck in the .npz format in parts: arrays are added as they are
+    known, and the deck is complete once it is closed (np.load reads it as any .npz file).
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self._zip = zipfile.ZipFile(path, 'w', allowZip64=True)
+
+    def add(self, arrays):
+
+        """This method writes arrays into the deck"""
+
+        for name, array in arrays.items():
+            with self._zip.open(name + '.npy', 'w', force_zip64=True) as member:
+                np.lib.format.write_array(member, np.asanyarray(array), allow_pickle=False)
+
+    def close(self):
+
+        self._zip.close()
+
+    def discard(self):
+
+        """This method drops a deck that will not be solved"""
+
+        self._zip.close()
+        os.remove(self.path)
+
+
+class _WholeDeck(object):
+
+    """This class keeps the parts of a deck of any other format, which is written at once when closed"""
+
+    def __init__(self, path, writer):
+
+        self.path = path
+        self.writer = writer
+        self.arrays = {}
+
+    def add(self, arrays):
+
+        self.arrays.update(arrays)
+
+    def close(self):
+
+        self.writer(self.path, self.arrays)
+
+    def discard(self):
+
+        self.arrays = {}
+
+
+class ExternalSolver(object):
+
+    """
+        This class describes an external solver executable.
+
+    Attributes:
+        - command: a list of str of the command line, where {input} and {output} are replaced by
+          the paths of the input and output decks
+        - writer: a function(path, arrays) writing an input deck
+        - reader: a function(path) returning a dictionary of arrays from an output deck
+        - extension: a str of the extension of the decks
+    """
+
+    def __init__(self, command, writer=write_array_deck, reader=read_array_deck, extension='.npz'):
+
+        self.command = list(command)
+        self.writer = writer
+        self.reader = reader
+        self.extension = extension
+
+    def paths(self, directory, name):
+
+        """This method returns the paths of the input and output decks of a solve"""
+
+        return (os.path.join(directory, name + '.in' + self.extension),
+                os.path.join(directory, name + '.out' + self.extension))
+
+    def begin_deck(self, directory, name, arrays):
+
+        """
+            This method starts the input deck of a solve with the arrays known in advance, so that
+        writing them can overlap with other work; solve(..., deck=...) adds the rest. Decks of
+        other formats than the default .npz cannot be written in parts: their arrays are kept and
+        written at once by solve.
+
+        :param directory: str, directory of the decks
+        :param name: str, name of the decks (without extension)
+        :param arrays: dictionary of arrays by name
+        :return: ArrayDeck or deck of another format
+        """
+
+        input_path, _ = self.paths(directory, name)
+
+        with instrumentation.timer('solver.write_deck', deck=name, part='begin'):
+            if self.writer is write_array_deck:
+                deck = ArrayDeck(input_path)
+            else:
+                deck = _WholeDeck(input_path, self.writer)
+
+            deck.add(arrays)
+
+        return deck
+
+    def solve(self, directory, name, arrays, *, deck=None, keep=True):
+
+        """
+            This method writes the input deck, runs the solver and parses its output deck.
+
+        :param directory: str, directory of the decks
+        :param name: str, name of the decks (without extension)
+        :param arrays: dictionary of arrays by name (the rest of them, with deck)
+        :param deck: deck started by begin_deck, if any
+        :param keep: bool, False removes both decks once the output is parsed
+        :return: dictionary of arrays by name
+        """
+
+        input_path, output_path = self.paths(directory, name)
+
+        with instrumentation.timer('solver.write_deck', deck=name):
+            if deck is None:
+                self.writer(input_path, arrays)
+            else:
+                deck.add(arrays)
+                deck.close()
+
+        with instrumentation.timer('solver.run', deck=name):
+            subprocess.run([argument.format(input=input_path, output=output_path) for argument in self.command],
+                           check=True, cwd=directory, stdout=subprocess.DEVNULL)
+
+        with instrumentation.timer('solver.read_deck', deck=name):
+            result = self.reader(output_path)
+
+        if not keep:
+            for path in (input_path, output_path):
+                os.remove(path)
+
+        return result
+
+
+def _solve_block(solver, directory, name, block, arrays, keep, instrumented):
+
+    """
+        This function solves one block on a worker process and returns the index of the block
+    with its results, the id of the process and the events of its timers (recorded if
+    instrumented, to be merged into the instrumentation of the parent process).
+    """
+
+    with instrumentation.recording(instrumented) as events:
+        result = solver.solve(directory, name, arrays, keep=keep)
+
+    return block, result, os.getpid(), events
+
+
+def rod_blocks(node_table, blocks, rod_groups=None):
+
+    """
+        This function partitions the rods of a NodeTable into blocks of about the same number of
+    rods, which thermal-hydraulics solves independently. Groups of rods (see assembly_rod_groups)
+    are never split between blocks, nor are rods. Nodes without a rod belong to no block.
+
+    :param node_table: NodeTable
+    :param blocks: int
+    :param rod_groups: array of the group of every rod (None makes every rod a group of its own)
+    :return: list of arrays of the nodes of every block
+    """
+
+    rods = node_table.rods
+    rod_groups = np.arange(rods) if rod_groups is None else np.asarray(rod_groups)
+
+    if rod_groups.shape != (rods, ):
+        raise ValueError('rod_groups must have 1 group per rod ({})'.format(rods))
+
+    _, rod_groups = np.unique(rod_groups, return_inverse=True)
+    rod_groups = rod_groups.reshape(rods)
+
+    # groups in the order of their first rod, each in the block of the fraction of rods before it
+    groups = int(rod_groups.max(initial=-1)) + 1
+    first_rods = np.full(groups, rods)
+    np.minimum.at(first_rods, rod_groups, np.arange(rods))
+    order = np.argsort(first_rods, kind='stable')
+
+    sizes = np.bincount(rod_groups, minlength=groups)[order]
+    count = max(min(blocks, groups), 1)
+    group_blocks = np.empty(groups, dtype=np.int64)
+    group_blocks[order] = (np.cumsum(sizes) - sizes) * count // max(rods, 1)
+
+    nodes = np.flatnonzero(node_table.rod >= 0)
+    node_blocks = group_blocks[rod_groups[node_table.rod[nodes]]]
+    order = np.argsort(node_blocks, kind='stable')
+    bounds = np.searchsorted(node_blocks[order], np.arange(1, count))
+
+    return [block for block in np.split(nodes[order], bounds) if block.size]
+
+
+def assembly_rod_groups(geometry, assembly_size):
+
+    """
+        This function returns the groups of the rods of an ExpandedGeometry for rod_blocks: the
+    rods of 1 assembly (at every axial level) are a group, since the coolant flows between their
+    channels. Assemblies sharing a rod (symmetric positions share rods) are 1 group.
+
+    :param geometry: ExpandedGeometry
+    :param assembly_size: int, rods of an assembly in each direction
+    :return: array of the group of every rod of the node_table
+    """
+
+    # imported here: every solver process that reads decks with this module would import scipy otherwise
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+
+    rows, columns = geometry.cell_index.shape
+    assemblies = (np.arange(rows) // assembly_size)[:, np.newaxis] * -(-columns // assembly_size) \
+        + np.arange(columns) // assembly_size
+
+    position_rods = geometry.position_rods()
+    stored = position_rods >= 0
+    rod_assemblies = np.broadcast_to(assemblies.reshape(-1, 1), position_rods.shape)[stored]
+
+    # rods and assemblies are the vertices of a graph whose edges join every rod to its assemblies
+    rods = geometry.node_table.rods
+    vertices = rods + int(assemblies.max(initial=-1)) + 1
+    graph = sparse.coo_matrix((np.ones(rod_assemblies.size), (position_rods[stored], rods + rod_assemblies)),
+                              shape=(vertices, vertices))
+
+    return connected_components(graph, directed=False)[1][:rods]
+
+
+class PicardDriver(object):
+
+    """
+        This class drives the coupled neutronics/thermal-hydraulics iterations of a core.
+
+    Attributes:
+        - table: the NodeTable of the core
+        - neutronics / thermal_hydraulics: ExternalSolver
+        - blocks: a list of the arrays of the nodes solved independently by thermal-hydraulics
+        - residuals: a list of (power residual, temperature residual) of every iteration
+        - geometry: the ExpandedGeometry of the table (None if unknown), saved in the checkpoints
+    """
+
+    def __init__(self, node_table, neutronics, thermal_hydraulics, directory, *,
+                 blocks=8, workers=None, total_power=None, begins_with='thermal-hydraulics',
+                 power_tolerance=1E-3, temperature_tolerance=0.5, relaxation=1.0, store=None,
+                 checkpoints=None, keep_decks=False, geometry=None, rod_groups=None):
+
+        """
+            Initializes the PicardDriver object.
+
+        :param node_table: NodeTable
+        :param neutronics: ExternalSolver
+        :param thermal_hydraulics: ExternalSolver
+        :param directory: str, working directory of the solver decks
+        :param blocks: int or list of arrays of the nodes of every block
+        :param workers: int, number of worker processes (defaults to the number of CPUs)
+        :param total_power: float, core power in W for the flat initial profile
+        :param begins_with: str, "thermal-hydraulics" or "neutronics"
+        :param power_tolerance: float, relative L2 norm of the power change to converge
+        :param temperature_tolerance: float, maximum temperature change in K to converge
+        :param relaxation: float, under-relaxation factor of the neutronics power
+        :param store: IterationStore, optional store of the past iterations
+        :param checkpoints: CheckpointWriter, optional writer of the checkpoints of the run
+        :param keep_decks: bool, True keeps the decks of every solve in directory
+        :param geometry: ExpandedGeometry (materialized) whose node_table is node_table
+        :param rod_groups: array of the group of every rod, kept in 1 block (see assembly_rod_groups)
+        """
+
+        if begins_with not in ('thermal-hydraulics', 'neutronics'):
+            raise ValueError('begins_with must be "thermal-hydraulics" or "neutronics"')
+
+        if geometry is not None and geometry.node_table is not node_table:
+            raise ValueError('the node_table of the geometry must be the node_table of the driver')
+
+        self.table = node_table
+        self.neutronics = neutronics
+        self.thermal_hydraulics = thermal_hydraulics
+        self.directory = directory
+        self.blocks = rod_blocks(node_table, blocks, rod_groups) if isinstance(blocks, int) \
+            else [np.asarray(block) for block in blocks]
+        self.workers = workers
+        self.total_power = total_power
+        self.begins_with = begins_with
+        self.power_tolerance = power_tolerance
+        self.temperature_tolerance = temperature_tolerance
+        self.relaxation = relaxation
+        self.store = store
+        self.checkpoints = checkpoints
+        self.keep_decks = keep_decks
+        self.geometry = geometry
+
+        self._deck = None  # the next neutronics deck, begun while thermal-hydraulics runs
+        self._deck_compositions = None  # the compositions the deck was begun with (see _compositions)
+
+        self.iteration = 0
+        self.residuals = []
+
+        os.makedirs(directory, exist_ok=True)
+
+    def flat_power(self):
+
+        """
+            This method sets the flat initial power profile: the total power split between the
+        fuel nodes in proportion to their volume (for equal-length axial nodes, a channel of
+        power X and Y nodes gets X/Y per node).
+        """
+
+        if self.total_power is None:
+            raise ValueError('total_power is needed to begin with thermal-hydraulics')
+
+        volume = np.where(self.table.rod >= 0, self.table.volume(), 0.0)
+        self.table.power[:] = self.total_power * volume / volume.sum()
+
+    def _state(self):
+
+        """This method returns the arrays where the next state is written"""
+
+        if self.store is None:
+            return {field: getattr(self.table, field) for field in ('power', 'temperature', 'density')}
+
+        return self.store.next
+
+    def _begin_neutronics(self):
+
+        """
+            This method starts the deck of the next neutronics solve with the arrays that
+        thermal-hydraulics does not change, and returns it.
+
+        :return: ArrayDeck or deck of another format
+        """
+
+        iteration = self.iteration + (self.begins_with == 'neutronics')
+        compositions = self.table.compositions
+        self._deck_compositions = self._compositions()
+
+        return self.neutronics.begin_deck(self.directory, 'neutronics_{:04d}'.format(iteration), {
+            'inner_radius': self.table.inner_radius, 'outer_radius': self.table.outer_radius,
+            'composition': self.table.composition, 'rod': self.table.rod,
+            'number_densities': compositions.number_densities,
+            'reference_density': compositions.reference_density})
+
+    def _compositions(self):
+
+        """
+            This method returns what a neutronics deck takes from the compositions: the
+        CompositionTable, the versions of its rows and the row of every node.
+        """
+
+        compositions = self.table.compositions
+
+        return compositions, compositions.versions.copy(), self.table.composition.copy()
+
+    def _deck_is_current(self):
+
+        """This method tells whether the compositions did not change since the neutronics deck was begun"""
+
+        compositions, versions, rows = self._deck_compositions
+
+        return compositions is self.table.compositions and np.array_equal(versions, compositions.versions) \
+            and np.array_equal(rows, self.table.composition)
+
+    def _discard_deck(self):
+
+        """This method drops the neutronics deck begun for an iteration that will not run"""
+
+        if self._deck is not None:
+            self._deck.discard()
+            self._deck = None
+
+    @timed('coupling.neutronics')
+    def solve_neutronics(self, state):
+
+        """This method runs the neutronics solver and updates the (relaxed) power in state"""
+
+        deck, self._deck = self._deck, None
+        name = 'neutronics_{:04d}'.format(self.iteration)
+
+        if deck is not None and not self._deck_is_current():
+            # the compositions changed (by depletion, for example) since the deck was begun
+            deck.discard()
+            deck = None
+
+        arrays = {'temperature': state['temperature'], 'density': state['density']}
+
+        if deck is None:
+            compositions = self.table.compositions
+            arrays.update({'inner_radius': self.table.inner_radius, 'outer_radius': self.table.outer_radius,
+                           'composition': self.table.composition, 'rod': self.table.rod,
+                           'number_densities': compositions.number_densities,
+                           'reference_density': compositions.reference_density})
+
+        result = self.neutronics.solve(self.directory, name, arrays, deck=deck, keep=self.keep_decks)
+
+        power = state['power']
+        power *= 1.0 - self.relaxation
+        power += self.relaxation * result['power']
+
+    @timed('coupling.thermal_hydraulics')
+    def solve_thermal_hydraulics(self, state, pool):
+
+        """
+            This method runs the thermal-hydraulics solver of every block on the pool, while a
+        thread begins the deck of the next neutronics solve.
+        """
+
+        jobs = [pool.submit(_solve_block, self.thermal_hydraulics, self.directory,
+                            'thermal_hydraulics_{:04d}_{:04d}'.format(self.iteration, index), index,
+                            {'power': state['power'][nodes], 'rod': self.table.rod[nodes],
+                             'inner_radius': self.table.inner_radius[nodes],
+                             'outer_radius': self.table.outer_radius[nodes],
+                             'temperature': state['temperature'][nodes],
+                             'density': state['density'][nodes]}, self.keep_decks,
+                            instrumentation.enabled)
+                for index, nodes in enumerate(self.blocks)]
+
+        self._discard_deck()
+
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            deck = writer.submit(self._begin_neutronics)
+
+            for job in as_completed(jobs):
+                block, result, worker, events = job.result()
+                instrumentation.merge(events, worker)
+                nodes = self.blocks[block]
+                state['temperature'][nodes] = result['temperature']
+                state['density'][nodes] = result['density']
+
+            self._deck = deck.result()
+
+    @timed('coupling.iteration')
+    def iterate(self, pool):
+
+        """
+            This method runs one coupled iteration and returns its residuals: the relative L2
+        norm of the power change and the maximum temperature change (in K).
+
+        :param pool: ProcessPoolExecutor
+        :return: float, float
+        """
+
+        previous_power = self.table.power.copy()
+        previous_temperature = self.table.temperature.copy()
+
+        state = self._state()
+
+        if self.begins_with == 'thermal-hydraulics':
+            self.solve_thermal_hydraulics(state, pool)
+            self.solve_neutronics(state)
+        else:
+            self.solve_neutronics(state)
+            self.solve_thermal_hydraulics(state, pool)
+
+        power_norm = np.linalg.norm(state['power'])
+        power_residual = np.linalg.norm(state['power'] - previous_power) / (power_norm if power_norm else 1.0)
+        temperature_residual = float(np.max(np.abs(state['temperature'] - previous_temperature), initial=0.0))
+
+        if self.store is not None:
+            self.store.advance()
+
+        self.iteration += 1
+        instrumentation.next_iteration()
+        self.residuals.append((float(power_residual), temperature_residual))
+
+        if self.checkpoints is not None:
+            metadata = {'residuals': self.residuals}
+
+            if self.store is not None:
+                metadata['store_iteration'] = self.store.iteration
+
+            self.checkpoints.save(self.table if self.geometry is None else self.geometry, self.iteration, metadata)
+
+        return self.residuals[-1]
+
+    def resume(self, checkpoint):
+
+        """
+            This method continues the iterations of a run from a checkpoint of the same core: the
+        node state of the checkpoint is copied into the table of this driver (so the geometry and
+        the views of the table stay valid), its compositions are copied into the composition table
+        (so caches keyed on its rows see them as changed), and the iteration counters of the driver
+        and of the store are restored.
+
+        :param checkpoint: Checkpoint
+        """
+
+        restored = checkpoint.node_table()
+
+        if len(restored) != len(self.table):
+            raise ValueError('the checkpoint has {} nodes, the table has {}'.format(len(restored), len(self.table)))
+
+        for field in NodeTable.float_fields + NodeTable.index_fields:
+            np.copyto(getattr(self.table, field), getattr(restored, field))
+
+        self.table.elements = restored.elements
+        self.table.rods = restored.rods
+        self.table.compositions.assign(restored.compositions)
+
+        self.iteration = checkpoint.iteration
+        self.residuals = [tuple(residuals) for residuals in checkpoint.metadata.get('residuals', [])]
+
+        if self.store is not None:
+            self.store.resume(checkpoint.metadata.get('store_iteration', checkpoint.iteration))
+
+    def converged(self):
+
+        """This method tells whether the last iteration is within both tolerances"""
+
+        if not self.residuals:
+            return False
+
+        power_residual, temperature_residual = self.residuals[-1]
+
+        return power_residual <= self.power_tolerance and temperature_residual <= self.temperature_tolerance
+
+    def run(self, max_iterations=50):
+
+        """
+            This method iterates until convergence (or max_iterations) and returns whether it
+        converged.
+
+        :param max_iterations: int
+        :return: bool
+        """
+
+        if self.begins_with == 'thermal-hydraulics' and not np.any(self.table.power):
+            self.flat_power()
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for _ in range(max_iterations):
+                    self.iterate(pool)
+
+                    if self.converged():
+                        return True
+        finally:
+            self._discard_deck()
+
+        return False
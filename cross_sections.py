@@ -0,0 +1,258 @@
+"""
+    This module is responsible for caching the cross sections of the nodes of a core.
+
+    Cross sections are generated (or loaded from the library, jeff3.12 for example) only at the
+points of a temperature grid and of a density grid, for each composition of the composition
+table. The cross sections of a node are then interpolated from the 4 grid points around its
+temperature and density: linearly in the square root of the temperature (the usual Doppler
+broadening interpolation) and linearly in density. The interpolation is vectorized over all
+nodes of the core.
+
+    Grid point cross sections are kept in an LRU cache with a memory budget, and the cross
+sections of every node are kept from one iteration to the next, so that a node is only
+interpolated again when its temperature or density leaves a tolerance band around the values
+it was last interpolated at (or its composition changes).
+
+    Grid points and nodes are keyed on composition rows, whose content changes in place with
+depletion. Given the CompositionTable, the cache compares the versions of its rows at every
+update and drops what was computed for rows that changed since; otherwise, whoever changes rows
+calls invalidate.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class CrossSectionCache(object):
+
+    """
+        This class caches grid point cross sections and interpolates them for every node.
+
+    Attributes:
+        - loader: a function(composition, temperature, density) returning the cross sections of
+          a composition row at a grid point, as an array (of any shape, the same for every call)
+        - temperature_grid: an array of the grid temperatures in K
+        - density_grid: an array of the grid densities in kg/m3
+        - memory_budget: an int of the maximum number of bytes of grid point cross sections
+        - composition_table: the CompositionTable of the rows (optional, see invalidate)
+        - temperature_tolerance / density_tolerance: floats of the tolerance bands of the nodes
+        - hits / misses: int counts of grid point lookups found and not found in the cache
+        - evictions: an int count of grid points evicted to respect the memory budget
+        - refreshed: an int count of node interpolations
+    """
+
+    def __init__(self, loader, temperature_grid, density_grid, *, memory_budget=2 ** 30,
+                 temperature_tolerance=5.0, density_tolerance=1.0, composition_table=None):
+
+        self.loader = loader
+        self.temperature_grid = np.asarray(temperature_grid, dtype=np.float64)
+        self.density_grid = np.asarray(density_grid, dtype=np.float64)
+        self.memory_budget = memory_budget
+        self.temperature_tolerance = temperature_tolerance
+        self.density_tolerance = density_tolerance
+        self.composition_table = composition_table
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshed = 0
+        self.memory = 0
+
+        self._sqrt_temperature_grid = np.sqrt(self.temperature_grid)
+        self._points = OrderedDict()
+
+        # state of the nodes at their last interpolation
+        self._compositions = None
+        self._temperatures = None
+        self._densities = None
+        self._cross_sections = None
+        self._versions = None  # versions of the rows of composition_table at the last update
+
+    def statistics(self):
+
+        """This method returns a dictionary of the counters, for tuning the grids and budget"""
+
+        lookups = self.hits + self.misses
+
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'refreshed': self.refreshed,
+                'grid_points': len(self._points), 'memory': self.memory}
+
+    def _point(self, key):
+
+        """This method returns the cross sections of a grid point, loading it on a miss"""
+
+        try:
+            cross_sections = self._points[key]
+        except KeyError:
+            self.misses += 1
+
+            composition, temperature_index, density_index = key
+            cross_sections = np.asarray(self.loader(composition, self.temperature_grid[temperature_index],
+                                                    self.density_grid[density_index]), dtype=np.float64)
+
+            self._points[key] = cross_sections
+            self.memory += cross_sections.nbytes
+
+            return cross_sections
+
+        self.hits += 1
+        self._points.move_to_end(key)
+
+        return cross_sections
+
+    def _evict(self):
+
+        """This method evicts least recently used grid points until the budget is respected"""
+
+        while self.memory > self.memory_budget and self._points:
+            _, cross_sections = self._points.popitem(last=False)
+            self.memory -= cross_sections.nbytes
+            self.evictions += 1
+
+    def invalidate(self, rows):
+
+        """
+            This method drops the grid points of composition rows whose content changed, and
+        marks the nodes of those rows for interpolation at the next update.
+
+        :param rows: array of int
+        """
+
+        rows = set(np.asarray(rows, dtype=np.int64).ravel().tolist())
+
+        if not rows:
+            return
+
+        for key in [key for key in self._points if key[0] in rows]:
+            self.memory -= self._points.pop(key).nbytes
+
+        if self._compositions is not None:
+            self._compositions[np.isin(self._compositions, list(rows))] = -1
+
+    def _check_versions(self):
+
+        """This method invalidates the rows of composition_table whose version changed since the last update"""
+
+        versions = self.composition_table.versions
+
+        if self._versions is not None:
+            known = min(versions.size, self._versions.size)
+            self.invalidate(np.flatnonzero(versions[:known] != self._versions[:known]))
+
+        self._versions = versions.copy()
+
+    @staticmethod
+    def _bracket(grid, values):
+
+        """This method returns the lower grid index and interpolation weight of each value"""
+
+        if grid.size == 1:
+            return np.zeros(values.size, dtype=np.int64), np.zeros(values.size)
+
+        lower = np.clip(np.searchsorted(grid, values, side='right') - 1, 0, grid.size - 2)
+        weight = np.clip((values - grid[lower]) / (grid[lower + 1] - grid[lower]), 0.0, 1.0)
+
+        return lower, weight
+
+    def interpolate(self, compositions, temperatures, densities):
+
+        """
+            This method interpolates the cross sections of many nodes at once.
+
+        :param compositions: array of int, composition rows of the nodes
+        :param temperatures: array of float, in K
+        :param densities: array of float, in kg/m3
+        :return: array of cross sections with one row per node
+        """
+
+        compositions = np.asarray(compositions, dtype=np.int64)
+
+        temperature_lower, temperature_weight = self._bracket(self._sqrt_temperature_grid,
+                                                              np.sqrt(np.asarray(temperatures, dtype=np.float64)))
+        density_lower, density_weight = self._bracket(self.density_grid, np.asarray(densities, dtype=np.float64))
+
+        temperature_upper = np.minimum(temperature_lower + 1, self.temperature_grid.size - 1)
+        density_upper = np.minimum(density_lower + 1, self.density_grid.size - 1)
+
+        corners = [(temperature_lower, density_lower, (1 - temperature_weight) * (1 - density_weight)),
+                   (temperature_upper, density_lower, temperature_weight * (1 - density_weight)),
+                   (temperature_lower, density_upper, (1 - temperature_weight) * density_weight),
+                   (temperature_upper, density_upper, temperature_weight * density_weight)]
+
+        # every grid point needed by any node is fetched once, then gathered for all nodes
+        temperatures_in_grid = self.temperature_grid.size
+        densities_in_grid = self.density_grid.size
+
+        keys = np.concatenate([(compositions * temperatures_in_grid + temperature_index) * densities_in_grid
+                               + density_index for temperature_index, density_index, _ in corners])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(len(corners), compositions.size)
+
+        points = [self._point((key // (temperatures_in_grid * densities_in_grid),
+                               key // densities_in_grid % temperatures_in_grid,
+                               key % densities_in_grid)) for key in unique_keys.tolist()]
+        self._evict()
+
+        points = np.stack(points).reshape(len(points), -1) if points else np.zeros((0, 0))
+        cross_sections = np.zeros((compositions.size, points.shape[1]))
+
+        for (_, _, weight), corner in zip(corners, inverse):
+            cross_sections += weight[:, np.newaxis] * points[corner]
+
+        return cross_sections
+
+    def update(self, compositions, temperatures, densities, candidates=None):
+
+        """
+            This method returns the cross sections of every node of the core, interpolating
+        again only the nodes whose composition changed (or was invalidated) or whose temperature
+        or density left the tolerance band since their last interpolation. When the nodes that may
+        have changed are known (the dirty nodes of a ChangeTracker), only those are checked.
+
+        :param compositions: array of int, composition rows of the nodes
+        :param temperatures: array of float, in K
+        :param densities: array of float, in kg/m3
+        :param candidates: array of the only nodes that may have changed (defaults to all nodes)
+        :return: array of cross sections with one row per node
+        """
+
+        compositions = np.asarray(compositions, dtype=np.int64)
+        temperatures = np.asarray(temperatures, dtype=np.float64)
+        densities = np.asarray(densities, dtype=np.float64)
+
+        if self.composition_table is not None:
+            self._check_versions()
+
+        if self._cross_sections is None or self._compositions.shape != compositions.shape:
+            stale = np.arange(compositions.size)
+            self._cross_sections = None
+        elif candidates is None:
+            stale = np.flatnonzero((self._compositions != compositions)
+                                   | (np.abs(self._temperatures - temperatures) > self.temperature_tolerance)
+                                   | (np.abs(self._densities - densities) > self.density_tolerance))
+        else:
+            candidates = np.asarray(candidates, dtype=np.int64)
+            stale = candidates[(self._compositions[candidates] != compositions[candidates])
+                               | (np.abs(self._temperatures[candidates] - temperatures[candidates])
+                                  > self.temperature_tolerance)
+                               | (np.abs(self._densities[candidates] - densities[candidates]) > self.density_tolerance)]
+            # nodes of invalidated rows are stale even if they are not candidates
+            stale = np.union1d(stale, np.flatnonzero(self._compositions < 0))
+
+        if self._cross_sections is None:
+            self._cross_sections = self.interpolate(compositions, temperatures, densities)
+            self._compositions = compositions.copy()
+            self._temperatures = temperatures.copy()
+            self._densities = densities.copy()
+        elif stale.size:
+            self._cross_sections[stale] = self.interpolate(compositions[stale], temperatures[stale],
+                                                           densities[stale])
+            self._compositions[stale] = compositions[stale]
+            self._temperatures[stale] = temperatures[stale]
+            self._densities[stale] = densities[stale]
+
+        self.refreshed += stale.size
+
+        return self._cross_sections
@@ -0,0 +1,291 @@
+"""
+    This module is responsible for the burnup (depletion) of the nodes of a core.
+
+    Over a time step the nuclide vector n of a node follows dn/dt = A n, where the burnup matrix
+A = D + flux * R is made of the decay matrix D of the chain and the one-group reaction rates R
+of the node (cross sections of its cross-section set times the transmutation pattern of each
+reaction). The solution n(t) = exp(A t) n(0) is computed with the Chebyshev Rational
+Approximation Method of order 16 (CRAM, in the incomplete partial fraction form of Pusa).
+
+    The flux of every node comes from its power (RadialNode.power), its fission rate and its
+volume. Nodes with the same burnup matrix (same cross-section set and flux, for example nodes
+with no power, or nodes grouped by a flux tolerance) share 1 propagator exp(A t), which is
+computed once; propagators are computed, and applied to the nodes, in batches of dense
+matrices, never node by node.
+
+    Depleted nodes get composition rows of their own in the composition table (copy-on-write),
+since with burnup their compositions diverge. Those rows are rewritten in place, and marked as
+modified for the caches keyed on rows (the cross sections, for example).
+"""
+
+import numpy as np
+
+from materials import nuclides as known_nuclides
+
+# incomplete partial fraction CRAM of order 16 (Pusa, 2016)
+cram_alpha = np.array([+5.464930576870210E+3 - 3.797983575308356E+4j,
+                       +9.045112476907548E+1 - 1.115537522430261E+3j,
+                       +2.344818070467641E+2 - 4.228020157070496E+2j,
+                       +9.453304067358312E+1 - 2.951294291446048E+2j,
+                       +7.283792954673409E+2 - 1.205646080220011E+5j,
+                       +3.648229059594851E+1 - 1.155509621409682E+2j,
+                       +2.547321630156819E+1 - 2.639500283021502E+1j,
+                       +2.394538338734709E+1 - 5.650522971778156E+0j])
+cram_theta = np.array([+3.509103608414918E+0 + 8.436198985884374E+0j,
+                       +5.948152268951177E+0 + 3.587457362018322E+0j,
+                       -5.264971343442647E+0 + 1.622022147316793E+1j,
+                       +1.419375897185666E+0 + 1.092536348449672E+1j,
+                       +6.416177699099435E+0 + 1.194122393370139E+0j,
+                       +4.993174737717997E+0 + 5.996881713603942E+0j,
+                       -1.413928462488886E+0 + 1.349772569889275E+1j,
+                       -1.084391707869699E+1 + 1.927744616718165E+1j])
+cram_alpha0 = 2.124853710495224E-16
+
+energy_per_fission = 3.204E-11  # J, about 200 MeV
+seconds_per_year = 3.15576E7
+
+
+def cram_propagators(matrices, chunk=4096):
+
+    """
+        This function returns exp(M) for many burnup matrices M (already multiplied by the time
+    step) at once, with CRAM of order 16. Each term of the incomplete partial fraction form is a
+    batched dense solve.
+
+    :param matrices: (matrices x nuclides x nuclides) array
+    :param chunk: int, number of matrices solved together (limits the memory used)
+    :return: (matrices x nuclides x nuclides) array
+    """
+
+    matrices = np.asarray(matrices, dtype=np.float64)
+    size = matrices.shape[-1]
+    identity = np.eye(size)
+
+    propagators = np.empty_like(matrices)
+
+    for start in range(0, matrices.shape[0], chunk):
+        block = matrices[start:start + chunk]
+        propagator = np.broadcast_to(identity, block.shape).copy()
+
+        for alpha, theta in zip(cram_alpha, cram_theta):
+            propagator += 2 * np.real(alpha * np.linalg.solve(block - theta * identity, propagator))
+
+        propagators[start:start + chunk] = cram_alpha0 * propagator
+
+    return propagators
+
+
+class DepletionChain(object):
+
+    """
+        This class describes the decay and transmutation chain of the nuclides of a composition
+    table.
+
+    Attributes:
+        - nuclides: a tuple of the names of the nuclides, in the order of the composition table
+        - decay: a (nuclides x nuclides) decay matrix in 1/s
+        - reactions: a dictionary of (nuclides x nuclides) transmutation patterns by reaction
+    """
+
+    def __init__(self, nuclides):
+
+        self.nuclides = tuple(nuclides)
+        self._index = {name: index for index, name in enumerate(self.nuclides)}
+
+        self.decay = np.zeros((len(self.nuclides), len(self.nuclides)))
+        self.reactions = {}
+
+    def add_decay(self, parent, half_life, daughters=None):
+
+        """
+            This method adds the decay of a nuclide. Daughters outside the chain are dropped.
+
+        :param parent: str
+        :param half_life: float, in s
+        :param daughters: dictionary of branching ratio by daughter name
+        """
+
+        constant = np.log(2) / half_life
+        parent = self._index[parent]
+
+        self.decay[parent, parent] -= constant
+
+        for daughter, branching in (daughters or {}).items():
+            if daughter in self._index:
+                self.decay[self._index[daughter], parent] += branching * constant
+
+    def add_reaction(self, parent, reaction, daughter=None):
+
+        """
+            This method adds a neutron reaction of a nuclide. The product is dropped when the
+        daughter is None or outside the chain (fission products, for example).
+
+        :param parent: str
+        :param reaction: str, 'fission' or 'capture' for example
+        :param daughter: str
+        """
+
+        pattern = self.reactions.setdefault(reaction, np.zeros((len(self.nuclides), len(self.nuclides))))
+        parent = self._index[parent]
+
+        pattern[parent, parent] -= 1.0
+
+        if daughter in self._index:
+            pattern[self._index[daughter], parent] += 1.0
+
+    def rate_matrices(self, cross_sections):
+
+        """
+            This method returns the reaction rate matrix per unit flux of every cross-section set.
+
+        :param cross_sections: dictionary by reaction of (sets x nuclides) arrays in barn
+        :return: (sets x nuclides x nuclides) array in cm2
+        """
+
+        sets = next(iter(cross_sections.values())).shape[0]
+        rates = np.zeros((sets, len(self.nuclides), len(self.nuclides)))
+
+        for reaction, pattern in self.reactions.items():
+            if reaction in cross_sections:
+                # the pattern column of a parent is scaled by the parent cross section (1 barn is 1E-24 cm2)
+                rates += pattern[np.newaxis] * (np.asarray(cross_sections[reaction]) * 1E-24)[:, np.newaxis, :]
+
+        return rates
+
+
+def default_chain(nuclides=None):
+
+    """
+        This function returns a simple chain of the nuclides of the materials module: decays,
+    captures along the uranium isotopes, Th232 breeding to U233 (through Th233 and Pa233, taken as
+    immediate) and the (n, alpha) absorption of B10. Products outside the nuclides are dropped.
+
+    :param nuclides: tuple of names (defaults to the nuclides of the materials module)
+    :return: DepletionChain
+    """
+
+    chain = DepletionChain(known_nuclides if nuclides is None else nuclides)
+
+    for parent, half_life in (('U233', 1.592E5), ('U234', 2.455E5), ('U235', 7.04E8), ('U236', 2.342E7),
+                              ('U238', 4.468E9), ('Th232', 1.405E10)):
+        chain.add_decay(parent, half_life * seconds_per_year)
+
+    for parent, daughter in (('U233', 'U234'), ('U234', 'U235'), ('U235', 'U236'), ('U236', None),
+                             ('U238', None), ('Th232', 'U233'), ('O16', None),
+                             ('Zr90', 'Zr91'), ('Zr91', 'Zr92'), ('Zr92', None), ('Zr94', None), ('Zr96', None),
+                             ('B11', None)):
+        chain.add_reaction(parent, 'capture', daughter)
+
+    for parent in ('U233', 'U235', 'U238', 'Th232'):
+        chain.add_reaction(parent, 'fission')
+
+    chain.add_reaction('B10', 'absorption')
+
+    return chain
+
+
+class Depleter(object):
+
+    """
+        This class advances the compositions of the nodes of a NodeTable over time steps.
+
+    Attributes:
+        - chain: the DepletionChain (in the nuclide order of the composition table)
+        - flux_tolerance: a float of the relative flux difference under which nodes share a matrix
+        - chunk: an int of the number of nodes whose propagators are gathered at a time
+        - propagators: an int count of the propagators computed in the last step
+    """
+
+    def __init__(self, chain, *, flux_tolerance=0.0, chunk=65536):
+
+        self.chain = chain
+        self.flux_tolerance = flux_tolerance
+        self.chunk = chunk
+        self.propagators = 0
+
+    def flux(self, number_densities, fission_cross_sections, power, volume):
+
+        """
+            This method returns the one-group flux of nodes from their power.
+
+        :param number_densities: (nodes x nuclides) array in atoms/barn-cm
+        :param fission_cross_sections: (nodes x nuclides) array in barn
+        :param power: array of float in W
+        :param volume: array of float in cm3
+        :return: array of float in n/cm2-s
+        """
+
+        fission_rate = np.einsum('ij,ij->i', number_densities, fission_cross_sections) * volume  # 1/cm
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            flux = power / (energy_per_fission * fission_rate)
+
+        return np.where(fission_rate > 0, flux, 0.0)
+
+    def _groups(self, xs_set, flux):
+
+        """This method returns the keys of the nodes sharing a burnup matrix"""
+
+        if self.flux_tolerance > 0:
+            # nodes in the same logarithmic flux bin share the matrix (of the bin geometric centre)
+            width = np.log1p(self.flux_tolerance)
+            bins = np.where(flux > 0, np.round(np.log(np.where(flux > 0, flux, 1.0)) / width), np.iinfo(np.int64).min)
+            keys = np.stack((xs_set, bins.astype(np.int64)), axis=1)
+            representative = np.where(flux > 0, np.exp(bins * width), 0.0)
+        else:
+            keys = np.stack((xs_set, flux.view(np.int64)), axis=1)
+            representative = flux
+
+        unique_keys, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+
+        return first, inverse.ravel(), representative[first]
+
+    def deplete(self, node_table, cross_sections, xs_set, time_step, *, length=1.0, nodes=None):
+
+        """
+            This method depletes nodes of a NodeTable over a time step, at constant power.
+
+        :param node_table: NodeTable
+        :param cross_sections: dictionary by reaction of (sets x nuclides) arrays in barn
+        :param xs_set: array of the cross-section set of every node of the table
+        :param time_step: float, in s
+        :param length: float or array, axial length of the nodes in m
+        :param nodes: array of the nodes to deplete (defaults to all nodes with a rod)
+        :return: array of the nodes depleted
+        """
+
+        if self.chain.nuclides != node_table.compositions.nuclides:
+            raise ValueError('the chain and the composition table must have the same nuclides')
+
+        nodes = np.flatnonzero(node_table.rod >= 0) if nodes is None else np.asarray(nodes)
+        node_sets = np.asarray(xs_set)[nodes]
+
+        number_densities = node_table.compositions.node_atombarn(node_table.composition[nodes],
+                                                                 node_table.density[nodes])
+        volume = node_table.volume()[nodes] * length * 1E6  # m2 * m to cm3
+        fission = np.asarray(cross_sections.get('fission', np.zeros_like(next(iter(cross_sections.values())))))
+
+        flux = self.flux(number_densities, fission[node_sets], node_table.power[nodes], volume)
+
+        first, inverse, group_flux = self._groups(node_sets, flux)
+
+        rates = self.chain.rate_matrices(cross_sections)
+        matrices = (self.chain.decay[np.newaxis] + group_flux[:, np.newaxis, np.newaxis] * rates[node_sets[first]]) \
+            * time_step
+
+        propagators = cram_propagators(matrices)
+        self.propagators = propagators.shape[0]
+
+        depleted = np.empty_like(number_densities)
+
+        for start in range(0, nodes.size, self.chunk):
+            block = slice(start, start + self.chunk)
+            depleted[block] = np.einsum('nij,nj->ni', propagators[inverse[block]], number_densities[block])
+
+        rows = node_table.detach_compositions(nodes)
+        compositions = node_table.compositions
+        compositions.number_densities[rows] = np.maximum(depleted, 0.0)
+        compositions.reference_density[rows] = node_table.density[nodes]
+        compositions.modified(rows)
+
+        return nodes
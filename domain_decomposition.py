@@ -0,0 +1,556 @@
+"""
+    This module is responsible for splitting a core into subdomains owned by worker processes.
+
+    A full core with burnup does not fit the memory (nor the time budget) of 1 process, so the
+lattice is split by assemblies: every worker owns the rods of a group of whole assemblies and
+the sub-channels of those rods. A channel on the boundary between 2 subdomains is owned by
+exactly 1 of them (the owner of the rod at its lower right corner, clipped to the lattice), and
+is a halo channel of the other. Workers only exchange the values of their boundary channels:
+
+    - accumulate: contributions of a subdomain to the halo channels (such as the power of its
+      rods flowing into them) are added to the owner's values;
+    - refresh: the owner's values of its boundary channels are copied to the halos.
+
+Global quantities (total power, convergence norms) are reduced over all workers (allreduce).
+
+    Workers are persistent: each owns the arrays of the rods of its subdomain, which are
+scattered to it once, and runs kernel after kernel on them, so that only what changes crosses
+process boundaries.
+
+    Messages go through a Communicator, which here connects local processes with
+multiprocessing pipes (a full mesh). A communicator over the network (MPI, for example) only has
+to provide the same send, receive, exchange and allreduce methods to span several machines.
+"""
+
+import multiprocessing
+from multiprocessing.connection import wait
+import threading
+import traceback
+
+import numpy as np
+from scipy import sparse
+
+from geometry_translation import TranslationOperator
+
+reductions = {'sum': np.add, 'max': np.maximum, 'min': np.minimum}
+
+
+def assembly_subdomains(rows, columns, assembly_size, workers):
+
+    """
+        This function assigns whole assemblies of a lattice to workers: assemblies are numbered
+    row-major and split into workers contiguous groups with about the same number of assemblies.
+
+    :param rows: int, rods of the lattice in each direction
+    :param columns: int
+    :param assembly_size: int, rods of an assembly in each direction
+    :param workers: int
+    :return: (rows x columns) array of the worker (rank) of every rod
+    """
+
+    assembly_rows = -(-rows // assembly_size)
+    assembly_columns = -(-columns // assembly_size)
+    assemblies = assembly_rows * assembly_columns
+
+    if not 0 < workers <= assemblies:
+        raise ValueError('workers must be between 1 and the number of assemblies ({})'.format(assemblies))
+
+    assembly_ranks = np.arange(assemblies) * workers // assemblies
+
+    row_assembly = np.arange(rows) // assembly_size
+    column_assembly = np.arange(columns) // assembly_size
+
+    return assembly_ranks[row_assembly[:, np.newaxis] * assembly_columns + column_assembly[np.newaxis, :]]
+
+
+class Subdomain(object):
+
+    """
+        This class describes the part of a lattice owned by 1 worker.
+
+    Attributes:
+        - rank: an int of the worker
+        - rods: an array of the (global, row-major) rods of the subdomain
+        - channels: an array of the (global) channels of the subdomain, owned channels first and
+          then halo channels
+        - owned: an int of the number of owned channels
+        - weights: a sparse CSR (rods x channels) matrix of the local TranslationOperator weights
+        - send: a dictionary by rank of the local indices of owned channels that are halo channels
+          of that rank
+        - receive: a dictionary by rank of the local indices of halo channels owned by that rank
+    """
+
+    def __init__(self, rank, rods, channels, owned, weights):
+
+        self.rank = rank
+        self.rods = rods
+        self.channels = channels
+        self.owned = owned
+        self.weights = weights
+
+        self.send = {}
+        self.receive = {}
+
+    @property
+    def neighbours(self):
+        return sorted(set(self.send) | set(self.receive))
+
+    def accumulate(self, communicator, values):
+
+        """
+            This method adds the halo values of every subdomain to the values of the owners of
+        those channels (for extensive quantities, such as power). The halo values are left as
+        they are; call refresh to get the totals there too.
+
+        :param communicator: Communicator
+        :param values: array with 1 row per local channel
+        :return: values
+        """
+
+        received = communicator.exchange({rank: values[indices] for rank, indices in self.receive.items()},
+                                         self.send)
+
+        for rank, contribution in received.items():
+            np.add.at(values, self.send[rank], contribution)
+
+        return values
+
+    def refresh(self, communicator, values):
+
+        """
+            This method copies the values of owned boundary channels to the halos of the other
+        subdomains.
+
+        :param communicator: Communicator
+        :param values: array with 1 row per local channel
+        :return: values
+        """
+
+        received = communicator.exchange({rank: values[indices] for rank, indices in self.send.items()},
+                                         self.receive)
+
+        for rank, owner_values in received.items():
+            values[self.receive[rank]] = owner_values
+
+        return values
+
+
+def decompose(subchannel_geometry, ranks):
+
+    """
+        This function creates the Subdomain of every worker of a lattice.
+
+    :param subchannel_geometry: SubchannelGeometry
+    :param ranks: (rows x columns) array of the rank of every rod, from assembly_subdomains
+    :return: list of Subdomain, by rank
+    """
+
+    geometry = subchannel_geometry
+    ranks = np.asarray(ranks)
+    rod_ranks = ranks.ravel()
+
+    channel_rows, channel_columns = np.divmod(np.arange(geometry.channels), geometry.columns + 1)
+    channel_ranks = ranks[np.minimum(channel_rows, geometry.rows - 1),
+                          np.minimum(channel_columns, geometry.columns - 1)]
+
+    weights = TranslationOperator.from_subchannels(geometry).weights
+    subdomains = []
+
+    for rank in range(int(rod_ranks.max()) + 1):
+        rods = np.flatnonzero(rod_ranks == rank)
+        rod_weights = weights[rods]
+
+        touched = np.unique(rod_weights.indices)
+        owned = np.flatnonzero(channel_ranks == rank)
+        halo = touched[channel_ranks[touched] != rank]
+        channels = np.concatenate((owned, halo))
+
+        # columns of the local weights are the local channels
+        local = np.full(geometry.channels, -1, dtype=np.int64)
+        local[channels] = np.arange(channels.size)
+        rod_weights = sparse.csr_matrix((rod_weights.data, local[rod_weights.indices], rod_weights.indptr),
+                                        shape=(rods.size, channels.size))
+
+        subdomain = Subdomain(rank, rods, channels, owned.size, rod_weights)
+
+        for owner in np.unique(channel_ranks[halo]).tolist():
+            subdomain.receive[owner] = owned.size + np.flatnonzero(channel_ranks[halo] == owner)
+
+        subdomains.append(subdomain)
+
+    for subdomain in subdomains:
+        for owner, indices in subdomain.receive.items():
+            owner_domain = subdomains[owner]
+            position = np.searchsorted(owner_domain.channels[:owner_domain.owned], subdomain.channels[indices])
+            owner_domain.send[subdomain.rank] = position
+
+    return subdomains
+
+
+class Communicator(object):
+
+    """
+        This class passes messages between the worker processes of a decomposition, through a
+    full mesh of multiprocessing pipes.
+
+    Attributes:
+        - rank: an int of this worker
+        - size: an int of the number of workers
+        - connections: a dictionary by rank of the connection to every other worker
+    """
+
+    def __init__(self, rank, size, connections):
+
+        self.rank = rank
+        self.size = size
+        self.connections = connections
+
+    def send(self, rank, message):
+
+        self.connections[rank].send(message)
+
+    def receive(self, rank):
+
+        return self.connections[rank].recv()
+
+    def exchange(self, messages, sources):
+
+        """
+            This method sends messages to some ranks while receiving from others. Sending runs in
+        a thread, so that large messages never block both ends of a pipe at the same time.
+
+        :param messages: dictionary of messages by destination rank
+        :param sources: iterable of the ranks to receive a message from
+        :return: dictionary of the messages received by source rank
+        """
+
+        sender = threading.Thread(target=lambda: [self.send(rank, message) for rank, message in messages.items()])
+        sender.start()
+
+        try:
+            return {rank: self.receive(rank) for rank in sources}
+        finally:
+            sender.join()
+
+    def allreduce(self, value, operation='sum'):
+
+        """
+            This method combines a value (a number or an array) of every worker, and returns the
+        result on every worker.
+
+        :param value: number or array
+        :param operation: str, 'sum', 'max' or 'min'
+        :return: number or array
+        """
+
+        if self.rank == 0:
+            result = value
+
+            for rank in range(1, self.size):
+                result = reductions[operation](result, self.receive(rank))
+
+            for rank in range(1, self.size):
+                self.send(rank, result)
+
+            return result
+
+        self.send(0, value)
+
+        return self.receive(0)
+
+    def barrier(self):
+
+        self.allreduce(0)
+
+
+def _worker(subdomain, size, connections, control):
+
+    """
+        This function is the loop of the worker process of 1 subdomain: it keeps the rod arrays of
+    the subdomain, updates them when they are scattered to it and runs kernels on them until it
+    is closed.
+    """
+
+    communicator = Communicator(subdomain.rank, size, connections)
+    rod_arrays = {}
+
+    while True:
+        try:
+            command = control.recv()
+        except EOFError:
+            break
+
+        if command[0] == 'close':
+            break
+
+        if command[0] == 'scatter':
+            rod_arrays.update(command[1])
+            continue
+
+        _, kernel, arguments = command
+
+        try:
+            control.send(('result', kernel(subdomain, communicator, rod_arrays, *arguments)))
+        except Exception:
+            control.send(('error', traceback.format_exc()))
+
+    control.close()
+
+
+class DomainDecomposition(object):
+
+    """
+        This class runs kernels on the subdomains of a lattice, 1 persistent worker process per
+    subdomain.
+
+        Workers are started once (by the first run, or start) and own the arrays of the rods of
+    their subdomain: scatter sends each worker the rows of its rods only, and the arrays stay in
+    the worker from one run to the next. A kernel is a function(subdomain, communicator,
+    rod_arrays, *arguments) (defined at module level, so that it can be sent to the workers) that
+    receives the rod arrays of its subdomain, which it may change or add to (to keep state for
+    the next run), and returns 2 dictionaries of arrays: 1 with a row per rod of the subdomain
+    and 1 with a row per local channel (only the owned channels are gathered), and optionally a
+    dictionary of global values (reduced over all workers, so the values of rank 0 are returned).
+
+    Attributes:
+        - geometry: the SubchannelGeometry of the lattice
+        - ranks: a (rows x columns) array of the rank of every rod
+        - subdomains: a list of Subdomain by rank
+        - context: the multiprocessing context of the workers
+    """
+
+    def __init__(self, subchannel_geometry, assembly_size, workers, *, context=None):
+
+        """
+            Initializes the DomainDecomposition object (the workers are started by the first run).
+
+        :param subchannel_geometry: SubchannelGeometry
+        :param assembly_size: int, rods of an assembly in each direction
+        :param workers: int, number of worker processes (and subdomains)
+        :param context: multiprocessing context (defaults to the default context)
+        """
+
+        self.geometry = subchannel_geometry
+        self.ranks = assembly_subdomains(subchannel_geometry.rows, subchannel_geometry.columns, assembly_size,
+                                         workers)
+        self.subdomains = decompose(subchannel_geometry, self.ranks)
+        self.context = multiprocessing.get_context() if context is None else context
+
+        self._processes = None
+        self._controls = None
+
+    @property
+    def workers(self):
+        return len(self.subdomains)
+
+    @property
+    def started(self):
+        return self._processes is not None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exception):
+
+        self.close()
+
+        return False
+
+    def start(self):
+
+        """This method starts the worker processes (which own no rod arrays yet)"""
+
+        if self.started:
+            return
+
+        size = self.workers
+        connections = [{} for _ in range(size)]
+
+        for first in range(size):
+            for second in range(first + 1, size):
+                connections[first][second], connections[second][first] = self.context.Pipe()
+
+        self._processes = []
+        self._controls = []
+
+        for subdomain in self.subdomains:
+            control, worker_control = self.context.Pipe()
+            process = self.context.Process(target=_worker, args=(subdomain, size, connections[subdomain.rank],
+                                                                 worker_control), daemon=True)
+            process.start()
+            worker_control.close()
+
+            self._processes.append(process)
+            self._controls.append(control)
+
+        # the mesh belongs to the workers now
+        for worker_connections in connections:
+            for connection in worker_connections.values():
+                connection.close()
+
+    def close(self):
+
+        """This method stops the worker processes (their rod arrays are lost)"""
+
+        if not self.started:
+            return
+
+        for control in self._controls:
+            try:
+                control.send(('close', ))
+            except (BrokenPipeError, OSError):
+                pass
+
+        self._stop()
+
+    def _stop(self, timeout=5.0):
+
+        """This method waits for the workers to exit (terminating those that do not) and forgets them"""
+
+        for process, control in zip(self._processes, self._controls):
+            process.join(timeout)
+
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+            control.close()
+
+        self._processes = None
+        self._controls = None
+
+    def scatter(self, rod_arrays):
+
+        """
+            This method sends every worker the rows of its rods of lattice arrays, which it keeps
+        (replacing arrays of the same names).
+
+        :param rod_arrays: dictionary of arrays with 1 row per rod of the lattice (row-major)
+        """
+
+        self.start()
+
+        for subdomain, control in zip(self.subdomains, self._controls):
+            control.send(('scatter', {name: np.asarray(array)[subdomain.rods] for name, array in rod_arrays.items()}))
+
+    def run(self, kernel, rod_arrays=None, *arguments):
+
+        """
+            This method runs a kernel on every subdomain and gathers the results of all workers.
+        If a worker fails, every worker is stopped (and the next run starts new ones).
+
+        :param kernel: function
+        :param rod_arrays: dictionary of arrays with 1 row per rod of the lattice, scattered before
+                           the run (None runs on the arrays the workers already own)
+        :param arguments: extra arguments of the kernel
+        :return: dictionary of rod arrays, dictionary of channel arrays (of the whole lattice), dictionary of
+                 global values
+        """
+
+        if rod_arrays:
+            self.scatter(rod_arrays)
+        else:
+            self.start()
+
+        for control in self._controls:
+            control.send(('run', kernel, arguments))
+
+        gathered = [None] * self.workers
+        pending = {control: rank for rank, control in enumerate(self._controls)}
+
+        try:
+            # results are taken as they come, so that a failed worker is reported at once (the
+            # others may be blocked waiting for its messages)
+            while pending:
+                for control in wait(list(pending)):
+                    rank = pending.pop(control)
+
+                    try:
+                        status, result = control.recv()
+                    except EOFError:
+                        self._processes[rank].join()
+                        raise RuntimeError('worker {} died (exit code {})'.format(rank,
+                                                                                 self._processes[rank].exitcode))
+
+                    if status == 'error':
+                        raise RuntimeError('worker {} failed:\n{}'.format(rank, result))
+
+                    gathered[rank] = result
+        except BaseException:
+            for process in self._processes:
+                if process.is_alive():
+                    process.terminate()
+
+            self._stop()
+            raise
+
+        return self._gather(gathered)
+
+    def _gather(self, gathered):
+
+        """
+            This method assembles the rod and owned channel arrays of every subdomain into lattice
+        arrays, and takes the global values of rank 0.
+        """
+
+        rod_results = {}
+        channel_results = {}
+
+        for subdomain, (rod_arrays, channel_arrays, *_) in zip(self.subdomains, gathered):
+            for name, array in rod_arrays.items():
+                if name not in rod_results:
+                    rod_results[name] = np.zeros((self.geometry.rods, ) + array.shape[1:], dtype=array.dtype)
+                rod_results[name][subdomain.rods] = array
+
+            for name, array in channel_arrays.items():
+                if name not in channel_results:
+                    channel_results[name] = np.zeros((self.geometry.channels, ) + array.shape[1:], dtype=array.dtype)
+                channel_results[name][subdomain.channels[:subdomain.owned]] = array[:subdomain.owned]
+
+        global_values = dict(gathered[0][2]) if len(gathered[0]) > 2 else {}
+
+        return rod_results, channel_results, global_values
+
+
+def channel_power_kernel(subdomain, communicator, rod_arrays, total_power=None):
+
+    """
+        This kernel distributes the power of the rods to the channels: the local contributions
+    to boundary channels are accumulated by their owners and refreshed on the halos. The rod power
+    is first normalized to total_power (a global sum), and the relative L2 norm of its change
+    from the previous power is reduced as well (the global value 'residual'). The previous power
+    is normalized like the power (so that only the shape is compared): it is
+    rod_arrays['previous_power'], scattered by the caller or kept by the worker from its last run.
+
+    :param subdomain: Subdomain
+    :param communicator: Communicator
+    :param rod_arrays: dictionary with 'power' and optionally 'previous_power' arrays
+    :param total_power: float, core power in W (None keeps the power as it is)
+    :return: dictionary of rod arrays, dictionary of channel arrays, dictionary of global values
+    """
+
+    power = np.asarray(rod_arrays['power'], dtype=np.float64)
+    previous_power = rod_arrays.get('previous_power')
+
+    if total_power is not None:
+        power = power * (total_power / communicator.allreduce(power.sum()))
+
+        if previous_power is not None:
+            previous_total = communicator.allreduce(np.sum(previous_power))
+            previous_power = previous_power * (total_power / (previous_total or 1.0))
+
+    channel_power = subdomain.weights.T @ power
+    subdomain.accumulate(communicator, channel_power)
+    subdomain.refresh(communicator, channel_power)
+
+    global_values = {}
+
+    if previous_power is not None:
+        squares = communicator.allreduce(np.array([np.sum((power - previous_power) ** 2), np.sum(power ** 2)]))
+        global_values['residual'] = float(np.sqrt(squares[0] / (squares[1] or 1.0)))
+
+    # the next run compares with this power, unless the caller scatters another previous power
+    rod_arrays['previous_power'] = power
+
+    return {'power': power}, {'power': channel_power}, global_values
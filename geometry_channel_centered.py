@@ -1,3 +1,204 @@
 """
 More or less the same kind of requirements as rod-centered geometry
-"""
\ No newline at end of file
+
+    The sub-channel thermal-hydraulics sees the core as coolant channels between the rods, not
+as rods. For a square lattice of rows x columns rods, the channels are the (rows + 1) x
+(columns + 1) spaces around the rod corners: interior channels between 4 rods, edge channels
+between 2 rods and the wall, and corner channels between 1 rod and 2 walls. Channel (i, j) is
+surrounded by rods (i - 1, j - 1), (i - 1, j), (i, j - 1) and (i, j), when they exist.
+
+    Everything the TH solver needs from the geometry is computed once, for the whole lattice,
+as arrays indexed by channel (flow area, wetted and heated perimeters, hydraulic diameter,
+centroid), by gap (the narrowest space between 2 neighbouring channels) and as sparse
+connectivity matrices (rod-channel and channel-gap), so that the solver never recomputes
+geometry in its inner loop.
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+class SubchannelGeometry(object):
+
+    """
+        This class holds the precomputed geometry of the sub-channels of a square lattice.
+
+    Attributes:
+        - rows / columns: ints of the number of rods in each direction
+        - pitch: the distance between neighbouring rod centres in m
+        - rod_radius: a (rows x columns) array of the outer (cladding) radii of the rods in m
+        - flow_area, wetted_perimeter, heated_perimeter, hydraulic_diameter: arrays by channel
+        - centroid: a (channels x 2) array of the (x, y) centroid of every channel in m
+        - rod_channel: a sparse (rods x channels) matrix of the fraction of the perimeter of
+          each rod facing each channel
+        - gap_channels: a (gaps x 2) array of the 2 channels of every gap
+        - gap_width: an array of the width of every gap in m
+        - gap_length: an array of the distance between the centroids of the channels of every gap in m
+        - channel_gap: a sparse (channels x gaps) matrix, +1 for the first and -1 for the second
+          channel of every gap (the direction of the cross flow)
+    """
+
+    def __init__(self, rows, columns, pitch, rod_radius, *, edge=None, heated=None):
+
+        """
+            Initializes the SubchannelGeometry object and computes all the geometry arrays.
+
+        :param rows: int
+        :param columns: int
+        :param pitch: float
+        :param rod_radius: float or (rows x columns) array, the clad_outer_radius of each HollowRod
+        :param edge: float, distance from the centre of the outer rods to the wall (defaults to pitch / 2)
+        :param heated: (rows x columns) array of bool, True for heated rods (defaults to all rods)
+        """
+
+        self.rows = rows
+        self.columns = columns
+        self.pitch = pitch
+        self.edge = pitch / 2 if edge is None else edge
+        self.rod_radius = np.broadcast_to(np.asarray(rod_radius, dtype=np.float64), (rows, columns)).copy()
+        self.heated = np.ones((rows, columns), dtype=bool) if heated is None \
+            else np.broadcast_to(np.asarray(heated, dtype=bool), (rows, columns)).copy()
+
+        self._channels()
+        self._gaps()
+
+    @property
+    def channels(self):
+        return (self.rows + 1) * (self.columns + 1)
+
+    @property
+    def rods(self):
+        return self.rows * self.columns
+
+    def channel(self, row, column):
+
+        """This method returns the index of channel (row, column)"""
+
+        return row * (self.columns + 1) + column
+
+    def rod_centres(self):
+
+        """This method returns the (rods x 2) array of the (x, y) centre of every rod"""
+
+        y, x = np.meshgrid(np.arange(self.rows) * self.pitch, np.arange(self.columns) * self.pitch, indexing='ij')
+
+        return np.stack((x.ravel(), y.ravel()), axis=1)
+
+    def _bounds(self, count):
+
+        """This method returns the low and high coordinates of the channel rectangles along 1 axis"""
+
+        index = np.arange(count + 1)
+        low = np.where(index > 0, (index - 1) * self.pitch, -self.edge)
+        high = np.where(index < count, index * self.pitch, (count - 1) * self.pitch + self.edge)
+
+        return low, high
+
+    def _channels(self):
+
+        """This method computes the channel arrays and the rod-channel connectivity"""
+
+        x_low, x_high = self._bounds(self.columns)
+        y_low, y_high = self._bounds(self.rows)
+
+        channel_rows, channel_columns = np.meshgrid(np.arange(self.rows + 1), np.arange(self.columns + 1),
+                                                    indexing='ij')
+        channel_rows = channel_rows.ravel()
+        channel_columns = channel_columns.ravel()
+
+        width = (x_high - x_low)[channel_columns]
+        height = (y_high - y_low)[channel_rows]
+        centre_x = ((x_high + x_low) / 2)[channel_columns]
+        centre_y = ((y_high + y_low) / 2)[channel_rows]
+
+        area = width * height
+        moment_x = area * centre_x
+        moment_y = area * centre_y
+        wetted = np.zeros(self.channels)
+        heated = np.zeros(self.channels)
+
+        rod_indices = []
+        channel_indices = []
+
+        # each of the (up to) 4 rods at the corners of a channel removes a quarter circle from it
+        for row_offset, column_offset in ((-1, -1), (-1, 0), (0, -1), (0, 0)):
+            rod_rows = channel_rows + row_offset
+            rod_columns = channel_columns + column_offset
+            exists = (rod_rows >= 0) & (rod_rows < self.rows) & (rod_columns >= 0) & (rod_columns < self.columns)
+
+            rows = rod_rows[exists]
+            columns = rod_columns[exists]
+            radius = self.rod_radius[rows, columns]
+
+            quarter_area = np.pi * radius ** 2 / 4
+            quarter_perimeter = np.pi * radius / 2
+
+            # centroid of a quarter circle is 4r/(3 pi) from the rod centre, towards the channel
+            offset = 4 * radius / (3 * np.pi)
+
+            area[exists] -= quarter_area
+            moment_x[exists] -= quarter_area * (columns * self.pitch - np.sign(column_offset + 0.5) * offset)
+            moment_y[exists] -= quarter_area * (rows * self.pitch - np.sign(row_offset + 0.5) * offset)
+            wetted[exists] += quarter_perimeter
+            heated[exists] += np.where(self.heated[rows, columns], quarter_perimeter, 0.0)
+
+            rod_indices.append(rows * self.columns + columns)
+            channel_indices.append(np.flatnonzero(exists))
+
+        # sides of the boundary channels on the wall are wetted as well
+        wetted += np.where((channel_rows == 0) | (channel_rows == self.rows), width, 0.0)
+        wetted += np.where((channel_columns == 0) | (channel_columns == self.columns), height, 0.0)
+
+        self.flow_area = area
+        self.wetted_perimeter = wetted
+        self.heated_perimeter = heated
+        self.hydraulic_diameter = 4 * area / wetted
+        self.centroid = np.stack((moment_x / area, moment_y / area), axis=1)
+
+        rod_indices = np.concatenate(rod_indices)
+        channel_indices = np.concatenate(channel_indices)
+
+        self.rod_channel = sparse.csr_matrix((np.full(rod_indices.size, 0.25), (rod_indices, channel_indices)),
+                                             shape=(self.rods, self.channels))
+
+    def _gaps(self):
+
+        """This method computes the gap arrays and the channel-gap connectivity"""
+
+        gap_channels = []
+        gap_width = []
+
+        # gaps between channels (i, j) and (i, j + 1) cross the rod column j, between rods
+        # (i - 1, j) and (i, j); gaps between channels (i, j) and (i + 1, j) cross the rod row i
+        for crosses_column, along, across, lattice in ((True, self.rows, self.columns, self.rod_radius),
+                                                       (False, self.columns, self.rows, self.rod_radius.T)):
+            position, line = np.meshgrid(np.arange(along + 1), np.arange(across), indexing='ij')
+            position = position.ravel()
+            line = line.ravel()
+
+            before = np.where(position > 0, lattice[np.maximum(position - 1, 0), line], np.nan)
+            after = np.where(position < along, lattice[np.minimum(position, along - 1), line], np.nan)
+
+            width = np.where(np.isnan(before), self.edge - after,
+                             np.where(np.isnan(after), self.edge - before, self.pitch - before - after))
+
+            if crosses_column:
+                first = self.channel(position, line)
+                second = self.channel(position, line + 1)
+            else:
+                first = self.channel(line, position)
+                second = self.channel(line + 1, position)
+
+            gap_channels.append(np.stack((first, second), axis=1))
+            gap_width.append(width)
+
+        self.gap_channels = np.concatenate(gap_channels)
+        self.gap_width = np.concatenate(gap_width)
+        self.gap_length = np.linalg.norm(self.centroid[self.gap_channels[:, 1]]
+                                         - self.centroid[self.gap_channels[:, 0]], axis=1)
+
+        gaps = self.gap_channels.shape[0]
+
+        self.channel_gap = sparse.csr_matrix((np.concatenate((np.ones(gaps), -np.ones(gaps))),
+                                              (self.gap_channels.T.ravel(), np.tile(np.arange(gaps), 2))),
+                                             shape=(self.channels, gaps))
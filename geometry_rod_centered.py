@@ -21,6 +21,12 @@ Dump the last iteration into an HDF5 file to release memory and always store 2 o
 
 from math import pi
 
+import numpy as np
+
+from instrumentation import timed
+from node_table import NodeTable
+from state_hashing import nodes_hash, same_nodes
+
 tau = 2*pi
 
 
@@ -29,6 +35,9 @@ class RadialNode(object):
     """
         This class defines the smallest element of an annular element (probably of fuel).
 
+        A RadialNode does not hold its own data: it is a view into one row of a NodeTable,
+    so that millions of nodes do not cost millions of Python objects.
+
     Attributes:
         - Inner radius in m
         - Outer radius in m
@@ -38,35 +47,123 @@ class RadialNode(object):
         - Elemental composition
     """
 
-    def __init__(self, inner_radius, outer_radius, density, temperature, composition):
+    __slots__ = ('table', 'index')
+
+    def __init__(self, inner_radius, outer_radius, density, temperature, composition, *, node_table=None):
 
         """
-            Initializes the RadialNode object.
+            Initializes the RadialNode object, appending it to node_table (or to a table of its own).
 
         :param inner_radius: float
         :param outer_radius: float
         :param density: float
         :param temperature: float
         :param composition: dictionary
+        :param node_table: NodeTable
         """
 
-        self.power = 0.0
+        self.table = NodeTable(1) if node_table is None else node_table
+        self.index, _ = self.table.append_nodes((inner_radius, ), (outer_radius, ), (density, ),
+                                                (temperature, ), (composition, ))
+
+    @classmethod
+    def view(cls, node_table, index):
+
+        """
+            Returns a RadialNode looking at an existing row of a NodeTable.
+
+        :param node_table: NodeTable
+        :param index: int
+        :return: RadialNode
+        """
+
+        node = cls.__new__(cls)
+        node.table = node_table
+        node.index = index
+
+        return node
+
+    def __eq__(self, other):
+
+        """Nodes are equal when they have the same content, whatever table they live in"""
+
+        if not isinstance(other, RadialNode):
+            return NotImplemented
+
+        return same_nodes(self.table, [self.index], other.table, [other.index])
+
+    __hash__ = None  # mutable: use content_hash as a key
+
+    def content_hash(self):
+
+        """This method returns the 64-bit hash of the content of the node (see state_hashing)"""
+
+        return nodes_hash(self.table, self.index, self.index + 1)
+
+    @property
+    def inner_radius(self):
+        return float(self.table.inner_radius[self.index])
+
+    @inner_radius.setter
+    def inner_radius(self, value):
+        self.table.inner_radius[self.index] = value
+
+    @property
+    def outer_radius(self):
+        return float(self.table.outer_radius[self.index])
 
-        self.inner_radius = inner_radius
-        self.outer_radius = outer_radius
-        self.density = density
-        self.temperature = temperature
-        self.composition = composition
+    @outer_radius.setter
+    def outer_radius(self, value):
+        self.table.outer_radius[self.index] = value
+
+    @property
+    def density(self):
+        return float(self.table.density[self.index])
+
+    @density.setter
+    def density(self, value):
+        self.table.density[self.index] = value
+
+    @property
+    def temperature(self):
+        return float(self.table.temperature[self.index])
+
+    @temperature.setter
+    def temperature(self, value):
+        self.table.temperature[self.index] = value
+
+    @property
+    def power(self):
+        return float(self.table.power[self.index])
+
+    @power.setter
+    def power(self, value):
+        self.table.power[self.index] = value
+
+    @property
+    def composition(self):
+        # the content of the row, which changes with burnup
+        return self.table.compositions.mass_percent(int(self.table.composition[self.index]))
+
+    @composition.setter
+    def composition(self, value):
+        self.table.set_composition(self.index, value)
 
     def atombarn_composition(self):
 
         """
-            This method converts the mass % composition to atom barn
+            This method converts the mass % composition to atom barn. For many nodes at once,
+        use NodeTable.atombarn instead.
 
-        :return: a float of the composition in atom-barn
+        :return: a dictionary of the composition in atom-barn by nuclide
         """
 
-        return 'atombarn'
+        compositions = self.table.compositions
+        number_densities = compositions.node_atombarn(self.table.composition[self.index:self.index + 1],
+                                                      self.table.density[self.index:self.index + 1])[0]
+
+        return {nuclide: float(number_density)
+                for nuclide, number_density in zip(compositions.nuclides, number_densities) if number_density}
 
 
 class RadialElement(object):
@@ -89,38 +186,107 @@ class RadialElement(object):
     and only properties such as temperature and radius (naturally) change from node to node.
     With burnup, nodes from a RadialElement will have different composition between themselves.
 
+        The nodes of an element are the contiguous rows [start, stop) of a NodeTable.
+
     Attributes:
         - nodes: a list of RadialNode. Every RadialElement contains at least 1 node
         - power: a float of total power in the RadialElement (sum of power in its nodes)
     """
 
+    __slots__ = ('table', 'start', 'stop', 'index', 'power', '_nodes')
+
+    @timed('geometry.RadialElement')
     def __init__(self, element_inner_radii, element_outer_radii,
-                 element_densities, element_temperatures, element_compositions):
+                 element_densities, element_temperatures, element_compositions, *, node_table=None):
 
         """
-            Initializes the RadialElement object.
+            Initializes the RadialElement object, appending its nodes to node_table (or to a
+        table of its own).
 
         :param element_inner_radii: tuple
         :param element_outer_radii: tuple
         :param element_densities: tuple
         :param element_temperatures: tuple
         :param element_compositions: tuple
+        :param node_table: NodeTable
         """
 
+        if not len(element_inner_radii):
+            raise ValueError('a RadialElement needs at least 1 node')
+
         self.power = 0.0
-        self.nodes = []
+        self._nodes = None
+        self.table = NodeTable(len(element_inner_radii)) if node_table is None else node_table
+
+        self.start, self.stop = self.table.append_nodes(element_inner_radii, element_outer_radii,
+                                                        element_densities, element_temperatures,
+                                                        element_compositions)
+        self.index = self.table.new_element(self.start, self.stop)
+
+    @classmethod
+    def view(cls, node_table, start, stop, index):
+
+        """
+            Returns a RadialElement looking at existing rows [start, stop) of a NodeTable.
+
+        :param node_table: NodeTable
+        :param start: int
+        :param stop: int
+        :param index: int
+        :return: RadialElement
+        """
+
+        element = cls.__new__(cls)
+        element.table = node_table
+        element.start = start
+        element.stop = stop
+        element.index = index
+        element.power = 0.0
+        element._nodes = None
+
+        return element
+
+    def __deepcopy__(self, memo):
+
+        """A copy of an element copies its own nodes only, not the whole table it lives in"""
 
-        for node_inner_radius, node_outer_radius, node_density, node_temperature, node_composition \
-                in zip(element_inner_radii, element_outer_radii,
-                       element_densities, element_temperatures, element_compositions):
-            self.nodes.append(RadialNode(node_inner_radius, node_outer_radius,
-                                         node_density, node_temperature, node_composition))
+        element = RadialElement.view(self.table.extract(self.start, self.stop), 0, self.stop - self.start, 0)
+        element.power = self.power
 
+        return element
+
+    def __eq__(self, other):
+
+        """Elements are equal when their nodes have the same content, whatever table they live in"""
+
+        if not isinstance(other, RadialElement):
+            return NotImplemented
+
+        return same_nodes(self.table, slice(self.start, self.stop), other.table, slice(other.start, other.stop))
+
+    __hash__ = None  # mutable: use content_hash as a key
+
+    def content_hash(self):
+
+        """This method returns the 64-bit hash of the content of the element (see state_hashing)"""
+
+        return nodes_hash(self.table, self.start, self.stop)
+
+    @property
+    def nodes(self):
+
+        # views are created once (the rows of an element never move)
+        if self._nodes is None:
+            self._nodes = [RadialNode.view(self.table, index) for index in range(self.start, self.stop)]
+
+        return self._nodes
+
+    @timed('power_update.RadialElement')
     def power_update(self):
 
         """This method updates the element power by summing all the power values in the nodes"""
 
-        self.power = sum(node.power for node in self.nodes)
+        self.power = float(self.table.power[self.start:self.stop].sum())
 
 
 class Fuel(object):
@@ -129,13 +295,17 @@ class Fuel(object):
         The Fuel class defines a concrete object, unlike RadialElement and RadialNode
     classes, which defines increasingly abstract ideas.
 
+        All nodes of a Fuel are contiguous rows of a NodeTable, so that many Fuel objects
+    of a core may share the same table (given as node_table).
+
     Attributes:
         - elements: a list of RadialElements. Every Fuel contains at least 1 element
         - power: a float of total power in the Fuel (sum of power in its elements)
     """
 
+    @timed('geometry.Fuel')
     def __init__(self, fuel_inner_radii, fuel_outer_radii,
-                 fuel_densities, fuel_temperatures, fuel_compositions):
+                 fuel_densities, fuel_temperatures, fuel_compositions, *, node_table=None):
 
         """
             This method initializes the Fuel object.
@@ -145,26 +315,115 @@ class Fuel(object):
         :param fuel_densities: tuple
         :param fuel_temperatures: tuple
         :param fuel_compositions: tuple
+        :param node_table: NodeTable
         """
 
+        if not len(fuel_inner_radii) or not all(len(element_inner_radii) for element_inner_radii in fuel_inner_radii):
+            raise ValueError('a Fuel needs at least 1 element, and every element at least 1 node')
+
         self.power = 0.0
         self.elements = []
 
         self.clad_inner_temperature = 0.0
         self.clad_outer_temperature = 0.0
 
+        if node_table is None:
+            node_table = NodeTable(sum(len(element_inner_radii) for element_inner_radii in fuel_inner_radii))
+
+        self.table = node_table
+
         for element_inner_radii, element_outer_radii, element_densities, element_temperatures, element_compositions \
                 in zip(fuel_inner_radii, fuel_outer_radii, fuel_densities, fuel_temperatures, fuel_compositions):
             self.elements.append(RadialElement(element_inner_radii, element_outer_radii,
-                                               element_densities, element_temperatures, element_compositions))
+                                               element_densities, element_temperatures, element_compositions,
+                                               node_table=node_table))
+
+        self.start = self.elements[0].start
+        self.stop = self.elements[-1].stop
+        self.index = self.table.new_rod(self.start, self.stop)
+
+    @classmethod
+    def view(cls, node_table, start, stop):
+
+        """
+            Returns a Fuel looking at the existing rows [start, stop) of a NodeTable, which must
+        be the rows of 1 rod.
+
+        :param node_table: NodeTable
+        :param start: int
+        :param stop: int
+        :return: Fuel
+        """
 
+        fuel = cls.__new__(cls)
+        fuel.power = 0.0
+        fuel.clad_inner_temperature = 0.0
+        fuel.clad_outer_temperature = 0.0
+        fuel.table = node_table
+        fuel.start = start
+        fuel.stop = stop
+        fuel.index = int(node_table.rod[start])
+
+        element_starts = start + np.flatnonzero(np.diff(node_table.element[start:stop], prepend=-2) != 0)
+        element_stops = np.append(element_starts[1:], stop)
+
+        fuel.elements = [RadialElement.view(node_table, element_start, element_stop,
+                                            int(node_table.element[element_start]))
+                         for element_start, element_stop in zip(element_starts.tolist(), element_stops.tolist())]
+
+        return fuel
+
+    def __deepcopy__(self, memo):
+
+        """A copy of a Fuel copies its own nodes only, not the whole table it lives in"""
+
+        fuel = Fuel.view(self.table.extract(self.start, self.stop), 0, self.stop - self.start)
+        fuel.power = self.power
+        fuel.clad_inner_temperature = self.clad_inner_temperature
+        fuel.clad_outer_temperature = self.clad_outer_temperature
+
+        for element, copied in zip(self.elements, fuel.elements):
+            copied.power = element.power
+
+        return fuel
+
+    def __eq__(self, other):
+
+        """
+            Fuels are equal when they have the same elements with nodes of the same content,
+        whatever table they live in (deep copies of a Fuel are equal to it).
+        """
+
+        if not isinstance(other, Fuel):
+            return NotImplemented
+
+        return [element.stop - element.start for element in self.elements] \
+            == [element.stop - element.start for element in other.elements] \
+            and same_nodes(self.table, slice(self.start, self.stop), other.table, slice(other.start, other.stop))
+
+    __hash__ = None  # mutable: use content_hash as a key
+
+    def content_hash(self):
+
+        """
+            This method returns the 64-bit hash of the content of the Fuel, equal to the hash of
+        its rod in a StateHasher (see state_hashing).
+        """
+
+        return nodes_hash(self.table, self.start, self.stop)
+
+    @timed('power_update.Fuel')
     def power_update(self):
 
         """This method updates the insert power by summing all the power values in the elements"""
 
-        [element.power_update() for element in self.elements]
+        element_powers = np.add.reduceat(self.table.power[self.start:self.stop],
+                                         [element.start - self.start for element in self.elements])
+
+        for element, element_power in zip(self.elements, element_powers):
+            element.power = float(element_power)
 
-        self.power = sum(element.power for element in self.elements)
+        self.power = float(element_powers.sum())
 
     @staticmethod
     def insert_type():
@@ -8,59 +8,383 @@ From this starter geometry, the program will create an expanded geometry that re
 in 3D "in its full glory". It is the expanded geometry that will be passed to the solvers!
 """
 
-from layering import nodalize, equal_volume
+from collections import namedtuple
+
+import numpy as np
+
+from geometry_rod_centered import Fuel
+from instrumentation import timed
+from layering import nodalize_batch, equal_volume
+from node_table import NodeTable
+
+pin_type = namedtuple('pin_type', ['outer_radii', 'inner_radius', 'densities', 'temperatures',
+                                   'compositions', 'radial_nodes'])
+
+
+class PinTemplate(object):
+
+    """
+        This class holds the nodalized radial geometry of a pin type. It is built once per
+    pin type and shared (read-only) by every pin of that type in the core.
+
+    Attributes:
+        - name: the name of the pin type
+        - pin: the pin_type it was built from
+        - inner_radii / outer_radii: read-only arrays of the radii of every node
+        - offsets: array with the offsets of the nodes of each element
+        - fuel_*: tuples (one per element) of tuples (one per node), as expected by Fuel
+    """
+
+    def __init__(self, name, pin):
+
+        """
+            Initializes the PinTemplate object.
+
+        :param name: str
+        :param pin: pin_type
+        """
+
+        self.name = name
+        self.pin = pin
+
+        element_inner_radii = (pin.inner_radius, ) + tuple(pin.outer_radii[:-1])
+
+        self.inner_radii, self.outer_radii, self.offsets = nodalize_batch(pin.outer_radii, pin.radial_nodes,
+                                                                          equal_volume,
+                                                                          inner_radii=element_inner_radii)
+        self.inner_radii.flags.writeable = False
+        self.outer_radii.flags.writeable = False
+        self.offsets.flags.writeable = False
+
+        bounds = tuple(zip(self.offsets[:-1], self.offsets[1:]))
+
+        self.fuel_inner_radii = tuple(tuple(self.inner_radii[start:stop].tolist()) for start, stop in bounds)
+        self.fuel_outer_radii = tuple(tuple(self.outer_radii[start:stop].tolist()) for start, stop in bounds)
+        self.fuel_densities = tuple((density, ) * nodes for density, nodes in zip(pin.densities, pin.radial_nodes))
+        self.fuel_temperatures = tuple((temperature, ) * nodes
+                                       for temperature, nodes in zip(pin.temperatures, pin.radial_nodes))
+        self.fuel_compositions = tuple((composition, ) * nodes
+                                       for composition, nodes in zip(pin.compositions, pin.radial_nodes))
+
+    def __len__(self):
+
+        return int(self.offsets[-1])
+
+    def fuel(self, node_table):
+
+        """
+            This method creates a fresh Fuel of this pin type in node_table.
+
+        :param node_table: NodeTable
+        :return: Fuel
+        """
+
+        return Fuel(self.fuel_inner_radii, self.fuel_outer_radii, self.fuel_densities,
+                    self.fuel_temperatures, self.fuel_compositions, node_table=node_table)
 
 
 class SimplifiedGeometry(object):
 
-    def __init__(self):
+    """
+        This class is the simplified description of a core: a few pin types, a radial map
+    telling which pin type is in each lattice position, the number of axial levels and the
+    symmetry of the core.
+
+    Attributes:
+        - pin_types: a dictionary of pin_type by name
+        - layout: a 2D list of pin type names of the full core (None for empty positions)
+        - axial_nodes: an int of the number of axial levels of every rod
+        - symmetry: 'full', 'quarter' or 'eighth'
+    """
+
+    symmetries = ('full', 'quarter', 'eighth')
+
+    def __init__(self, pin_types, layout, axial_nodes=1, symmetry='full'):
+
+        """
+            Initializes the SimplifiedGeometry object.
+
+        :param pin_types: dictionary
+        :param layout: 2D list of str
+        :param axial_nodes: int
+        :param symmetry: str
+        """
 
-        self.elements
+        if symmetry not in self.symmetries:
+            raise ValueError('symmetry must be one of {}'.format(self.symmetries))
 
+        self.pin_types = pin_types
+        self.layout = [list(row) for row in layout]
+        self.axial_nodes = axial_nodes
+        self.symmetry = symmetry
+
+        rows = len(self.layout)
+        columns = len(self.layout[0])
+
+        if any(len(row) != columns for row in self.layout):
+            raise ValueError('every row of the layout must have the same number of positions')
+
+        if symmetry == 'eighth' and rows != columns:
+            raise ValueError('eighth symmetry requires a square layout')
+
+        unknown = {name for row in self.layout for name in row if name is not None} - set(pin_types)
+
+        if unknown:
+            raise ValueError('unknown pin types in layout: {}'.format(sorted(unknown)))
+
+    def _symmetric_keys(self):
+
+        """
+            This method returns, for every position of the layout, the key of the position it is
+        mapped onto by the symmetry. The keys use doubled distances to the core centre, so that
+        layouts with an even number of positions (centre between positions) also work.
+        """
+
+        rows = len(self.layout)
+        columns = len(self.layout[0])
+
+        row_keys, column_keys = np.meshgrid(np.arange(rows), np.arange(columns), indexing='ij')
+
+        if self.symmetry != 'full':
+            row_keys = np.abs(2 * row_keys - (rows - 1))
+            column_keys = np.abs(2 * column_keys - (columns - 1))
+
+        if self.symmetry == 'eighth':
+            row_keys, column_keys = np.minimum(row_keys, column_keys), np.maximum(row_keys, column_keys)
+
+        return row_keys * (2 * columns + 1) + column_keys
+
+    @timed('geometry.expand_geometry')
     def expand_geometry(self):
-        pass
-
-
-outer_radii = [0.34, 0.4096, 0.4106]
-inner_radius = 0.15
-densities = [10270, 10230, 3000]   # has to be multiplied appropriately by number of nodes
-temperatures = [1200, 900, 600]  # has to be multiplied appropriately by number of nodes
-compositions = [{'UO2': 100}, {'Th': 100}, {'ZrB2': 100}]  # has to be multiplied appropriately by number of nodes
-radial_nodes = (3, 1, 1)
-
-# outer_radii = [(X   , Y, 0.34), (0.4096, ), (0.4106, )]
-# inner_radii = [(0.15, X,    Y), (0.34  , ), (0.4096, )]
-# densities = [(10270, 10270, 10270), (10230, ), (3000, )]
-# temperatures = [(1200, 1200, 1200), (900, ), (600, )]
-# compositions = [({'UO2': 100}, {'UO2': 100}, {'UO2': 100}), ({'Th': 100}, ), ({'ZrB2': 100}, )]
-# radial_nodes = (3, 1, 1)
-
-inner_radii = outer_radii[:-1]
-inner_radii.insert(0, inner_radius)
-inner_radii = inner_radii
-
-fuel_inner_radii = []
-fuel_outer_radii = []
-fuel_densities = []
-fuel_temperatures = []
-fuel_compositions = []
-
-for inner_radius, outer_radius, density, temperature, composition, nodes \
-        in zip(inner_radii, outer_radii, densities, temperatures, compositions, radial_nodes):
-    element_inner_radii, element_outer_radii = nodalize(outer_radius, nodes, equal_volume,
-                                                        inner_radius=inner_radius)
-    fuel_inner_radii.append(element_inner_radii)
-    fuel_outer_radii.append(element_outer_radii)
-    fuel_densities.append((density, ) * nodes)
-    fuel_temperatures.append((temperature, ) * nodes)
-    fuel_compositions.append((composition, ) * nodes)
-
-print(fuel_inner_radii)
-print(fuel_outer_radii)
-print(fuel_densities)
-print(fuel_temperatures)
-print(fuel_compositions)
+
+        """
+            This method expands the simplified geometry into the full 3D core. The work done
+        (and the memory used) depends on the number of pin types and unique cells, never on
+        the total number of pins.
+
+        :return: ExpandedGeometry
+        """
+
+        names = sorted(self.pin_types)
+        type_index = {name: index for index, name in enumerate(names)}
+
+        position_types = np.array([[-1 if name is None else type_index[name] for name in row]
+                                   for row in self.layout], dtype=np.int32)
+
+        # positions mapped onto each other form a group, whose positions must all be empty or all of 1 type
+        _, groups = np.unique(self._symmetric_keys(), return_inverse=True)
+        groups = groups.reshape(position_types.shape)
+
+        group_types = np.empty(int(groups.max()) + 1 if groups.size else 0, dtype=np.int32)
+        group_types[groups] = position_types
+
+        if np.any(group_types[groups] != position_types):
+            raise ValueError('the layout does not have {} symmetry'.format(self.symmetry))
+
+        # 1 cell per occupied group, in the order of the keys
+        occupied = group_types >= 0
+        group_cells = np.where(occupied, np.cumsum(occupied) - 1, -1)
+
+        cell_index = group_cells[groups].astype(np.int32)
+        cell_types = group_types[occupied]
+
+        templates = [PinTemplate(name, self.pin_types[name]) for name in names]
+
+        return ExpandedGeometry(templates, cell_index, cell_types, self.axial_nodes)
+
+
+class ExpandedGeometry(object):
+
+    """
+        This class represents the reactor in 3D "in its full glory": every lattice position,
+    every axial level and every radial node.
+
+        Symmetric positions share one cell, and all cells of the same pin type share one
+    PinTemplate. The state of a (cell, axial level) pair is only stored (in the node_table)
+    once it is requested, that is, once it may differ from the fresh template: until then it
+    is described by its template alone. Each stored (cell, axial level) pair is 1 rod of the
+    node_table.
+
+    Attributes:
+        - templates: a list of PinTemplate
+        - cell_index: a 2D array with the cell of every lattice position (-1 for empty positions)
+        - cell_types: an array with the template index of every cell
+        - axial_nodes: an int of the number of axial levels of every rod
+        - node_table: the NodeTable holding the state of materialized cells
+        - cell_rods: a (cells x axial levels) array of the rod of the node_table of every cell at
+          every axial level (-1 while it is not stored)
+    """
+
+    def __init__(self, templates, cell_index, cell_types, axial_nodes, node_table=None, rod_cells=None):
+
+        """
+            Initializes the ExpandedGeometry object, either empty or with the state of an
+        existing node_table (rod_cells then gives the (cell, axial level) of each of its rods).
+
+        :param templates: list of PinTemplate
+        :param cell_index: 2D array of int
+        :param cell_types: array of int
+        :param axial_nodes: int
+        :param node_table: NodeTable
+        :param rod_cells: (rods x 2) array of int
+        """
+
+        self.templates = templates
+        self.cell_index = cell_index
+        self.cell_types = cell_types
+        self.axial_nodes = axial_nodes
+
+        self.node_table = NodeTable() if node_table is None else node_table
+        # rod of the node_table of every (cell, axial level), -1 while it is not stored
+        self._rods = np.full((cell_types.size, axial_nodes), -1, dtype=np.int64)
+
+        if rod_cells is not None:
+            self._rods[rod_cells[:, 0], rod_cells[:, 1]] = np.arange(len(rod_cells))
+        self._fuels = {}
+        self._rod_bounds = None
+
+    @property
+    def pins(self):
+        return int(np.count_nonzero(self.cell_index >= 0))
+
+    @property
+    def cells(self):
+        return self.cell_types.size
+
+    def template(self, row, column):
+
+        """This method returns the PinTemplate of a lattice position (None if empty)"""
+
+        cell = self.cell_index[row, column]
+
+        return None if cell < 0 else self.templates[self.cell_types[cell]]
+
+    def fuel(self, row, column, axial):
+
+        """
+            This method returns the Fuel of a lattice position at an axial level. Symmetric
+        positions return the same Fuel, and its state is created from the template on the first
+        request.
+
+        :param row: int
+        :param column: int
+        :param axial: int
+        :return: Fuel
+        """
+
+        cell = int(self.cell_index[row, column])
+
+        if cell < 0:
+            raise IndexError('lattice position ({}, {}) is empty'.format(row, column))
+
+        if not 0 <= axial < self.axial_nodes:
+            raise IndexError('axial level {} out of range'.format(axial))
+
+        try:
+            return self._fuels[cell, axial]
+        except KeyError:
+            pass
+
+        rod = self._rods[cell, axial]
+
+        if rod >= 0:
+            if self._rod_bounds is None or self._rod_bounds[0].size != self.node_table.rods:
+                self._rod_bounds = self.node_table.rod_bounds()
+
+            fuel = Fuel.view(self.node_table, int(self._rod_bounds[0][rod]), int(self._rod_bounds[1][rod]))
+        else:
+            fuel = self.templates[self.cell_types[cell]].fuel(self.node_table)
+            self._rods[cell, axial] = fuel.index
+
+        self._fuels[cell, axial] = fuel
+
+        return fuel
+
+    @timed('geometry.materialize')
+    def materialize(self):
+
+        """
+            This method creates the state of every cell at every axial level, in cell order,
+        for solvers that need all the node state in the node_table.
+
+        :return: NodeTable
+        """
+
+        for cell, template_index in enumerate(self.cell_types):
+            for axial in range(self.axial_nodes):
+                if self._rods[cell, axial] < 0:
+                    fuel = self._fuels[cell, axial] = self.templates[template_index].fuel(self.node_table)
+                    self._rods[cell, axial] = fuel.index
+
+        return self.node_table
+
+    @property
+    def cell_rods(self):
+        return self._rods
+
+    def position_rods(self):
+
+        """
+            This method returns a (positions x axial levels) array with the rod of the node_table
+        of every lattice position (row-major) at every axial level, -1 for empty positions and
+        for cells that are not stored yet. Symmetric positions have the same rod.
+
+        :return: 2D array of int
+        """
+
+        cells = self.cell_index.ravel()
+
+        return np.where(cells[:, np.newaxis] >= 0, self._rods[np.maximum(cells, 0)], -1)
+
+    def rod_cells(self):
+
+        """This method returns a (rods x 2) array of the (cell, axial level) of every rod of the node_table"""
+
+        stored = self._rods >= 0
+
+        rod_cells = np.zeros((np.count_nonzero(stored), 2), dtype=np.int64)
+        rod_cells[self._rods[stored]] = np.argwhere(stored)
+
+        return rod_cells
 
 
 def rod():
     print("Hello Rodrigo!")
+
+
+if __name__ == '__main__':
+
+    outer_radii = [0.34, 0.4096, 0.4106]
+    inner_radius = 0.15
+    densities = [10270, 10230, 3000]   # has to be multiplied appropriately by number of nodes
+    temperatures = [1200, 900, 600]  # has to be multiplied appropriately by number of nodes
+    compositions = [{'UO2': 100}, {'Th': 100}, {'ZrB2': 100}]  # has to be multiplied appropriately by number of nodes
+    radial_nodes = (3, 1, 1)
+
+    # outer_radii = [(X   , Y, 0.34), (0.4096, ), (0.4106, )]
+    # inner_radii = [(0.15, X,    Y), (0.34  , ), (0.4096, )]
+    # densities = [(10270, 10270, 10270), (10230, ), (3000, )]
+    # temperatures = [(1200, 1200, 1200), (900, ), (600, )]
+    # compositions = [({'UO2': 100}, {'UO2': 100}, {'UO2': 100}), ({'Th': 100}, ), ({'ZrB2': 100}, )]
+    # radial_nodes = (3, 1, 1)
+
+    inner_radii = outer_radii[:-1]
+    inner_radii.insert(0, inner_radius)
+    inner_radii = inner_radii
+
+    node_inner_radii, node_outer_radii, offsets = nodalize_batch(outer_radii, radial_nodes, equal_volume,
+                                                                 inner_radii=inner_radii)
+
+    bounds = list(zip(offsets[:-1], offsets[1:]))
+
+    fuel_inner_radii = [tuple(node_inner_radii[start:stop].tolist()) for start, stop in bounds]
+    fuel_outer_radii = [tuple(node_outer_radii[start:stop].tolist()) for start, stop in bounds]
+    fuel_densities = [(density, ) * nodes for density, nodes in zip(densities, radial_nodes)]
+    fuel_temperatures = [(temperature, ) * nodes for temperature, nodes in zip(temperatures, radial_nodes)]
+    fuel_compositions = [(composition, ) * nodes for composition, nodes in zip(compositions, radial_nodes)]
+
+    print(fuel_inner_radii)
+    print(fuel_outer_radii)
+    print(fuel_densities)
+    print(fuel_temperatures)
+    print(fuel_compositions)
@@ -1,3 +1,132 @@
 """
 This has to make the translation from a channel-centered geometry values into rod-centered one
-"""
\ No newline at end of file
+
+    The translation is a sparse (rods x channels) weight matrix W built once from the lattice
+geometry: W[rod, channel] is the fraction of the perimeter of the rod facing the channel, so
+every row of W sums to 1. The same operator works in both directions:
+
+    - rod to channel (power, conservative): channel_values = W.T @ rod_values
+    - channel to rod (coolant temperature and density, averaging): rod_values = W @ channel_values
+
+    Values of several axial levels are translated together, as (rods x axial levels) and
+(channels x axial levels) arrays, by a single sparse matrix product.
+"""
+
+import numpy as np
+from scipy import sparse
+
+from instrumentation import timed
+
+
+class TranslationOperator(object):
+
+    """
+        This class translates fields between the rods and the sub-channels of a lattice.
+
+    Attributes:
+        - weights: a sparse CSR (rods x channels) matrix
+        - transposed: the CSR of weights.T, kept so that both directions are CSR products
+    """
+
+    def __init__(self, weights):
+
+        """
+            Initializes the TranslationOperator object.
+
+        :param weights: sparse (rods x channels) matrix with rows summing to 1
+        """
+
+        self.weights = sparse.csr_matrix(weights)
+        self.transposed = self.weights.T.tocsr()
+
+    @classmethod
+    def from_subchannels(cls, subchannel_geometry):
+
+        """
+            This method creates the TranslationOperator of a SubchannelGeometry.
+
+        :param subchannel_geometry: SubchannelGeometry
+        :return: TranslationOperator
+        """
+
+        weights = sparse.csr_matrix(subchannel_geometry.rod_channel)
+        weights = sparse.diags(1 / np.asarray(weights.sum(axis=1)).ravel()) @ weights
+
+        return cls(weights)
+
+    @property
+    def rods(self):
+        return self.weights.shape[0]
+
+    @property
+    def channels(self):
+        return self.weights.shape[1]
+
+    def to_channels(self, rod_values):
+
+        """
+            This method distributes extensive rod values (such as power) to the channels. The
+        total is conserved.
+
+        :param rod_values: array of (rods) or (rods x axial levels)
+        :return: array of (channels) or (channels x axial levels)
+        """
+
+        return self.transposed @ rod_values
+
+    def to_rods(self, channel_values):
+
+        """
+            This method averages intensive channel values (such as coolant temperature or density)
+        around every rod.
+
+        :param channel_values: array of (channels) or (channels x axial levels)
+        :return: array of (rods) or (rods x axial levels)
+        """
+
+        return self.weights @ channel_values
+
+
+@timed('mapping.gather_rod_power')
+def gather_rod_power(geometry):
+
+    """
+        This function returns the power of every lattice position (row-major) at every axial
+    level of an ExpandedGeometry, as the (rods x axial levels) input of to_channels. Symmetric
+    positions get the power of their shared rod, empty positions get 0.
+
+    :param geometry: ExpandedGeometry
+    :return: 2D array of float
+    """
+
+    position_rods = geometry.position_rods()
+    rod_power = geometry.node_table.rod_power()
+
+    return np.where(position_rods >= 0, rod_power[np.maximum(position_rods, 0)], 0.0)
+
+
+@timed('mapping.scatter_to_nodes')
+def scatter_to_nodes(geometry, rod_values, field):
+
+    """
+        This function writes the (rods x axial levels) output of to_rods into a field of the
+    node_table of an ExpandedGeometry: every node gets the value of its rod. The rod of symmetric
+    positions gets the average of their values.
+
+    :param geometry: ExpandedGeometry
+    :param rod_values: 2D array of float
+    :param field: str, 'temperature' or 'density' for example
+    """
+
+    position_rods = geometry.position_rods().ravel()
+    stored = position_rods >= 0
+    rods = geometry.node_table.rods
+
+    totals = np.bincount(position_rods[stored], weights=np.asarray(rod_values).ravel()[stored], minlength=rods)
+    counts = np.bincount(position_rods[stored], minlength=rods)
+
+    values = totals / np.maximum(counts, 1)
+    node_rods = geometry.node_table.rod
+    owned = (node_rods >= 0) & (counts[np.maximum(node_rods, 0)] > 0)
+
+    getattr(geometry.node_table, field)[owned] = values[node_rods[owned]]
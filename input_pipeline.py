@@ -0,0 +1,251 @@
+"""
+    This module is responsible for reading the input of a calculation.
+
+    Inputs keep the format of input_file.py, plain assignments of Python literals, but they are
+never imported nor executed: the file is parsed once, every statement must be a
+"name = literal" assignment, and the values are validated and merged over the defaults (by
+dictionary unpacking, user values win).
+
+    The geometry part of the input (pin_types, layout, axial_nodes, symmetry) is expanded into
+the full core, and the expanded geometry is stored as a binary artifact (1 .npy file per array)
+in a cache directory, under the hash of the geometry input. A later run with the same geometry
+memory-maps the artifact instead of expanding the geometry again.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from composition_table import CompositionTable
+from geometry_starter import ExpandedGeometry, PinTemplate, SimplifiedGeometry, pin_type
+from node_table import NodeTable
+
+artifact_version = 1
+
+defaults = {'temperature': 565, 'density': 10270,
+            'radial_nodes': (3, 1, 1),
+            'neutronics_solver': 'wims11', 'XS_library': 'jeff3.12', 'resonance': None,
+            'condense_energy_groups': 22, 'neutronics_method': None,
+            'monk_neutron_sampling': 20000, 'monk_settling_stages': 10, 'monk_actual_stages': 1000,
+            'monk_stdv': 0.0001,
+            'th_solver': 'cobraen', 'begins_with': 'thermal-hydraulics',
+            'pin_types': None, 'layout': None, 'axial_nodes': 1, 'symmetry': 'full'}
+
+choices = {'neutronics_solver': ('wims11', 'monk'),
+           'resonance': ('full', 'partial', None),
+           'th_solver': ('cobraen', ),
+           'begins_with': ('thermal-hydraulics', 'neutronics'),
+           'symmetry': SimplifiedGeometry.symmetries}
+
+# solvers with multiple methods have no default method: it MUST be given
+multiple_method_solvers = ('wims11', )
+
+geometry_keys = ('pin_types', 'layout', 'axial_nodes', 'symmetry')
+
+
+class InputError(ValueError):
+
+    """This exception is raised for inputs that cannot be parsed or are not valid"""
+
+
+def parse_input(path):
+
+    """
+        This function parses an input file without executing it. Only assignments of literals
+    (numbers, strings, tuples, lists, dictionaries, None...) to names are allowed.
+
+    :param path: str
+    :return: dictionary of the values by name
+    """
+
+    with open(path) as input_file:
+        tree = ast.parse(input_file.read(), filename=path)
+
+    values = {}
+
+    for statement in tree.body:
+        if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name)):
+            raise InputError('{}:{}: only "name = value" statements are allowed'.format(path, statement.lineno))
+
+        try:
+            values[statement.targets[0].id] = ast.literal_eval(statement.value)
+        except ValueError:
+            raise InputError('{}:{}: the value of {} is not a literal'.format(path, statement.lineno,
+                                                                              statement.targets[0].id)) from None
+
+    return values
+
+
+def validate(user_values):
+
+    """
+        This function merges the user values over the defaults and validates the result.
+
+    :param user_values: dictionary
+    :return: dictionary of the parameters
+    """
+
+    unknown = set(user_values) - set(defaults)
+
+    if unknown:
+        raise InputError('unknown parameters: {}'.format(', '.join(sorted(unknown))))
+
+    parameters = {**defaults, **user_values}  # dictionary unpacking
+
+    for name, allowed in choices.items():
+        if parameters[name] not in allowed:
+            raise InputError('{} must be one of {}'.format(name, allowed))
+
+    if parameters['neutronics_solver'] in multiple_method_solvers and parameters['neutronics_method'] is None:
+        raise InputError('{} has multiple methods, neutronics_method must be given'
+                         .format(parameters['neutronics_solver']))
+
+    radial_nodes = parameters['radial_nodes']
+
+    if not (isinstance(radial_nodes, tuple) and radial_nodes
+            and all(isinstance(nodes, int) and nodes > 0 for nodes in radial_nodes)):
+        raise InputError('radial_nodes must be a tuple of positive integers')
+
+    if not (isinstance(parameters['axial_nodes'], int) and parameters['axial_nodes'] > 0):
+        raise InputError('axial_nodes must be a positive integer')
+
+    if (parameters['pin_types'] is None) != (parameters['layout'] is None):
+        raise InputError('pin_types and layout must be given together')
+
+    if parameters['pin_types'] is not None:
+        for name, pin in parameters['pin_types'].items():
+            if set(pin) != set(pin_type._fields):
+                raise InputError('pin type {} must have exactly the fields {}'.format(name, pin_type._fields))
+
+            if not (len(pin['outer_radii']) == len(pin['densities']) == len(pin['temperatures'])
+                    == len(pin['compositions']) == len(pin['radial_nodes'])):
+                raise InputError('pin type {} must have the same number of every element property'.format(name))
+
+    return parameters
+
+
+def geometry_hash(parameters):
+
+    """
+        This function returns the hash of the geometry part of the parameters, which is the
+    name of the expanded geometry artifact.
+
+    :param parameters: dictionary
+    :return: str
+    """
+
+    geometry = {key: parameters[key] for key in geometry_keys}
+    geometry['artifact_version'] = artifact_version
+
+    return hashlib.sha256(json.dumps(geometry, sort_keys=True).encode()).hexdigest()
+
+
+def simplified_geometry(parameters):
+
+    """This function returns the SimplifiedGeometry described by the parameters"""
+
+    pin_types = {name: pin_type(**pin) for name, pin in parameters['pin_types'].items()}
+
+    return SimplifiedGeometry(pin_types, parameters['layout'], parameters['axial_nodes'], parameters['symmetry'])
+
+
+def save_geometry(directory, geometry):
+
+    """
+        This function stores a (materialized) ExpandedGeometry as a directory of .npy files. The
+    directory is written under a temporary name and renamed at the end, so a partial artifact is
+    never seen by other runs.
+
+    :param directory: str
+    :param geometry: ExpandedGeometry
+    """
+
+    arrays = {'cell_index': geometry.cell_index, 'cell_types': geometry.cell_types,
+              'rod_cells': geometry.rod_cells()}
+    arrays.update(('node_' + field, array) for field, array in geometry.node_table.to_arrays().items())
+    arrays.update(('composition_' + name, array)
+                  for name, array in geometry.node_table.compositions.to_arrays().items())
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    temporary = tempfile.mkdtemp(dir=parent)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary, name + '.npy'), array)
+
+    with open(os.path.join(temporary, 'geometry.json'), 'w') as metadata:
+        json.dump({'axial_nodes': geometry.axial_nodes,
+                   'templates': [template.name for template in geometry.templates]}, metadata)
+
+    try:
+        os.rename(temporary, directory)
+    except OSError:
+        # another run stored the same artifact first
+        shutil.rmtree(temporary)
+
+
+def load_geometry(directory, parameters):
+
+    """
+        This function loads an ExpandedGeometry artifact. The arrays are memory-mapped
+    copy-on-write: pages are read from the file when used, and changes are never written back.
+
+    :param directory: str
+    :param parameters: dictionary, used to rebuild the (small) pin templates
+    :return: ExpandedGeometry
+    """
+
+    with open(os.path.join(directory, 'geometry.json')) as metadata:
+        metadata = json.load(metadata)
+
+    arrays = {name[:-len('.npy')]: np.load(os.path.join(directory, name), mmap_mode='c')
+              for name in os.listdir(directory) if name.endswith('.npy')}
+
+    compositions = CompositionTable.from_arrays({name[len('composition_'):]: array
+                                                 for name, array in arrays.items()
+                                                 if name.startswith('composition_')})
+    node_table = NodeTable.from_arrays({name[len('node_'):]: array for name, array in arrays.items()
+                                        if name.startswith('node_')}, compositions)
+
+    templates = [PinTemplate(name, pin_type(**parameters['pin_types'][name])) for name in metadata['templates']]
+
+    return ExpandedGeometry(templates, arrays['cell_index'], arrays['cell_types'], metadata['axial_nodes'],
+                            node_table=node_table, rod_cells=arrays['rod_cells'])
+
+
+def load_input(path, cache_directory=None):
+
+    """
+        This function reads an input file and, if it describes a geometry, returns its
+    materialized ExpandedGeometry: from the artifact cache if the same geometry was expanded
+    before, otherwise expanding it (and storing it in the cache).
+
+    :param path: str
+    :param cache_directory: str, directory of the artifacts (None disables the cache)
+    :return: dictionary of the parameters, ExpandedGeometry (or None)
+    """
+
+    parameters = validate(parse_input(path))
+
+    if parameters['pin_types'] is None:
+        return parameters, None
+
+    if cache_directory is None:
+        geometry = simplified_geometry(parameters).expand_geometry()
+        geometry.materialize()
+        return parameters, geometry
+
+    directory = os.path.join(cache_directory, geometry_hash(parameters))
+
+    if not os.path.isdir(directory):
+        geometry = simplified_geometry(parameters).expand_geometry()
+        geometry.materialize()
+        save_geometry(directory, geometry)
+
+    return parameters, load_geometry(directory, parameters)
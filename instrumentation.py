@@ -0,0 +1,327 @@
+"""
+    This module is responsible for measuring where the time of a coupled run goes: geometry
+expansion, nodalization, construction of Fuel and RadialElement objects, power updates,
+iteration persistence, solver calls, field mapping...
+
+    The measured code is marked with named timers (the timed decorator or the timer context
+manager) and counters. The module-level instrumentation is disabled by default, and then a
+timer costs 1 attribute check and a counter costs 1 function call: nothing is recorded.
+
+    When enabled, every timer records 1 event (name, iteration, thread, start and duration),
+and every iteration of the coupling (next_iteration) records the memory high-water marks of
+the process (maximum resident set size and, if memory tracing is on, the tracemalloc peak of
+the iteration). Worker processes record their own events (recording) and send them back to be
+merged into the instrumentation of the parent process. Events and memory marks are exported as
+a Chrome trace (JSON), which opens in chrome://tracing or https://ui.perfetto.dev, together with
+the per-iteration timing tables.
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def max_resident_memory():
+
+    """This function returns the maximum resident set size of the process so far in bytes (0 if unknown)"""
+
+    if resource is None:
+        return 0
+
+    # ru_maxrss is in kB on Linux but in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class _NullTimer(object):
+
+    """This class is the timer of disabled instrumentation: it does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _Timer(object):
+
+    """This class is a running timer: it records its event when it exits"""
+
+    __slots__ = ('instrumentation', 'name', 'arguments', 'start')
+
+    def __init__(self, instrumentation, name, arguments):
+
+        self.instrumentation = instrumentation
+        self.name = name
+        self.arguments = arguments
+
+    def __enter__(self):
+
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *exception):
+
+        stop = time.perf_counter()
+        instrumentation = self.instrumentation
+        instrumentation.events.append((self.name, instrumentation.iteration, threading.get_ident(),
+                                       self.start, stop - self.start, self.arguments))
+
+        return False
+
+
+class Instrumentation(object):
+
+    """
+        This class collects timers, counters and memory high-water marks.
+
+    Attributes:
+        - enabled: a bool, False makes every timer and counter a no-op
+        - trace_memory: a bool, True traces the Python (and NumPy) allocations with tracemalloc
+        - iteration: an int of the current iteration
+        - events: a list of (name, iteration, thread, start, duration, arguments) of the timers
+        - counters: a dictionary by iteration of dictionaries of counts by name
+        - memory: a list of (iteration, time, maximum resident memory, tracemalloc peak) in bytes
+    """
+
+    def __init__(self):
+
+        self.enabled = False
+        self.trace_memory = False
+        self._started_tracing = False  # whether tracemalloc was started by enable (and is stopped by disable)
+        self.reset()
+
+    def reset(self):
+
+        """This method discards everything recorded"""
+
+        self.iteration = 0
+        self.events = []
+        self.counters = {}
+        self.memory = []
+        self._origin = time.perf_counter()
+
+    def enable(self, trace_memory=False):
+
+        """
+            This method starts recording.
+
+        :param trace_memory: bool, also trace the allocations (which slows every allocation down)
+        """
+
+        self.enabled = True
+        self.trace_memory = trace_memory
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def disable(self):
+
+        """This method stops recording (what was recorded is kept), and memory tracing if enable started it"""
+
+        self.enabled = False
+        self.trace_memory = False
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def recording(self, enabled=True):
+
+        """
+            This method records the events of a block apart from the others, in the list it
+        yields: the block of a worker process, for example, whose events are sent back to be
+        merged into the instrumentation of the parent process.
+
+        :param enabled: bool, False records nothing
+        :return: context manager yielding a list of events
+        """
+
+        saved = self.enabled, self.events
+        self.enabled, self.events = enabled, []
+
+        try:
+            yield self.events
+        finally:
+            self.enabled, self.events = saved
+
+    def merge(self, events, process=None):
+
+        """
+            This method adds the events recorded by another process (see recording) to the
+        current iteration. Times of processes of the same machine are comparable.
+
+        :param events: list of events
+        :param process: int, process id of the events (shown by the trace viewer)
+        """
+
+        if not self.enabled:
+            return
+
+        for name, _, thread, start, duration, arguments in events:
+            if process is not None:
+                arguments = dict(arguments, process=process)
+
+            self.events.append((name, self.iteration, thread, start, duration, arguments))
+
+    def timer(self, name, **arguments):
+
+        """
+            This method returns a context manager timing its block under a name.
+
+        :param name: str
+        :param arguments: values stored with the event (shown by the trace viewer)
+        :return: context manager
+        """
+
+        if not self.enabled:
+            return _null_timer
+
+        return _Timer(self, name, arguments)
+
+    def count(self, name, value=1):
+
+        """This method adds value to the counter name of the current iteration"""
+
+        if self.enabled:
+            counters = self.counters.setdefault(self.iteration, {})
+            counters[name] = counters.get(name, 0) + value
+
+    def next_iteration(self):
+
+        """This method records the memory high-water marks of the current iteration and starts the next one"""
+
+        if not self.enabled:
+            return
+
+        peak = 0
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+
+        self.memory.append((self.iteration, time.perf_counter(), max_resident_memory(), peak))
+        self.iteration += 1
+
+    def table(self):
+
+        """
+            This method returns the per-iteration timing table: for every iteration and timer
+        name, the number of calls, the total and the maximum time in s.
+
+        :return: dictionary by iteration of dictionaries of (calls, total, maximum) by name
+        """
+
+        table = {}
+
+        for name, iteration, _, _, duration, _ in self.events:
+            rows = table.setdefault(iteration, {})
+            calls, total, maximum = rows.get(name, (0, 0.0, 0.0))
+            rows[name] = (calls + 1, total + duration, max(maximum, duration))
+
+        return table
+
+    def report(self):
+
+        """This method returns the timing table and the counters as text"""
+
+        lines = []
+        table = self.table()
+
+        for iteration in sorted(set(table) | set(self.counters)):
+            lines.append('iteration {}'.format(iteration))
+
+            for name, (calls, total, maximum) in sorted(table.get(iteration, {}).items(), key=lambda item: -item[1][1]):
+                lines.append('    {:<40} {:>8d} calls {:>12.6f} s total {:>12.6f} s max'.format(name, calls,
+                                                                                               total, maximum))
+
+            for name, value in sorted(self.counters.get(iteration, {}).items()):
+                lines.append('    {:<40} {:>8}'.format(name, value))
+
+        return '\n'.join(lines)
+
+    def export(self, path):
+
+        """
+            This method writes everything recorded as a Chrome trace file (JSON): timers are
+        complete events, memory marks are counter events and every iteration end is an instant
+        event. The timing tables and counters are stored under "iterations".
+
+        :param path: str
+        """
+
+        process = os.getpid()
+        events = []
+
+        for name, iteration, thread, start, duration, arguments in self.events:
+            events.append({'name': name, 'cat': name.split('.')[0], 'ph': 'X',
+                           'pid': arguments.get('process', process), 'tid': thread,
+                           'ts': (start - self._origin) * 1E6, 'dur': duration * 1E6,
+                           'args': dict(arguments, iteration=iteration)})
+
+        for iteration, moment, resident, peak in self.memory:
+            timestamp = (moment - self._origin) * 1E6
+            events.append({'name': 'memory', 'ph': 'C', 'pid': process, 'ts': timestamp,
+                           'args': {'max_resident_bytes': resident, 'traced_peak_bytes': peak}})
+            events.append({'name': 'iteration {}'.format(iteration), 'ph': 'i', 's': 'g', 'pid': process,
+                           'ts': timestamp})
+
+        table = self.table()
+        iterations = {}
+
+        for iteration in sorted(set(table) | set(self.counters)):
+            iterations[str(iteration)] = {'timers': {name: {'calls': calls, 'total': total, 'max': maximum}
+                                                     for name, (calls, total, maximum)
+                                                     in table.get(iteration, {}).items()},
+                                          'counters': self.counters.get(iteration, {})}
+
+        with open(path, 'w') as trace:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'iterations': iterations,
+                       'memory': [{'iteration': iteration, 'max_resident_bytes': resident, 'traced_peak_bytes': peak}
+                                  for iteration, _, resident, peak in self.memory]}, trace)
+
+
+instrumentation = Instrumentation()
+
+
+def timed(name):
+
+    """
+        This decorator times every call of a function under a name with the module-level
+    instrumentation. While the instrumentation is disabled the function is called directly.
+
+    :param name: str
+    :return: decorator
+    """
+
+    def decorator(function):
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return function(*args, **kwargs)
+
+            with _Timer(instrumentation, name, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,240 @@
+"""
+    This module implements Proposal 2 of geometry_rod_centered: only 2 states of the reactor
+are kept in memory, 1 for the current iteration and 1 for the next, and every finished
+iteration is dumped into an HDF5 file to release memory.
+
+    The 2 states are preallocated buffers that swap in place (no deepcopy of the geometry).
+The current state is the one seen through the NodeTable (and therefore through the Fuel,
+RadialElement and RadialNode views), while solvers write the next state into the next buffers.
+When an iteration finishes, its buffers become the current state and are written to HDF5 by a
+background thread, chunked and compressed, while the following iteration runs.
+
+    Past iterations are read back lazily. Compressed datasets (the default, gzip) are h5py
+datasets, only read (chunk by chunk) when sliced; memory mapping needs a store created with
+compression=None, whose datasets are memory-mapped directly from the file.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+
+from instrumentation import timed
+
+
+class IterationStore(object):
+
+    """
+        This class keeps the current and next iteration states of a NodeTable and the HDF5
+    file of past iterations.
+
+    Attributes:
+        - table: the NodeTable whose columns hold the current state
+        - fields: the columns of the table that change from iteration to iteration
+        - next: a dictionary of the arrays where the next state is written (initialized with the
+          current state, see prime)
+        - iteration: an int of the number of the current iteration
+    """
+
+    def __init__(self, path, node_table, fields=('temperature', 'density', 'power'), *,
+                 compression='gzip', compression_opts=4, chunk_nodes=65536):
+
+        """
+            Initializes the IterationStore object and creates (or truncates) its HDF5 file.
+
+        :param path: str, path of the HDF5 file
+        :param node_table: NodeTable
+        :param fields: tuple of str
+        :param compression: str or None, HDF5 compression filter (None is needed for memory-mapped reads)
+        :param compression_opts: int, compression level
+        :param chunk_nodes: int, number of nodes in each HDF5 chunk
+        """
+
+        self.table = node_table
+        self.fields = tuple(fields)
+        self.iteration = 0
+
+        self.compression = compression
+        self.compression_opts = compression_opts if compression == 'gzip' else None
+        self.chunk_nodes = chunk_nodes
+
+        self._next = {}
+        self._primed = False
+
+        self._file = h5py.File(path, 'w')
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    @property
+    def next(self):
+
+        if not self._primed or self._stale():
+            self.prime()
+
+        return {field: array[:self.table.size] for field, array in self._next.items()}
+
+    def _stale(self):
+
+        """
+            This method tells whether the next buffers must be allocated again: the table grew
+        since they were allocated, or a swap gave the store a column that it does not own (memory
+        of a shared segment or of a memory-mapped file, which may go away with its owner).
+        """
+
+        return any(array.size != self.table.capacity or array.base is not None for array in self._next.values()) \
+            or len(self._next) != len(self.fields)
+
+    def prime(self):
+
+        """
+            This method initializes the next state with the values of the current state,
+        allocating the next buffers again if the table grew. It is called by advance (and on the
+        first use of next), so solvers always start from the current state.
+        """
+
+        if self._stale():
+            # the buffer being written in the background may be 1 of those replaced
+            self.wait()
+            self._next = {field: np.zeros(self.table.capacity, dtype=getattr(self.table, field).dtype)
+                          for field in self.fields}
+
+        for field in self.fields:
+            np.copyto(self._next[field][:self.table.size], getattr(self.table, field))
+
+        self._primed = True
+
+    @timed('persistence.advance')
+    def advance(self):
+
+        """
+            This method finishes the current iteration: the next state becomes the current state
+        (a swap of buffers, not a copy) and is written to the HDF5 file in the background.
+        The previous current state becomes the buffer for the next state.
+
+        :return: int, the number of the new current iteration
+        """
+
+        # the buffer that is about to receive the next state is still being written
+        self.wait()
+
+        if not self._primed or self._stale():
+            # nothing was written to the next state (or its buffers are stale): it is the current state
+            self.prime()
+
+        for field in self.fields:
+            self._next[field] = self.table.swap_column(field, self._next[field])
+
+        self.iteration += 1
+        self._pending = self._writer.submit(self._write, self.iteration,
+                                            {field: getattr(self.table, field) for field in self.fields})
+
+        # the next iteration starts from the state just finished
+        self.prime()
+
+        return self.iteration
+
+    def save_current(self):
+
+        """This method writes the current state to the HDF5 file (for instance the initial guess)"""
+
+        self.wait()
+        self._pending = self._writer.submit(self._write, self.iteration,
+                                            {field: getattr(self.table, field) for field in self.fields})
+
+    def resume(self, iteration):
+
+        """
+            This method continues the iterations from a state restored into the table (from a
+        checkpoint, for example): the state of the table becomes the current state of iteration,
+        the next state starts from it and it is written to the HDF5 file.
+
+        :param iteration: int, the number of the restored iteration
+        """
+
+        self.wait()
+        self.iteration = iteration
+        self.prime()
+        self.save_current()
+
+    @timed('persistence.wait')
+    def wait(self):
+
+        """This method blocks until the background write (if any) is finished"""
+
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    @timed('persistence.write')
+    def _write(self, iteration, arrays):
+
+        """This method writes one iteration to the HDF5 file (runs in the writer thread)"""
+
+        group = self._file.require_group(self._group_name(iteration))
+        group.attrs['iteration'] = iteration
+
+        for field, array in arrays.items():
+            if field in group:
+                del group[field]
+
+            if self.compression is None:
+                group.create_dataset(field, data=array)
+            else:
+                group.create_dataset(field, data=array, chunks=(max(min(self.chunk_nodes, array.size), 1), ),
+                                     compression=self.compression, compression_opts=self.compression_opts,
+                                     shuffle=True)
+
+        self._file.flush()
+
+    @staticmethod
+    def _group_name(iteration):
+
+        return 'iteration_{:06d}'.format(iteration)
+
+    def iterations(self):
+
+        """This method returns a list of the numbers of the iterations stored in the HDF5 file"""
+
+        self.wait()
+
+        return sorted(int(group.attrs['iteration']) for group in self._file.values())
+
+    def read(self, iteration, field):
+
+        """
+            This method returns a past iteration field without loading it into memory. Only a
+        store created with compression=None returns memory-mapped arrays (numpy.memmap); with
+        compression (the default) it returns h5py datasets, which are only read (chunk by chunk)
+        when sliced.
+
+        :param iteration: int
+        :param field: str
+        :return: numpy.memmap or h5py.Dataset
+        """
+
+        self.wait()
+
+        dataset = self._file[self._group_name(iteration)][field]
+        offset = dataset.id.get_offset()
+
+        if dataset.compression is None and dataset.chunks is None and offset is not None:
+            return np.memmap(self._file.filename, mode='r', dtype=dataset.dtype,
+                             shape=dataset.shape, offset=offset)
+
+        return dataset
+
+    def close(self):
+
+        """This method finishes the pending write and closes the HDF5 file"""
+
+        self.wait()
+        self._writer.shutdown()
+        self._file.close()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exception):
+
+        self.close()
@@ -11,6 +11,10 @@ other code in order to increase readability and understanding.
 
 from math import sqrt
 
+import numpy as np
+
+from instrumentation import timed
+
 
 def equal_volume(outer_radius, radial_layers, *, inner_radius=0.0):
 
@@ -78,6 +82,7 @@ def equal_thickness(outer_radius, radial_layers, *, inner_radius=0.0):
         inner_radius += interval_constant
 
 
+@timed('layering.nodalize')
 def nodalize(outer_radius, radial_nodes, discretizer, *, inner_radius=0.0):
 
     """
@@ -137,3 +142,163 @@ def volume_averaged(outer_radius, inner_radius):
 
     return (2 / 3) * ((outer_radius ** 2 + outer_radius * inner_radius + inner_radius ** 2)
                       / (outer_radius + inner_radius))
+
+
+def _layer_positions(radial_layers):
+
+    """
+        This function receives the number of layers of each cylinder and returns, for every
+    layer of every cylinder (flattened), the index of its cylinder and its position inside the
+    cylinder, together with the offsets of each cylinder in the flat arrays. Every cylinder must
+    have at least 1 layer.
+
+    :type radial_layers: array of int
+    :return: array of int, array of int, array of int
+    """
+
+    radial_layers = np.asarray(radial_layers, dtype=np.int64)
+
+    if np.any(radial_layers < 1):
+        raise ValueError('every cylinder needs at least 1 layer, got {}'.format(radial_layers.tolist()))
+
+    offsets = np.zeros(radial_layers.size + 1, dtype=np.int64)
+    np.cumsum(radial_layers, out=offsets[1:])
+
+    cylinders = np.repeat(np.arange(radial_layers.size), radial_layers)
+    positions = np.arange(offsets[-1]) - offsets[cylinders]
+
+    return cylinders, positions, offsets
+
+
+def equal_volume_batch(outer_radii, radial_layers, *, inner_radii=0.0):
+
+    """
+        Batched version of equal_volume: divides many cylinders at once into equal-volume
+    concentric cylinders, each with its own number of layers (ragged counts such as (3, 1, 1)
+    are allowed).
+
+        Layer k of a cylinder has inner radius sqrt(r_i**2 + k * (r_o**2 - r_i**2) / n), so all
+    inner radii are computed in one vectorized operation instead of one generator per cylinder.
+
+    :type outer_radii: array of float
+    :type radial_layers: array of int
+    :type inner_radii: array of float or float
+    :return: flat array of inner radii of every layer and array of the offsets of each cylinder
+    """
+
+    cylinders, positions, offsets = _layer_positions(radial_layers)
+
+    outer_radii, inner_radii = np.broadcast_arrays(np.asarray(outer_radii, dtype=np.float64),
+                                                   np.asarray(inner_radii, dtype=np.float64))
+    interval_constant = (outer_radii ** 2 - inner_radii ** 2) / np.diff(offsets)
+
+    layer_inner_radii = np.sqrt(inner_radii[cylinders] ** 2 + positions * interval_constant[cylinders])
+
+    return layer_inner_radii, offsets
+
+
+def equal_thickness_batch(outer_radii, radial_layers, *, inner_radii=0.0):
+
+    """
+        Batched version of equal_thickness: divides many cylinders at once into
+    equal-thickness concentric cylinders, each with its own number of layers.
+
+    :type outer_radii: array of float
+    :type radial_layers: array of int
+    :type inner_radii: array of float or float
+    :return: flat array of inner radii of every layer and array of the offsets of each cylinder
+    """
+
+    cylinders, positions, offsets = _layer_positions(radial_layers)
+
+    outer_radii, inner_radii = np.broadcast_arrays(np.asarray(outer_radii, dtype=np.float64),
+                                                   np.asarray(inner_radii, dtype=np.float64))
+    interval_constant = (outer_radii - inner_radii) / np.diff(offsets)
+
+    layer_inner_radii = inner_radii[cylinders] + positions * interval_constant[cylinders]
+
+    return layer_inner_radii, offsets
+
+
+batch_discretizers = {equal_volume: equal_volume_batch,
+                      equal_thickness: equal_thickness_batch}
+
+
+@timed('layering.nodalize_batch')
+def nodalize_batch(outer_radii, radial_nodes, discretizer, *, inner_radii=0.0):
+
+    """
+        Batched version of nodalize: divides many cylinders (all elements of an assembly or
+    of a whole core) into concentric cylindrical nodes in a single call.
+
+        The discretizer may be either a scalar discretizer (equal_volume or equal_thickness),
+    which is then replaced by its batched version, or a batched discretizer directly.
+
+        It returns 3 flat arrays: the inner radii and the outer radii of every node, and the
+    offsets of each cylinder, so that the nodes of cylinder i are the items
+    offsets[i]:offsets[i + 1] of the radii arrays. The outer radius of a node is the inner radius
+    of the next node of the same cylinder, except for the last node, which has the outer radius
+    of its cylinder.
+
+    Example case:
+
+    nodalize_batch((0.34, 0.4096, 0.4106), (3, 1, 1), equal_volume, inner_radii=(0.15, 0.34, 0.4096))
+
+    gives the same nodes as the 3 calls to nodalize of the same cylinders, with offsets (0, 3, 4, 5).
+
+    :param outer_radii: array of float
+    :param radial_nodes: array of int
+    :param discretizer: function
+    :param inner_radii: array of float or float
+    :return: array, array, array
+    """
+
+    if np.any(np.asarray(radial_nodes) < 1):
+        raise ValueError('every cylinder needs at least 1 node, got {}'.format(np.asarray(radial_nodes).tolist()))
+
+    discretizer = batch_discretizers.get(discretizer, discretizer)
+
+    outer_radii = np.asarray(outer_radii, dtype=np.float64)
+
+    node_inner_radii, offsets = discretizer(outer_radii, radial_nodes, inner_radii=inner_radii)
+
+    node_outer_radii = np.empty_like(node_inner_radii)
+    node_outer_radii[:-1] = node_inner_radii[1:]
+    node_outer_radii[offsets[1:] - 1] = np.broadcast_to(outer_radii, (offsets.size - 1, ))
+
+    return node_inner_radii, node_outer_radii, offsets
+
+
+def axialize(height, axial_nodes, *, bottom=0.0):
+
+    """
+        This function divides a rod of some height into equal-length axial nodes (a 1D version of
+    equal-thickness nodalization). It returns 2 arrays: the bottom and the top of every node, in
+    order from the bottom of the rod to its top.
+
+    :param height: float
+    :param axial_nodes: int
+    :param bottom: float
+    :return: array, array
+    """
+
+    bottoms, tops, _ = nodalize_batch((bottom + height, ), (axial_nodes, ), equal_thickness_batch,
+                                      inner_radii=(bottom, ))
+
+    return bottoms, tops
+
+
+def axial_power(channel_power, axial_nodes):
+
+    """
+        This function splits the power of channels (or rods) into equal-length axial nodes with a
+    flat profile: a channel of power X and Y nodes gets X/Y power in each node.
+
+    :param channel_power: float or array of float
+    :param axial_nodes: int
+    :return: array of (channels x axial nodes)
+    """
+
+    channel_power = np.atleast_1d(np.asarray(channel_power, dtype=np.float64))
+
+    return np.repeat(channel_power[:, np.newaxis] / axial_nodes, axial_nodes, axis=1)
@@ -31,4 +31,32 @@ Uranium_233 = Atom(mass(233.0396355, 0.0000029), 92, 141)
 Uranium_234 = Atom(mass(234.0409523, 0.0000019), 92, 142)
 Uranium_235 = Atom(mass(235.0439301, 0.0000019), 92, 143)
 Uranium_236 = Atom(mass(236.0455682, 0.0000019), 92, 144)
-Uranium_238 = Atom(mass(238.0507884, 0.0000020), 82, 146)
+Uranium_238 = Atom(mass(238.0507884, 0.0000020), 92, 146)
+
+Boron_10 = Atom(mass(10.0129370, 0.0000004), 5, 5)
+Boron_11 = Atom(mass(11.0093054, 0.0000004), 5, 6)
+Oxygen_16 = Atom(mass(15.9949146, 0.0000002), 8, 8)
+Zirconium_90 = Atom(mass(89.9046977, 0.0000020), 40, 50)
+Zirconium_91 = Atom(mass(90.9056396, 0.0000020), 40, 51)
+Zirconium_92 = Atom(mass(91.9050347, 0.0000020), 40, 52)
+Zirconium_94 = Atom(mass(93.9063108, 0.0000020), 40, 54)
+Zirconium_96 = Atom(mass(95.9082714, 0.0000020), 40, 56)
+Thorium_232 = Atom(mass(232.0380553, 0.0000021), 90, 142)
+
+avogadro = 6.022140857E23
+
+# nuclides by name, in the order of the columns of the composition table
+
+nuclides = {'B10': Boron_10, 'B11': Boron_11, 'O16': Oxygen_16,
+            'Zr90': Zirconium_90, 'Zr91': Zirconium_91, 'Zr92': Zirconium_92,
+            'Zr94': Zirconium_94, 'Zr96': Zirconium_96, 'Th232': Thorium_232,
+            'U233': Uranium_233, 'U234': Uranium_234, 'U235': Uranium_235,
+            'U236': Uranium_236, 'U238': Uranium_238}
+
+# compounds as number of atoms of each nuclide per formula unit (natural isotopic abundances)
+
+compounds = {'UO2': {'U234': 0.000054, 'U235': 0.007204, 'U238': 0.992742, 'O16': 2.0},
+             'Th': {'Th232': 1.0},
+             'ThO2': {'Th232': 1.0, 'O16': 2.0},
+             'ZrB2': {'Zr90': 0.5145, 'Zr91': 0.1122, 'Zr92': 0.1715, 'Zr94': 0.1738, 'Zr96': 0.0280,
+                      'B10': 2 * 0.199, 'B11': 2 * 0.801}}
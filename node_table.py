@@ -0,0 +1,352 @@
+"""
+    This module is responsible for the contiguous storage of every radial node of a core.
+
+    Instead of having one Python object per node, with its own dictionary of attributes,
+all nodes of a core live as rows of a single table of NumPy arrays (a structure of arrays).
+The classes in geometry_rod_centered (Fuel, RadialElement and RadialNode) are then only
+lightweight views into this table, and quantities such as the power of every element or of
+every rod of the core are computed with a single vectorized reduction.
+
+    Nodes of the same element are always stored contiguously, and so are the elements of the
+same rod. Rows are only appended, never removed, so a view (start and stop row) stays valid
+for the whole life of the table.
+"""
+
+import numpy as np
+
+from composition_table import CompositionTable
+
+
+class NodeTable(object):
+
+    """
+        This class stores the state of radial nodes as contiguous NumPy arrays.
+
+    Attributes:
+        - inner_radius: array of inner radii in m
+        - outer_radius: array of outer radii in m
+        - density: array of densities in kg/m3
+        - temperature: array of temperatures in K
+        - power: array of power generation in W
+        - composition: array of the row of each node in the composition table
+        - element: array of the element index of each node (-1 if the node has no element)
+        - rod: array of the rod index of each node (-1 if the node has no rod)
+        - compositions: the CompositionTable of the distinct compositions of the nodes
+    """
+
+    float_fields = ('inner_radius', 'outer_radius', 'density', 'temperature', 'power')
+    index_fields = ('composition', 'element', 'rod')
+
+    def __init__(self, capacity=64):
+
+        """
+            Initializes an empty NodeTable object.
+
+        :param capacity: int, number of nodes preallocated (the table grows as needed)
+        """
+
+        self.size = 0
+        self.elements = 0
+        self.rods = 0
+
+        self.compositions = CompositionTable()
+
+        self._capacity = max(int(capacity), 1)
+        self._arrays = {}
+
+        for field in self.float_fields:
+            self._arrays[field] = np.zeros(self._capacity, dtype=np.float64)
+
+        for field in self.index_fields:
+            self._arrays[field] = np.full(self._capacity, -1, dtype=np.int32)
+
+    @classmethod
+    def from_arrays(cls, arrays, compositions):
+
+        """
+            This method creates a NodeTable using existing column arrays as its storage (for
+        example arrays memory-mapped from a file), without copying them.
+
+        :param arrays: dictionary of arrays by field, as returned by to_arrays
+        :param compositions: CompositionTable
+        :return: NodeTable
+        """
+
+        table = cls(1)
+        table.size = int(arrays['power'].size)
+        table._capacity = max(table.size, 1)
+        table._arrays = {field: arrays[field] for field in cls.float_fields + cls.index_fields}
+        table.elements = int(table.element.max(initial=-1)) + 1
+        table.rods = int(table.rod.max(initial=-1)) + 1
+        table.compositions = compositions
+
+        return table
+
+    def to_arrays(self):
+
+        """This method returns a dictionary of the used part of every column, by field"""
+
+        return {field: getattr(self, field) for field in self.float_fields + self.index_fields}
+
+    def __len__(self):
+
+        return self.size
+
+    def extract(self, start, stop):
+
+        """
+            This method returns a new NodeTable with a copy of the rows [start, stop) and of the
+        composition rows they use, and nothing else. Element and rod indices start again from 0.
+
+        :param start: int
+        :param stop: int
+        :return: NodeTable
+        """
+
+        nodes = stop - start
+        rows, composition = np.unique(self.composition[start:stop], return_inverse=True)
+
+        table = NodeTable(nodes)
+        table.compositions = self.compositions.subset(rows)
+
+        for field in self.float_fields:
+            table._arrays[field][:nodes] = getattr(self, field)[start:stop]
+
+        table._arrays['composition'][:nodes] = composition
+        table.compositions.acquire(composition)
+
+        for field in ('element', 'rod'):
+            owners = getattr(self, field)[start:stop]
+            owned = owners >= 0
+            table._arrays[field][:nodes][owned] = np.unique(owners[owned], return_inverse=True)[1]
+
+        table.size = nodes
+        table.elements = int(table.element.max(initial=-1)) + 1
+        table.rods = int(table.rod.max(initial=-1)) + 1
+
+        return table
+
+    def __getattr__(self, field):
+
+        """
+            Returns the used part of a column of the table. The returned array is a view,
+        therefore writing into it changes the table.
+        """
+
+        if field in NodeTable.float_fields or field in NodeTable.index_fields:
+            return self.__dict__['_arrays'][field][:self.size]
+
+        raise AttributeError(field)
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def _reserve(self, nodes):
+
+        """This method grows (doubling) the preallocated arrays to fit more nodes"""
+
+        required = self.size + nodes
+
+        if required <= self._capacity:
+            return
+
+        capacity = self._capacity
+
+        while capacity < required:
+            capacity *= 2
+
+        for field, array in self._arrays.items():
+            grown = np.full(capacity, 0.0 if field in self.float_fields else -1, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self._arrays[field] = grown
+
+        self._capacity = capacity
+
+    def column(self, field):
+
+        """
+            This method returns the storage of a column (with the capacity of the table), to tell
+        which array the table currently works on.
+
+        :param field: str
+        :return: numpy array
+        """
+
+        return self._arrays[field]
+
+    def swap_column(self, field, array):
+
+        """
+            This method replaces the storage of a column by array (which must have the capacity
+        of the table) and returns the previous storage, without copying any data.
+
+        :param field: str
+        :param array: numpy array
+        :return: numpy array
+        """
+
+        previous = self._arrays[field]
+
+        if array.shape != previous.shape or array.dtype != previous.dtype:
+            raise ValueError('array must have shape {} and dtype {}'.format(previous.shape, previous.dtype))
+
+        self._arrays[field] = array
+
+        return previous
+
+    def intern_composition(self, composition, density):
+
+        """
+            This method returns the row of a fresh composition in the composition table.
+        Equal compositions share the same row (at any density).
+
+        :param composition: dictionary
+        :param density: float
+        :return: int
+        """
+
+        return self.compositions.intern(composition, density)
+
+    def set_composition(self, nodes, composition):
+
+        """
+            This method points nodes at a fresh composition (at their current densities).
+
+        :param nodes: array of int
+        :param composition: dictionary
+        """
+
+        nodes = np.atleast_1d(nodes)
+        rows = [self.intern_composition(composition, density) for density in self.density[nodes]]
+
+        self.compositions.release(self.composition[nodes])
+        self.compositions.acquire(rows)
+        self.composition[nodes] = rows
+
+    def detach_compositions(self, nodes):
+
+        """
+            This method gives nodes composition rows of their own (copy-on-write), so that their
+        number densities can be changed without affecting other nodes, and returns the rows.
+
+        :param nodes: array of int
+        :return: array of int
+        """
+
+        nodes = np.atleast_1d(nodes)
+        self.composition[nodes] = self.compositions.detach(self.composition[nodes])
+
+        return self.composition[nodes]
+
+    def atombarn(self):
+
+        """This method returns the (nodes x nuclides) number densities of every node in atoms/barn-cm"""
+
+        return self.compositions.node_atombarn(self.composition, self.density)
+
+    def append_nodes(self, inner_radii, outer_radii, densities, temperatures, compositions):
+
+        """
+            This method appends nodes to the end of the table and returns the rows they
+        occupy as (start, stop).
+
+        :param inner_radii: iterable of float
+        :param outer_radii: iterable of float
+        :param densities: iterable of float
+        :param temperatures: iterable of float
+        :param compositions: iterable of dictionary
+        :return: int, int
+        """
+
+        inner_radii = np.asarray(inner_radii, dtype=np.float64)
+        nodes = inner_radii.size
+
+        self._reserve(nodes)
+
+        start = self.size
+        stop = start + nodes
+
+        self._arrays['inner_radius'][start:stop] = inner_radii
+        self._arrays['outer_radius'][start:stop] = outer_radii
+        self._arrays['density'][start:stop] = densities
+        self._arrays['temperature'][start:stop] = temperatures
+        self._arrays['power'][start:stop] = 0.0
+        self._arrays['composition'][start:stop] = [self.intern_composition(composition, density)
+                                                   for composition, density
+                                                   in zip(compositions, self._arrays['density'][start:stop])]
+        self.compositions.acquire(self._arrays['composition'][start:stop])
+
+        self.size = stop
+
+        return start, stop
+
+    def new_element(self, start, stop):
+
+        """
+            This method marks the rows [start, stop) as one element and returns its index.
+
+        :param start: int
+        :param stop: int
+        :return: int
+        """
+
+        self._arrays['element'][start:stop] = self.elements
+        self.elements += 1
+
+        return self.elements - 1
+
+    def new_rod(self, start, stop):
+
+        """
+            This method marks the rows [start, stop) as one rod and returns its index.
+
+        :param start: int
+        :param stop: int
+        :return: int
+        """
+
+        self._arrays['rod'][start:stop] = self.rods
+        self.rods += 1
+
+        return self.rods - 1
+
+    def rod_bounds(self):
+
+        """
+            This method returns 2 arrays: the first and the after-last row of every rod (the
+        nodes of a rod are contiguous).
+
+        :return: array of int, array of int
+        """
+
+        rods, starts, counts = np.unique(self.rod, return_index=True, return_counts=True)
+        owned = rods >= 0
+
+        return starts[owned], starts[owned] + counts[owned]
+
+    def element_power(self):
+
+        """This method returns an array with the power of every element in the table"""
+
+        return self._reduce(self.element, self.elements)
+
+    def rod_power(self):
+
+        """This method returns an array with the power of every rod in the table"""
+
+        return self._reduce(self.rod, self.rods)
+
+    def _reduce(self, owners, count):
+
+        """This method sums the power of the nodes of the same owner (element or rod)"""
+
+        owned = owners >= 0
+
+        return np.bincount(owners[owned], weights=self.power[owned], minlength=count)
+
+    def volume(self):
+
+        """This method returns an array with the volume per unit length of every node in m2"""
+
+        return np.pi * (self.outer_radius ** 2 - self.inner_radius ** 2)
@@ -0,0 +1,208 @@
+"""
+    This module is responsible for bringing the power computed by the neutronics solver into
+the nodes of the core.
+
+    After the flat initial profile (a channel of power X with Y equal length nodes has X/Y per
+node), the power of every node comes from the tallies of the neutronics solver. Monte Carlo
+solvers such as MONK write large tally files, with 1 line per tally region: the region number,
+the tallied power (or fission rate) and its standard deviation. Tally files are read in chunks
+of lines, each chunk parsed into an array at once, and the values are accumulated per region,
+so that neither the whole file nor any per-line Python object is ever held in memory.
+
+    Tally regions are coarser than (or equal to) nodes: an element, a rod, or a node. The map
+from regions to nodes is precomputed once (the region of every node and the fraction of the
+region volume in the node), so mapping a tally is 1 gather. The node powers are then normalized
+to the total core power and under-relaxed against the power of the previous iteration. Tallies of
+regions without nodes (outside the modelled fuel, for example) are not part of the node power,
+so they are left out of the normalization too.
+"""
+
+from itertools import islice
+
+import numpy as np
+
+
+def read_tally_chunks(path, chunk_lines=65536, columns=None, comments='#'):
+
+    """
+        This generator reads a tally file in chunks of lines and yields every chunk as an array.
+    Lines that are empty, comments, or that do not start with a number (headers) are skipped.
+
+    :param path: str
+    :param chunk_lines: int, number of lines read at a time
+    :param columns: tuple of the columns of region, value and (optionally) standard deviation
+                    (defaults to the first 3 columns, or the first 2 in files without deviations)
+    :param comments: str, comment character
+    :return: generator of (lines x 3) (or (lines x 2)) arrays of float
+    """
+
+    with open(path) as tally:
+        while True:
+            lines = list(islice(tally, chunk_lines))
+
+            if not lines:
+                return
+
+            lines = [line for line in lines if line.lstrip()[:1].isdigit()]
+
+            if lines:
+                if columns is None:
+                    columns = tuple(range(min(len(lines[0].split(comments)[0].split()), 3)))
+
+                yield np.loadtxt(lines, usecols=columns, comments=comments, ndmin=2)
+
+
+class PowerMap(object):
+
+    """
+        This class maps the power of tally regions to the nodes of a NodeTable.
+
+    Attributes:
+        - region_ids: a sorted array of the region numbers used in the tally files
+        - node_regions: an array of the region (index into region_ids) of every node, -1 for
+          nodes outside every region
+        - fractions: an array of the fraction of the volume of its region in every node
+        - mapped: an array of bool, True for the regions with nodes
+    """
+
+    def __init__(self, node_regions, volume, region_ids=None):
+
+        """
+            Initializes the PowerMap object.
+
+        :param node_regions: array of the region index of every node (-1 for no region)
+        :param volume: array of the volume (or area) of every node
+        :param region_ids: array of the region number of every region index (defaults to the index)
+        """
+
+        self.node_regions = np.asarray(node_regions, dtype=np.int64)
+        regions = int(self.node_regions.max(initial=-1)) + 1
+        self.region_ids = np.arange(regions) if region_ids is None else np.asarray(region_ids, dtype=np.int64)
+
+        if np.any(np.diff(self.region_ids) <= 0):
+            raise ValueError('region_ids must be sorted and unique')
+
+        inside = self.node_regions >= 0
+        region_volume = np.bincount(self.node_regions[inside], weights=np.asarray(volume)[inside],
+                                    minlength=self.region_ids.size)
+
+        self.mapped = np.bincount(self.node_regions[inside], minlength=self.region_ids.size) > 0
+        self.fractions = np.zeros(self.node_regions.size)
+        self.fractions[inside] = np.asarray(volume)[inside] / region_volume[self.node_regions[inside]]
+
+    @classmethod
+    def by_element(cls, node_table, region_ids=None):
+
+        """This method returns the PowerMap of tallies by element (region i is element i of the table)"""
+
+        return cls(node_table.element, node_table.volume(), region_ids)
+
+    @classmethod
+    def by_rod(cls, node_table, region_ids=None):
+
+        """This method returns the PowerMap of tallies by rod (region i is rod i of the table)"""
+
+        return cls(node_table.rod, node_table.volume(), region_ids)
+
+    @classmethod
+    def by_node(cls, node_table, region_ids=None):
+
+        """This method returns the PowerMap of tallies by node (region i is node i of the table)"""
+
+        return cls(np.where(node_table.rod >= 0, np.arange(len(node_table)), -1), node_table.volume(), region_ids)
+
+    @property
+    def regions(self):
+        return self.region_ids.size
+
+    def accumulate(self, chunks):
+
+        """
+            This method sums the tallies of chunks per region. A region that appears in several
+        lines (batches, or tallies split between files) gets the sum of the values and of the
+        variances. Unknown region numbers raise a ValueError.
+
+        :param chunks: iterable of (lines x 3) arrays of region number, value and standard deviation
+        :return: array of the value of every region, array of its standard deviation
+        """
+
+        values = np.zeros(self.regions)
+        variances = np.zeros(self.regions)
+
+        for chunk in chunks:
+            region_numbers = chunk[:, 0].astype(np.int64)
+            regions = np.searchsorted(self.region_ids, region_numbers)
+
+            unknown = (regions >= self.regions) | (self.region_ids[np.minimum(regions, self.regions - 1)]
+                                                   != region_numbers)
+            if np.any(unknown):
+                raise ValueError('unknown tally region {}'.format(region_numbers[np.argmax(unknown)]))
+
+            values += np.bincount(regions, weights=chunk[:, 1], minlength=self.regions)
+
+            if chunk.shape[1] > 2:
+                variances += np.bincount(regions, weights=chunk[:, 2] ** 2, minlength=self.regions)
+
+        return values, np.sqrt(variances)
+
+    def node_values(self, region_values):
+
+        """
+            This method distributes region values (extensive, such as power) to the nodes, in
+        proportion to their volume.
+
+        :param region_values: array with 1 value per region
+        :return: array with 1 value per node (0 outside every region)
+        """
+
+        inside = self.node_regions >= 0
+
+        return np.where(inside, np.asarray(region_values)[np.maximum(self.node_regions, 0)] * self.fractions, 0.0)
+
+    def relative_deviation(self, region_values, region_deviations):
+
+        """
+            This method returns the relative standard deviation of the power of every node (that
+        of its region).
+
+        :param region_values: array
+        :param region_deviations: array
+        :return: array with 1 value per node (0 outside every region or for 0 power)
+        """
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.where(region_values != 0, region_deviations / np.abs(region_values), 0.0)
+
+        return np.where(self.node_regions >= 0, relative[np.maximum(self.node_regions, 0)], 0.0)
+
+    def update(self, power, chunks, total_power, *, relaxation=1.0):
+
+        """
+            This method maps tallies to the nodes, normalizes them to the total core power (over
+        the regions with nodes only) and relaxes them against the previous power, in place:
+
+            power = (1 - relaxation) * power + relaxation * normalized tally power
+
+        :param power: array of the node power of the previous iteration in W (NodeTable.power, or
+                      the next state of an IterationStore), updated in place
+        :param chunks: iterable of tally chunks (read_tally_chunks) or the path of a tally file
+        :param total_power: float, core power in W
+        :param relaxation: float, weight of the new power (1 for no relaxation)
+        :return: array of the relative standard deviation of the power of every node
+        """
+
+        if isinstance(chunks, str):
+            chunks = read_tally_chunks(chunks)
+
+        region_values, region_deviations = self.accumulate(chunks)
+        tally_total = region_values[self.mapped].sum()
+
+        if tally_total <= 0:
+            raise ValueError('the tallies have no power in regions with nodes')
+
+        new_power = self.node_values(region_values * (total_power / tally_total))
+
+        power *= 1.0 - relaxation
+        power += relaxation * new_power
+
+        return self.relative_deviation(region_values, region_deviations)
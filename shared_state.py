@@ -0,0 +1,288 @@
+"""
+    This module is responsible for handing the node state of a core to worker processes without
+copying nor pickling it.
+
+    The columns of a NodeTable (radii, densities, temperatures, power and composition rows) are
+moved into 1 named shared-memory segment, and the table keeps working on them in place (its
+storage is swapped, see NodeTable.swap_column). Workers receive only a small SharedLayout (the
+name of the segment and where every column lies in it), attach to the segment, read their
+slice of nodes and write their results in place: the parent sees them at once, through the
+table and through every Fuel, RadialElement and RadialNode view.
+
+    Segments are owned by the SharedNodeTable that created them, which removes them when it is
+closed, garbage collected or at interpreter exit, giving the table private copies of the columns
+it still holds first (the table never uses unmapped memory). If the owner process is killed, the
+resource tracker of multiprocessing removes them when the last process of the run exits; the
+segment names start with the prefix and the pid of their owner, so that segments left by a
+killed run can also be removed later (remove_stale_segments).
+
+    A worker keeps its attachment to a segment for the tasks that follow, and closes it when it
+receives the layout of another segment.
+"""
+
+from collections import namedtuple
+import os
+import secrets
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+segment_prefix = 'pyncc'
+
+shared_fields = ('inner_radius', 'outer_radius', 'density', 'temperature', 'power', 'composition')
+
+# offsets in bytes of every column of the segment, and the number of nodes used
+SharedLayout = namedtuple('SharedLayout', ['name', 'capacity', 'size', 'fields'])
+
+# worker side attachments, reused by the tasks of a worker process on the same segment
+_attached = {}
+
+
+def _detach(segment):
+
+    """This function closes an attachment to a segment, leaving it mapped if arrays of it are still referenced"""
+
+    try:
+        segment.close()
+    except BufferError:
+        pass  # arrays of the segment are still referenced somewhere: the mapping stays until they die
+
+
+def _release(table_reference, capacity, arrays, segment):
+
+    """
+        This function gives a table private copies of its columns in a segment, then closes and
+    removes the segment. It is the finalizer of SharedNodeTable, so it never raises.
+    """
+
+    table = table_reference()
+
+    # a table that grew (or swapped a column, see IterationStore.advance) already moved those
+    # columns to private arrays, which hold the current values
+    if table is not None and table.capacity == capacity:
+        for field, array in arrays.items():
+            if table.column(field) is array:
+                table.swap_column(field, array.copy())
+
+    arrays.clear()
+
+    attached = _attached.pop(segment.name, None)
+
+    if attached is not None:
+        _detach(attached)
+
+    _detach(segment)
+
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SharedNodeTable(object):
+
+    """
+        This class moves the columns of a NodeTable to a shared-memory segment.
+
+    Attributes:
+        - table: the NodeTable whose columns live in the segment
+        - segment: the SharedMemory segment
+        - layout: the SharedLayout sent to workers
+
+        The table must not grow (append nodes) while it is shared.
+    """
+
+    def __init__(self, node_table, fields=shared_fields):
+
+        """
+            Initializes the SharedNodeTable object: creates the segment, copies the columns into it
+        and makes the table use them.
+
+        :param node_table: NodeTable
+        :param fields: tuple of the columns shared
+        """
+
+        self.table = node_table
+        capacity = node_table.capacity
+
+        offsets = {}
+        total = 0
+
+        for field in fields:
+            dtype = getattr(node_table, field).dtype
+            total = -(-total // 64) * 64  # every column starts on a cache line
+            offsets[field] = (total, dtype.str)
+            total += capacity * dtype.itemsize
+
+        name = '{}_{}_{}'.format(segment_prefix, os.getpid(), secrets.token_hex(4))
+        self.segment = shared_memory.SharedMemory(name=name, create=True, size=max(total, 1))
+
+        self._capacity = capacity
+        self._fields = offsets
+        self._arrays = {}
+
+        # also called at interpreter exit (weakref.finalize does it)
+        self._finalizer = weakref.finalize(self, _release, weakref.ref(node_table), capacity, self._arrays,
+                                           self.segment)
+
+        for field, (offset, dtype) in offsets.items():
+            array = np.ndarray(capacity, dtype=dtype, buffer=self.segment.buf, offset=offset)
+            array[:node_table.size] = getattr(node_table, field)
+            array[node_table.size:] = 0.0 if field in node_table.float_fields else -1
+            node_table.swap_column(field, array)
+            self._arrays[field] = array
+
+    @property
+    def layout(self):
+
+        # a table that grows moves its columns to new private arrays
+        if self.table.capacity != self._capacity:
+            raise RuntimeError('the table grew after it was shared, share it again')
+
+        if any(self.table.column(field) is not array for field, array in self._arrays.items()):
+            raise RuntimeError('a column of the table was swapped after it was shared, share it again')
+
+        return SharedLayout(self.segment.name, self.table.capacity, self.table.size, self._fields)
+
+    def close(self):
+
+        """
+            This method gives the table private copies of its columns back and removes the
+        segment.
+        """
+
+        self._finalizer()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exception):
+
+        self.close()
+
+
+class AttachedNodes(object):
+
+    """
+        This class is a worker's view of a shared node table.
+
+    Attributes:
+        - layout: the SharedLayout
+        - arrays: a dictionary of the arrays of every column (of the nodes attached) by field
+    """
+
+    def __init__(self, layout, nodes=slice(None), writable=False):
+
+        """
+            Initializes the AttachedNodes object, attaching to the segment (once per process, closing
+        the attachments to other segments).
+
+        :param layout: SharedLayout
+        :param nodes: slice of the nodes attached (defaults to all used nodes)
+        :param writable: bool, False makes the arrays read-only
+        """
+
+        self.layout = layout
+
+        try:
+            segment = _attached[layout.name]
+        except KeyError:
+            # the segments of earlier layouts are closed (or about to be) by their owner
+            detach_all()
+            segment = _attached[layout.name] = shared_memory.SharedMemory(name=layout.name)
+
+        self.arrays = {}
+
+        for field, (offset, dtype) in layout.fields.items():
+            array = np.ndarray(layout.size, dtype=dtype, buffer=segment.buf, offset=offset)[nodes]
+            array.flags.writeable = writable
+            self.arrays[field] = array
+
+    def __getitem__(self, field):
+
+        return self.arrays[field]
+
+
+def detach_all():
+
+    """This function closes the attachments of the current (worker) process"""
+
+    while _attached:
+        _detach(_attached.popitem()[1])
+
+
+def run_block(function, layout, start, stop, writable, arguments):
+
+    """
+        This function runs function(AttachedNodes, *arguments) on the nodes [start, stop) of a
+    shared table. It runs in the worker processes (see map_blocks).
+
+    :return: whatever function returns
+    """
+
+    return function(AttachedNodes(layout, slice(start, stop), writable), *arguments)
+
+
+def map_blocks(pool, function, shared_table, blocks, *arguments, writable=True):
+
+    """
+        This function runs a function on blocks of nodes of a shared table in a process pool.
+    Only the layout and the block bounds are sent to the workers; results written in place (with
+    writable) are seen by the table as soon as the workers finish.
+
+    :param pool: concurrent.futures.ProcessPoolExecutor or multiprocessing pool with submit
+    :param function: function(AttachedNodes, *arguments), defined at module level
+    :param shared_table: SharedNodeTable
+    :param blocks: list of (start, stop) node ranges
+    :param arguments: extra arguments of function
+    :param writable: bool, whether the workers may write into the table
+    :return: list of the results of function, in the order of blocks
+    """
+
+    layout = shared_table.layout
+    jobs = [pool.submit(run_block, function, layout, start, stop, writable, arguments) for start, stop in blocks]
+
+    return [job.result() for job in jobs]
+
+
+def remove_stale_segments(directory='/dev/shm'):
+
+    """
+        This function removes the segments left by killed runs: segments of this module whose
+    owner process is no longer alive (Linux keeps shared memory in /dev/shm).
+
+    :param directory: str
+    :return: list of the names of the segments removed
+    """
+
+    removed = []
+
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return removed
+
+    for name in names:
+        parts = name.split('_')
+
+        if len(parts) != 3 or parts[0] != segment_prefix or not parts[1].isdigit():
+            continue
+
+        try:
+            os.kill(int(parts[1]), 0)
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue  # alive, owned by another user
+        else:
+            continue
+
+        try:
+            os.unlink(os.path.join(directory, name))
+            removed.append(name)
+        except FileNotFoundError:
+            pass
+
+    return removed
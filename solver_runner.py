@@ -0,0 +1,238 @@
+"""
+    This module is responsible for running many external solver jobs at the same time (one
+per assembly, for example) with asyncio, and for never running the same input deck twice.
+
+    Decks are identified by the hash of their content (geometry, temperatures, densities and
+compositions, as arrays) and of the solver command, and the results of every deck that was run
+are kept in a content-addressed DeckCache. In early iterations many assemblies are identical, so
+identical decks, whether submitted together or in later iterations, are solved only once. Every
+job gets its own copy of the result, even when the deck was solved for another job.
+
+    The output of each solver process is streamed line by line, as it arrives, to an optional
+callback.
+"""
+
+import asyncio
+import hashlib
+import os
+import subprocess
+
+import numpy as np
+
+from coupling import read_array_deck, write_array_deck
+from instrumentation import instrumentation
+
+
+def deck_key(arrays, command=()):
+
+    """
+        This function returns the content hash of a deck given as arrays. Decks with the same
+    arrays (names, types, shapes and values) for the same solver command have the same key.
+
+    :param arrays: dictionary of arrays by name
+    :param command: list of the arguments of the solver command (see ExternalSolver)
+    :return: str, hexadecimal SHA-256 digest
+    """
+
+    digest = hashlib.sha256()
+
+    for argument in command:
+        digest.update(argument.encode())
+        digest.update(b'\0')
+
+    digest.update(b'\0')
+
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        digest.update(name.encode())
+        digest.update(array.dtype.str.encode())
+        digest.update(repr(array.shape).encode())
+        digest.update(array.data)
+
+    return digest.hexdigest()
+
+
+class DeckCache(object):
+
+    """
+        This class stores the results of solved decks on disk, by deck key.
+
+    Attributes:
+        - directory: a str of the directory of the cache
+        - hits / misses: int counts of lookups found and not found
+    """
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+
+        return os.path.join(self.directory, key[:2], key + '.npz')
+
+    def __contains__(self, key):
+
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+
+        """
+            This method returns the cached result of a deck, or None if it was never solved.
+
+        :param key: str
+        :return: dictionary of arrays by name or None
+        """
+
+        try:
+            result = read_array_deck(self._path(key))
+        except FileNotFoundError:
+            self.misses += 1
+            instrumentation.count('deck_cache.misses')
+            return None
+
+        self.hits += 1
+        instrumentation.count('deck_cache.hits')
+
+        return result
+
+    def put(self, key, result):
+
+        """
+            This method stores the result of a deck. The file is written under a temporary name
+        and then renamed, so that a crash never leaves a partial result in the cache.
+
+        :param key: str
+        :param result: dictionary of arrays by name
+        """
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        write_array_deck(path + '.part', result)
+        os.replace(path + '.part', path)
+
+
+def _copy(result):
+
+    """This function returns a copy of a result (dictionary of arrays by name)"""
+
+    return {name: np.array(array, copy=True) for name, array in result.items()}
+
+
+class AsyncSolverRunner(object):
+
+    """
+        This class runs jobs of an ExternalSolver as concurrent subprocesses.
+
+    Attributes:
+        - solver: the ExternalSolver
+        - directory: a str of the working directory of the decks
+        - concurrency: an int of the maximum number of solver processes running at a time
+        - cache: a DeckCache (optional)
+        - on_output: a function(name, line) called with every output line of the solvers
+        - runs: an int count of the solver processes launched
+    """
+
+    def __init__(self, solver, directory, *, concurrency=4, cache=None, on_output=None):
+
+        self.solver = solver
+        self.directory = directory
+        self.concurrency = concurrency
+        self.cache = cache
+        self.on_output = on_output
+        self.runs = 0
+
+        self._running = {}
+
+        os.makedirs(directory, exist_ok=True)
+
+    async def run(self, name, arrays, semaphore):
+
+        """
+            This coroutine returns the result of a deck: from the cache, from an identical deck
+        already running, or by running the solver.
+
+        :param name: str, name of the job (and of its decks)
+        :param arrays: dictionary of arrays by name
+        :param semaphore: asyncio.Semaphore limiting the concurrent processes
+        :return: dictionary of arrays by name
+        """
+
+        key = deck_key(arrays, self.solver.command)
+
+        if key in self._running:
+            return _copy(await asyncio.shield(self._running[key]))
+
+        if self.cache is not None:
+            result = self.cache.get(key)
+
+            if result is not None:
+                return result
+
+        self._running[key] = asyncio.ensure_future(self._solve(name, key, arrays, semaphore))
+
+        try:
+            return _copy(await asyncio.shield(self._running[key]))
+        finally:
+            self._running.pop(key, None)
+
+    async def _solve(self, name, key, arrays, semaphore):
+
+        """This coroutine runs the solver on a deck and caches its result"""
+
+        solver = self.solver
+        input_path = os.path.join(self.directory, name + '.in' + solver.extension)
+        output_path = os.path.join(self.directory, name + '.out' + solver.extension)
+
+        async with semaphore:
+            with instrumentation.timer('solver.async_run', deck=name):
+                await asyncio.to_thread(solver.writer, input_path, arrays)
+
+                command = [argument.format(input=input_path, output=output_path) for argument in solver.command]
+                process = await asyncio.create_subprocess_exec(*command, cwd=self.directory,
+                                                               stdout=asyncio.subprocess.PIPE,
+                                                               stderr=asyncio.subprocess.STDOUT)
+                self.runs += 1
+
+                async for line in process.stdout:
+                    if self.on_output is not None:
+                        self.on_output(name, line.decode(errors='replace').rstrip('\n'))
+
+                if await process.wait():
+                    raise subprocess.CalledProcessError(process.returncode, command)
+
+                result = await asyncio.to_thread(solver.reader, output_path)
+
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, key, result)
+
+        return result
+
+    async def run_many(self, jobs):
+
+        """
+            This coroutine runs many jobs concurrently and returns their results.
+
+        :param jobs: dictionary of decks (dictionaries of arrays) by job name
+        :return: dictionary of results by job name
+        """
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self.run(name, arrays, semaphore) for name, arrays in jobs.items()))
+
+        return dict(zip(jobs, results))
+
+    def run_all(self, jobs):
+
+        """
+            This method is the synchronous version of run_many, for code outside of asyncio.
+
+        :param jobs: dictionary of decks (dictionaries of arrays) by job name
+        :return: dictionary of results by job name
+        """
+
+        return asyncio.run(self.run_many(jobs))
@@ -0,0 +1,80 @@
+"""
+    This module is responsible for stand-in solver executables, which replace the external
+neutronics and thermal-hydraulics codes when the coupling is tested (see coupling.ExternalSolver).
+
+    They read and write .npz decks with the arrays of the PicardDriver and follow simple feedback
+laws: the neutronics power of a fuel node is proportional to its area, reduced by a temperature
+(Doppler-like) coefficient, and normalized to the total power; the thermal-hydraulics
+temperature of a fuel node rises linearly with its power above the inlet temperature.
+
+    Usage:
+        python stand_in_solvers.py neutronics {input} {output} [--power W]
+        python stand_in_solvers.py thermal-hydraulics {input} {output} [--inlet K] [--coefficient K/W]
+"""
+
+import argparse
+
+import numpy as np
+
+from coupling import read_array_deck, write_array_deck
+
+
+def neutronics(arrays, total_power=1E6, reference_temperature=600.0, feedback=3E-4):
+
+    """
+        This function returns the output arrays of the stand-in neutronics solver.
+
+    :param arrays: dictionary of the input arrays by name
+    :param total_power: float, core power in W
+    :param reference_temperature: float, temperature in K without feedback
+    :param feedback: float, relative power change per K
+    :return: dictionary of arrays by name
+    """
+
+    area = np.pi * (arrays['outer_radius'] ** 2 - arrays['inner_radius'] ** 2)
+    weight = np.where(arrays['rod'] >= 0,
+                      area * (1.0 - feedback * (arrays['temperature'] - reference_temperature)), 0.0)
+
+    return {'power': total_power * weight / weight.sum()}
+
+
+def thermal_hydraulics(arrays, inlet=565.0, coefficient=1E-3):
+
+    """
+        This function returns the output arrays of the stand-in thermal-hydraulics solver.
+
+    :param arrays: dictionary of the input arrays by name
+    :param inlet: float, inlet temperature in K
+    :param coefficient: float, temperature rise per W of node power in K/W
+    :return: dictionary of arrays by name
+    """
+
+    temperature = np.where(arrays['rod'] >= 0, inlet + coefficient * arrays['power'], arrays['temperature'])
+
+    return {'temperature': temperature, 'density': arrays['density']}
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description='Stand-in solver of the coupling')
+    parser.add_argument('solver', choices=('neutronics', 'thermal-hydraulics'))
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--power', type=float, default=1E6, help='core power in W (neutronics)')
+    parser.add_argument('--inlet', type=float, default=565.0, help='inlet temperature in K (thermal-hydraulics)')
+    parser.add_argument('--coefficient', type=float, default=1E-3,
+                        help='temperature rise per W of node power in K/W (thermal-hydraulics)')
+    arguments = parser.parse_args(arguments)
+
+    arrays = read_array_deck(arguments.input)
+
+    if arguments.solver == 'neutronics':
+        result = neutronics(arrays, arguments.power)
+    else:
+        result = thermal_hydraulics(arrays, arguments.inlet, arguments.coefficient)
+
+    write_array_deck(arguments.output, result)
+
+
+if __name__ == '__main__':
+    main()
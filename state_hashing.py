@@ -0,0 +1,366 @@
+"""
+    This module is responsible for telling cheaply whether 2 pins, 2 assemblies or 2 snapshots
+of a core are the same, and which nodes differ between them.
+
+    Every node gets a 64-bit content hash of its fields (radii, density, temperature, power)
+and of the number densities of its composition (compositions are compared by content, not by
+row, so a detached copy of a row hashes like the row). The hash of a rod is the sum (modulo
+2**64) of the hashes of its nodes, each mixed with the position of the node in the rod; the hash
+of an assembly is the sum of the hashes of its rods mixed with their position in the assembly,
+and the hash of the core is the sum of the hashes of its assemblies mixed with their numbers.
+Since every level is a sum, when a few nodes change only their terms are subtracted and added
+again: updates cost as much as the number of changed nodes, and the hashes of every level stay
+exactly equal to those of a full recomputation.
+
+    The hashes identify content for caching and deduplication (of solver decks, restarts...), not
+against adversaries: they are not cryptographic.
+"""
+
+import numpy as np
+
+hashed_fields = ('inner_radius', 'outer_radius', 'density', 'temperature', 'power')
+
+# odd 64-bit constants (from splitmix64 and the golden ratio)
+_golden = np.uint64(0x9E3779B97F4A7C15)
+_first = np.uint64(0xBF58476D1CE4E5B9)
+_second = np.uint64(0x94D049BB133111EB)
+_field_seeds = np.array([0x243F6A8885A308D3, 0x13198A2E03707344, 0xA4093822299F31D0, 0x082EFA98EC4E6C89,
+                         0x452821E638D01377, 0xBE5466CF34E90C6C], dtype=np.uint64)
+
+
+def mix(values):
+
+    """
+        This function mixes the bits of 64-bit integers (the splitmix64 finalizer), so that close
+    inputs give unrelated outputs.
+
+    :param values: array of uint64
+    :return: array of uint64
+    """
+
+    values = np.array(values, dtype=np.uint64)
+
+    with np.errstate(over='ignore'):
+        values ^= values >> np.uint64(30)
+        values *= _first
+        values ^= values >> np.uint64(27)
+        values *= _second
+        values ^= values >> np.uint64(31)
+
+    return values
+
+
+def _bits(values):
+
+    """This function returns the bits of float values as uint64 (with -0.0 taken as 0.0)"""
+
+    return (np.asarray(values, dtype=np.float64) + 0.0).view(np.uint64)
+
+
+def composition_hashes(compositions):
+
+    """
+        This function returns the content hash of every row of a CompositionTable.
+
+    :param compositions: CompositionTable
+    :return: array of uint64
+    """
+
+    number_densities = compositions.number_densities
+    hashes = np.zeros(number_densities.shape[0], dtype=np.uint64)
+    columns = mix(np.arange(number_densities.shape[1], dtype=np.uint64) * _golden)
+
+    with np.errstate(over='ignore'):
+        for column in range(number_densities.shape[1]):
+            hashes += mix(_bits(number_densities[:, column]) ^ columns[column])
+
+    return hashes
+
+
+def node_hashes(node_table, nodes=slice(None), composition_rows=None):
+
+    """
+        This function returns the content hash of nodes of a NodeTable.
+
+    :param node_table: NodeTable
+    :param nodes: slice or array of the nodes (defaults to all nodes)
+    :param composition_rows: array of the hashes of every composition row (if not given, only the
+                             rows of the nodes are hashed)
+    :return: array of uint64
+    """
+
+    if composition_rows is None:
+        rows, inverse = np.unique(node_table.composition[nodes], return_inverse=True)
+        composition_terms = composition_hashes(_RowsView(node_table.compositions, rows))[inverse.ravel()]
+    else:
+        composition_terms = composition_rows[node_table.composition[nodes]]
+
+    hashes = mix(composition_terms ^ _field_seeds[-1])
+
+    with np.errstate(over='ignore'):
+        for seed, field in zip(_field_seeds, hashed_fields):
+            hashes += mix(_bits(getattr(node_table, field)[nodes]) ^ seed)
+
+    return hashes
+
+
+def positioned(hashes, positions):
+
+    """This function mixes hashes with positions, the terms summed into the hash of the next level"""
+
+    with np.errstate(over='ignore'):
+        return mix(hashes + (np.asarray(positions, dtype=np.uint64) + np.uint64(1)) * _golden)
+
+
+def same_nodes(table, nodes, other_table, other_nodes):
+
+    """
+        This function tells whether nodes of 2 NodeTables (or of the same one) have the same
+    content: same fields and same number densities, wherever their compositions are stored.
+
+    :param table: NodeTable
+    :param nodes: slice or array of nodes of table
+    :param other_table: NodeTable
+    :param other_nodes: slice or array of nodes of other_table, as many as nodes
+    :return: bool
+    """
+
+    if table.power[nodes].size != other_table.power[other_nodes].size:
+        return False
+
+    for field in hashed_fields:
+        if not np.array_equal(getattr(table, field)[nodes], getattr(other_table, field)[other_nodes]):
+            return False
+
+    rows = table.composition[nodes]
+    other_rows = other_table.composition[other_nodes]
+
+    if table.compositions is other_table.compositions and np.array_equal(rows, other_rows):
+        return True
+
+    if table.compositions.nuclides != other_table.compositions.nuclides:
+        return False
+
+    return np.array_equal(table.compositions.number_densities[rows],
+                          other_table.compositions.number_densities[other_rows])
+
+
+def hash_sum(terms):
+
+    """This function returns the sum of terms modulo 2**64"""
+
+    with np.errstate(over='ignore'):
+        return np.uint64(np.sum(terms, dtype=np.uint64))
+
+
+def nodes_hash(node_table, start, stop):
+
+    """
+        This function returns the content hash of the contiguous nodes [start, stop) of a
+    NodeTable (a rod or an element), as StateHasher computes rod hashes.
+
+    :param node_table: NodeTable
+    :param start: int
+    :param stop: int
+    :return: uint64
+    """
+
+    return hash_sum(positioned(node_hashes(node_table, slice(start, stop)), np.arange(stop - start)))
+
+
+class Snapshot(object):
+
+    """
+        This class is a frozen copy of the hashes of every level of a StateHasher.
+
+    Attributes:
+        - nodes / rods / groups: arrays of the hashes of every node, rod and group (assembly)
+        - core: the hash of the core (uint64)
+    """
+
+    def __init__(self, nodes, rods, groups, core):
+
+        self.nodes = nodes
+        self.rods = rods
+        self.groups = groups
+        self.core = core
+
+    @property
+    def digest(self):
+        return '{:016x}'.format(int(self.core))
+
+    def __eq__(self, other):
+
+        return isinstance(other, Snapshot) and self.core == other.core
+
+    def __hash__(self):
+
+        return int(self.core)
+
+    def diff(self, other):
+
+        """
+            This method returns what changed between 2 snapshots of the same core.
+
+        :param other: Snapshot
+        :return: arrays of the changed nodes, rods and groups
+        """
+
+        if self.nodes.size != other.nodes.size:
+            raise ValueError('snapshots of different cores ({} and {} nodes)'.format(self.nodes.size,
+                                                                                     other.nodes.size))
+
+        if self.core == other.core:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+
+        return (np.flatnonzero(self.nodes != other.nodes), np.flatnonzero(self.rods != other.rods),
+                np.flatnonzero(self.groups != other.groups))
+
+
+class StateHasher(object):
+
+    """
+        This class keeps the content hashes of the nodes, rods, groups of rods (assemblies) and
+    the whole core of a NodeTable up to date.
+
+    Attributes:
+        - table: the NodeTable
+        - rod_groups: an array of the group (assembly) of every rod
+        - rod_positions: an array of the position of every rod in its group
+        - node_hashes / rod_hashes / group_hashes: arrays of uint64
+        - core_hash: uint64
+    """
+
+    def __init__(self, node_table, rod_groups=None, rod_positions=None):
+
+        """
+            Initializes the StateHasher object and computes every hash.
+
+        :param node_table: NodeTable
+        :param rod_groups: array of the group of every rod (defaults to 1 group of every rod)
+        :param rod_positions: array of the position of every rod in its group (defaults to the rod)
+        """
+
+        self.table = node_table
+        rods = node_table.rods
+
+        self.rod_groups = np.zeros(rods, dtype=np.int64) if rod_groups is None else np.asarray(rod_groups)
+        self.rod_positions = np.arange(rods) if rod_positions is None else np.asarray(rod_positions)
+
+        starts, _ = node_table.rod_bounds()
+        self._node_positions = np.arange(len(node_table)) - np.where(node_table.rod >= 0,
+                                                                    starts[np.maximum(node_table.rod, 0)], 0)
+
+        self.rehash()
+
+    @classmethod
+    def from_geometry(cls, geometry, assembly_size):
+
+        """
+            This method creates the StateHasher of a (materialized) ExpandedGeometry whose groups
+        are the assemblies of the lattice. A rod shared by symmetric positions belongs to the
+        assembly of its first position; the axial level is part of its position.
+
+        :param geometry: ExpandedGeometry
+        :param assembly_size: int, rods of an assembly in each direction
+        :return: StateHasher
+        """
+
+        rod_cells = geometry.rod_cells()
+        columns = geometry.cell_index.shape[1]
+        assembly_columns = -(-columns // assembly_size)
+
+        positions = geometry.cell_index.ravel()
+        occupied = np.flatnonzero(positions >= 0)
+        first_position = np.zeros(geometry.cells, dtype=np.int64)
+        cells, first = np.unique(positions[occupied], return_index=True)
+        first_position[cells] = occupied[first]
+
+        row, column = np.divmod(first_position[rod_cells[:, 0]], columns)
+        groups = (row // assembly_size) * assembly_columns + column // assembly_size
+        rod_positions = ((row % assembly_size) * assembly_size + column % assembly_size) * geometry.axial_nodes \
+            + rod_cells[:, 1]
+
+        return cls(geometry.node_table, groups, rod_positions)
+
+    def rehash(self):
+
+        """This method computes every hash from scratch"""
+
+        self._composition_rows = composition_hashes(self.table.compositions)
+        self.node_hashes = node_hashes(self.table, composition_rows=self._composition_rows)
+
+        rods = self.table.rod
+        owned = rods >= 0
+
+        self._rod_terms = np.zeros(len(self.table), dtype=np.uint64)
+        self._rod_terms[owned] = positioned(self.node_hashes[owned], self._node_positions[owned])
+
+        self.rod_hashes = np.zeros(self.table.rods, dtype=np.uint64)
+        self.group_hashes = np.zeros(int(self.rod_groups.max(initial=-1)) + 1, dtype=np.uint64)
+
+        with np.errstate(over='ignore'):
+            np.add.at(self.rod_hashes, rods[owned], self._rod_terms[owned])
+            np.add.at(self.group_hashes, self.rod_groups, positioned(self.rod_hashes, self.rod_positions))
+
+        self.core_hash = hash_sum(positioned(self.group_hashes, np.arange(self.group_hashes.size)))
+
+    def update(self, nodes):
+
+        """
+            This method updates the hashes after nodes changed (the dirty nodes of a ChangeTracker,
+        for example), in time proportional to the number of nodes.
+
+        :param nodes: array of the changed nodes
+        """
+
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        nodes = nodes[self.table.rod[nodes] >= 0]
+
+        if not nodes.size:
+            return
+
+        compositions = self.table.compositions
+
+        if self._composition_rows.size != len(compositions):
+            self._composition_rows = composition_hashes(compositions)
+        else:
+            # rows of changed nodes may have new number densities (after depletion, for example)
+            rows = np.unique(self.table.composition[nodes])
+            self._composition_rows[rows] = composition_hashes(_RowsView(compositions, rows))
+
+        rods = self.table.rod[nodes]
+        changed_rods = np.unique(rods)
+        groups = np.unique(self.rod_groups[changed_rods])
+
+        old_rod_terms = positioned(self.rod_hashes[changed_rods], self.rod_positions[changed_rods])
+        old_group_terms = positioned(self.group_hashes[groups], groups)
+
+        self.node_hashes[nodes] = node_hashes(self.table, nodes, self._composition_rows)
+        new_terms = positioned(self.node_hashes[nodes], self._node_positions[nodes])
+
+        with np.errstate(over='ignore'):
+            np.add.at(self.rod_hashes, rods, new_terms - self._rod_terms[nodes])
+            self._rod_terms[nodes] = new_terms
+
+            new_rod_terms = positioned(self.rod_hashes[changed_rods], self.rod_positions[changed_rods])
+            np.add.at(self.group_hashes, self.rod_groups[changed_rods], new_rod_terms - old_rod_terms)
+
+            new_group_terms = positioned(self.group_hashes[groups], groups)
+            self.core_hash = self.core_hash + hash_sum(new_group_terms - old_group_terms)
+
+    def snapshot(self):
+
+        """This method returns a Snapshot of the current hashes"""
+
+        return Snapshot(self.node_hashes.copy(), self.rod_hashes.copy(), self.group_hashes.copy(), self.core_hash)
+
+
+class _RowsView(object):
+
+    """This class exposes some rows of a CompositionTable to composition_hashes"""
+
+    def __init__(self, compositions, rows):
+
+        self.number_densities = compositions.number_densities[rows]
@@ -0,0 +1,91 @@
+"""Tests of the AdaptiveSampling controller on the synthetic coupled Monte Carlo model"""
+
+import numpy as np
+
+from adaptive_sampling import AdaptiveSampling, SyntheticMonteCarlo
+
+
+class UnevenMonteCarlo(SyntheticMonteCarlo):
+
+    """The synthetic model with tallies of the first tenth of the nodes 5 times noisier (a poorly sampled region)"""
+
+    def solve(self, temperature, histories):
+
+        relative_deviation = np.full(self.shape.size, self.noise_per_history / np.sqrt(histories))
+        relative_deviation[:self.shape.size // 10] *= 5
+        power = self.exact_power(temperature) * (1 + relative_deviation * self.random.standard_normal(self.shape.size))
+
+        return power, relative_deviation
+
+
+def couple(model, controller, iterations=100):
+
+    temperature = np.zeros(model.shape.size)
+
+    for _ in range(iterations):
+        power, deviation = model.solve(temperature, controller.histories)
+        temperature = model.temperature(power)
+
+        if controller.update(power, deviation):
+            return True
+
+    return False
+
+
+def fixed_point(model, tolerance):
+
+    """This function returns the exact coupled power and the iterations needed without noise"""
+
+    power = model.exact_power(np.zeros(model.shape.size))
+
+    for iteration in range(1, 100):
+        previous, power = power, model.exact_power(model.temperature(power))
+
+        if np.linalg.norm(power - previous) / np.linalg.norm(power) <= tolerance:
+            return power, iteration + 1
+
+
+def test_converges_with_fewer_histories_than_fixed_sampling():
+
+    model = SyntheticMonteCarlo()
+    controller = AdaptiveSampling(target_stdv=0.001)
+
+    assert couple(model, controller)
+    assert np.max(controller.deviation) <= controller.target_stdv
+
+    exact, iterations = fixed_point(model, controller.target_stdv)
+    assert np.linalg.norm(controller.power - exact) / np.linalg.norm(exact) < 3 * controller.target_stdv
+
+    # every iteration at the target deviation
+    fixed = (model.noise_per_history / controller.target_stdv) ** 2 * iterations
+    assert controller.total_histories < fixed
+
+    histories = [record[0] for record in controller.record]
+    assert all(later <= controller.growth * earlier for earlier, later in zip(histories, histories[1:]))
+    assert all(count % controller.neutrons_per_stage == 0 for count in histories)
+
+
+def test_target_is_per_node():
+
+    model = UnevenMonteCarlo(seed=1)
+    controller = AdaptiveSampling(target_stdv=0.002)
+
+    assert couple(model, controller)
+    assert np.max(controller.deviation) <= controller.target_stdv
+
+    # the noisy nodes set the histories: the other nodes end well within the target
+    assert np.max(controller.deviation[model.shape.size // 10:]) < controller.target_stdv / 2
+
+    median = AdaptiveSampling(target_stdv=0.002, target_percentile=50.0)
+    assert couple(UnevenMonteCarlo(seed=1), median)
+    assert np.median(median.deviation) <= median.target_stdv
+    assert median.total_histories < controller.total_histories
+
+
+def test_monk_parameters():
+
+    controller = AdaptiveSampling(initial_histories=20500, neutrons_per_stage=1000, target_stdv=0.01)
+    parameters = controller.monk_parameters()
+
+    assert parameters == {'monk_neutron_sampling': 1000, 'monk_settling_stages': 10, 'monk_actual_stages': 21,
+                          'monk_stdv': 0.01}
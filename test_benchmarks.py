@@ -0,0 +1,27 @@
+"""Tests of the benchmark suite on the smallest core"""
+
+import os
+import tempfile
+
+import benchmarks
+
+
+def test_run_and_compare(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+
+    results = benchmarks.run(['iteration_store_advance', 'table_rod_power', 'node_table_save', 'node_table_load'],
+                             ['single_pin'], repeats=1, log=None)
+
+    # the files written by the cases are removed
+    assert os.listdir(str(tmp_path)) == []
+
+    assert set(results['results']) == {'iteration_store_advance/single_pin', 'table_rod_power/single_pin',
+                                       'node_table_save/single_pin', 'node_table_load/single_pin'}
+    assert all(result['time_min'] > 0 and result['pins'] == 1 for result in results['results'].values())
+
+    slower = {'results': {key: dict(result, time_median=result['time_median'] * 2)
+                          for key, result in results['results'].items()}}
+
+    assert benchmarks.compare(results, results) == {}
+    assert set(benchmarks.compare(results, slower)) == {(key, 'time_median') for key in results['results']}
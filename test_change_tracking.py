@@ -0,0 +1,101 @@
+"""Tests of the tracking of the changed nodes of a NodeTable"""
+
+import numpy as np
+
+from change_tracking import ChangeTracker
+from depletion import Depleter, default_chain
+from node_table import NodeTable
+
+
+def table_of(rods, nodes=4):
+
+    table = NodeTable()
+
+    for _ in range(rods):
+        start, stop = table.append_nodes(np.arange(nodes) * 1E-3, np.arange(1, nodes + 1) * 1E-3,
+                                         (10000.0, ) * nodes, (900.0, ) * nodes, ({'U235': 5, 'U238': 95}, ) * nodes)
+        table.new_element(start, start + nodes // 2)
+        table.new_element(start + nodes // 2, stop)
+        table.new_rod(start, stop)
+
+    table.power[:] = 1E3
+
+    return table
+
+
+def test_temperature_changes_beyond_the_tolerance_are_dirty():
+
+    table = table_of(3)
+    tracker = ChangeTracker(table)
+
+    assert tracker.detect().size == 0
+
+    table.temperature[5] += 10.0
+    table.temperature[9] += 0.1
+    table.power[6] *= 2
+
+    assert tracker.detect().tolist() == [5, 6]
+    assert tracker.changed['temperature'].tolist() == [5]
+    assert tracker.dirty_elements.tolist() == [2, 3] and tracker.dirty_rods.tolist() == [1]
+
+    # only the candidates are compared
+    assert tracker.detect(candidates=[5, 9]).tolist() == [5]
+
+    tracker.update([5, 6, 9])
+    np.testing.assert_allclose(tracker.element_power, table.element_power())
+    np.testing.assert_allclose(tracker.rod_power, table.rod_power())
+    assert tracker.detect().size == 0
+
+    # the drift below the tolerance accumulates against the old reference
+    table.temperature[9] += 0.45
+    assert tracker.detect().tolist() == [9]
+
+
+def test_depletion_marks_the_nodes_of_rewritten_rows():
+
+    table = table_of(2)
+    tracker = ChangeTracker(table)
+    number_densities = table.atombarn()
+
+    compositions = table.compositions
+    fission = np.zeros((1, len(compositions.nuclides)))
+    fission[0, compositions.column('U235')] = 585.0
+    depleter = Depleter(default_chain(compositions.nuclides))
+
+    # the first step gives the nodes rows of their own, the next ones rewrite those rows in place
+    for candidates in (None, []):
+        depleted = depleter.deplete(table, {'fission': fission}, np.zeros(len(table), dtype=np.int64), 3E7,
+                                    nodes=np.arange(4))
+
+        assert tracker.detect(candidates).tolist() == depleted.tolist()
+        assert tracker.atombarn(number_densities).tolist() == depleted.tolist()
+        np.testing.assert_allclose(number_densities, table.atombarn())
+        tracker.commit()
+
+    assert tracker.marked_nodes.tolist() == [0, 1, 2, 3]
+    assert tracker.detect().size == 0
+
+    # marks are kept until the next commit
+    tracker.mark([6])
+    assert tracker.detect().tolist() == [6] and tracker.detect().tolist() == [6]
+    tracker.commit()
+    assert tracker.detect().size == 0
+
+
+def test_new_nodes_are_dirty():
+
+    table = table_of(1)
+    tracker = ChangeTracker(table)
+    tracker.update()
+
+    start, stop = table.append_nodes((0.0, ), (1E-3, ), (10000.0, ), (900.0, ), ({'U238': 100}, ))
+    table.new_element(start, stop)
+    table.new_rod(start, stop)
+    table.power[start] = 5E3
+
+    assert tracker.detect(candidates=[]).tolist() == [4]
+    assert tracker.dirty_rods.tolist() == [1]
+
+    tracker.commit()
+    np.testing.assert_allclose(tracker.rod_power, [4E3, 5E3])
+    assert tracker.detect().size == 0
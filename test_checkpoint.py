@@ -0,0 +1,105 @@
+"""Tests of the checkpoint files: full and delta checkpoints, pruning and geometry"""
+
+import os
+
+import numpy as np
+import pytest
+
+from checkpoint import Checkpoint, CheckpointError, CheckpointWriter, checkpoints, latest_checkpoint
+from test_coupling import core
+from test_core_state import geometry
+
+
+def save_iterations(writer, table, iterations):
+
+    saved = {}
+
+    for iteration in range(1, iterations + 1):
+        table.temperature[::2] += iteration
+        table.power[:] = iteration
+        writer.save(table, iteration, {'residuals': [[iteration, 0.0]]})
+        saved[iteration] = table.temperature.copy()
+
+    writer.close()
+
+    return saved
+
+
+def test_delta_chains_restart_from_a_full_checkpoint(tmp_path):
+
+    table = core()
+    saved = save_iterations(CheckpointWriter(str(tmp_path), full_every=3), table, 5)
+    paths = checkpoints(str(tmp_path))
+
+    assert len(paths) == 5
+    assert [None if checkpoint.base is None else os.path.basename(checkpoint.base)
+            for checkpoint in map(Checkpoint, paths)] == [None, 'checkpoint_000001.ckpt', 'checkpoint_000002.ckpt',
+                                                          None, 'checkpoint_000004.ckpt']
+
+    # deltas of unchanged arrays are almost empty
+    assert os.path.getsize(paths[1]) < os.path.getsize(paths[0])
+
+    for iteration, path in enumerate(paths, 1):
+        restored = Checkpoint(path).node_table()
+        assert restored.compositions.sources == table.compositions.sources
+        np.testing.assert_array_equal(restored.temperature, saved[iteration])
+        np.testing.assert_array_equal(restored.power, iteration)
+        np.testing.assert_array_equal(restored.rod, table.rod)
+
+    assert latest_checkpoint(str(tmp_path)).metadata == {'residuals': [[5, 0.0]]}
+
+
+@pytest.mark.parametrize('compression, expected', [(6, [3, 4, 5]), (None, [4, 5])])
+def test_pruning_keeps_the_deltas_of_the_kept_full_checkpoints(tmp_path, compression, expected):
+
+    # uncompressed checkpoints are all full
+    save_iterations(CheckpointWriter(str(tmp_path), compression=compression, full_every=2, keep=2), core(), 5)
+
+    assert [Checkpoint(path).iteration for path in checkpoints(str(tmp_path))] == expected
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.tmp')]
+
+    # the first checkpoint kept never needs a removed base
+    first = Checkpoint(checkpoints(str(tmp_path))[0])
+    assert first.base is None
+    first.node_table()
+
+
+def test_geometry_is_restored_only_if_saved(tmp_path):
+
+    expanded = geometry(['duplex', 'thin'])
+
+    with CheckpointWriter(str(tmp_path / 'geometry')) as writer:
+        writer.save(expanded, 1)
+
+    restored = latest_checkpoint(str(tmp_path / 'geometry')).geometry()
+
+    np.testing.assert_array_equal(restored.cell_index, expanded.cell_index)
+    np.testing.assert_array_equal(restored.cell_rods, expanded.cell_rods)
+    np.testing.assert_array_equal(restored.node_table.outer_radius, expanded.node_table.outer_radius)
+
+    with CheckpointWriter(str(tmp_path / 'table')) as writer:
+        writer.save(expanded.node_table, 1)
+
+    with pytest.raises(CheckpointError):
+        latest_checkpoint(str(tmp_path / 'table')).geometry()
+
+
+def test_metadata_is_converted_when_saved(tmp_path):
+
+    table = core()
+    residuals = [(np.float64(0.5), np.float32(0.25))]
+
+    with CheckpointWriter(str(tmp_path)) as writer:
+        writer.save(table, 1, {'residuals': residuals, 'store_iteration': np.int64(1), 'power': np.ones(2)})
+
+        # the caller may change its metadata while the checkpoint is written
+        residuals.append((1.0, 1.0))
+
+        with pytest.raises(TypeError):
+            writer.save(table, 2, {'table': table})
+
+        writer.save(table, 3, {'store_iteration': 3})
+
+    assert Checkpoint(checkpoints(str(tmp_path))[0]).metadata == {'residuals': [[0.5, 0.25]], 'store_iteration': 1,
+                                                                  'power': [1.0, 1.0]}
+    assert latest_checkpoint(str(tmp_path)).iteration == 3
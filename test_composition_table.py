@@ -0,0 +1,142 @@
+"""Tests of the central CompositionTable and of compositions seen through the node views"""
+
+import numpy as np
+import pytest
+
+from composition_table import CompositionTable
+from geometry_rod_centered import RadialNode
+from node_table import NodeTable
+
+
+def test_rows_are_shared_at_any_density():
+
+    table = NodeTable()
+    table.append_nodes((0.0, 0.1, 0.2), (0.1, 0.2, 0.3), (10000.0, 10500.0, 9000.0), (600.0, ) * 3,
+                       ({'UO2': 100}, ) * 3)
+
+    assert len(table.compositions) == 1
+    assert table.compositions.references.tolist() == [3]
+
+    # each node is scaled to its own density
+    atombarn = table.atombarn()
+    np.testing.assert_allclose(atombarn[1], atombarn[0] * 1.05)
+    np.testing.assert_allclose(atombarn[2], table.compositions.atombarn({'UO2': 100}, 9000.0))
+
+
+def test_composition_reads_the_current_row():
+
+    table = NodeTable()
+    node = RadialNode(0.0, 0.1, 10000.0, 600.0, {'U235': 5, 'U238': 95}, node_table=table)
+
+    assert node.composition == pytest.approx({'U235': 5.0, 'U238': 95.0})
+
+    rows = table.detach_compositions([node.index])
+    compositions = table.compositions
+    compositions.number_densities[rows, compositions.column('U235')] = 0.0
+
+    assert node.composition == pytest.approx({'U238': 100.0})
+
+
+def test_released_rows_are_reused():
+
+    table = NodeTable()
+    table.append_nodes((0.0, 0.1), (0.1, 0.2), (10000.0, 10000.0), (600.0, 600.0), ({'UO2': 100}, {'Th': 100}))
+    compositions = table.compositions
+
+    table.set_composition(1, {'UO2': 100})
+    assert compositions.references.tolist() == [2, 0]
+
+    # the row of thorium has no node any more: a new composition takes it
+    table.set_composition(1, {'ZrB2': 100})
+    assert len(compositions) == 2
+    assert table.composition.tolist() == [0, 1]
+    assert compositions.references.tolist() == [1, 1]
+    assert {'B10', 'B11', 'Zr90'} <= RadialNode.view(table, 1).composition.keys()
+    assert sum(RadialNode.view(table, 1).composition.values()) == pytest.approx(100.0)
+
+    # and a released row is found again by its own composition until it is reused
+    table.set_composition(1, {'UO2': 100})
+    table.set_composition(0, {'ZrB2': 100})
+    assert len(compositions) == 2
+    assert compositions.references.tolist() == [1, 1]
+
+
+def test_detach_reuses_released_rows():
+
+    compositions = CompositionTable()
+    shared = compositions.intern({'UO2': 100}, 10000.0)
+    unused = compositions.intern({'Th': 100}, 10000.0)
+    compositions.acquire([shared, shared, unused])
+    compositions.release([unused])
+
+    detached = compositions.detach(np.array([shared]))
+
+    assert detached.tolist() == [unused]
+    assert len(compositions) == 2
+    np.testing.assert_array_equal(compositions.number_densities[unused], compositions.number_densities[shared])
+    assert compositions.intern({'Th': 100}, 10000.0) == 2
+
+
+def test_rows_are_reused_in_order_of_release():
+
+    compositions = CompositionTable()
+    shared = compositions.intern({'UO2': 100}, 10000.0)
+    rows = [compositions.intern({'Th': 100}, 10000.0), compositions.intern({'ZrB2': 100}, 3000.0),
+            compositions.intern({'Zr90': 100}, 6500.0)]
+    compositions.acquire([shared] * 3 + rows)
+
+    for row in (rows[2], rows[0], rows[1]):
+        compositions.release([row])
+
+    # 2 of the 3 nodes of the shared row get copies, in the 2 rows released first
+    assert compositions.detach(np.array([shared, shared])).tolist() == [rows[2], rows[0]]
+
+
+def test_versions_change_with_the_content_of_rows():
+
+    table = NodeTable()
+    table.append_nodes((0.0, 0.1), (0.1, 0.2), (10000.0, 10000.0), (600.0, 600.0), ({'UO2': 100}, ) * 2)
+    compositions = table.compositions
+    shared = compositions.versions[0]
+
+    rows = table.detach_compositions([1])
+    assert rows[0] != 0
+    assert compositions.versions[0] == shared
+
+    copied = compositions.versions[rows[0]]
+    compositions.modified(rows)
+    assert compositions.versions[rows[0]] == copied + 1
+    assert compositions.versions[0] == shared
+
+
+def test_assign_copies_in_place_and_changes_every_version():
+
+    table = NodeTable()
+    table.append_nodes((0.0, 0.1, 0.2), (0.1, 0.2, 0.3), (10000.0, ) * 3, (600.0, ) * 3,
+                       ({'UO2': 100}, {'UO2': 100}, {'Zr90': 100}))
+    saved = CompositionTable.from_arrays({name: array.copy() for name, array in
+                                          table.compositions.to_arrays().items()})
+
+    compositions = table.compositions
+    rows = table.detach_compositions([1])
+    compositions.number_densities[rows] *= 0.5
+    compositions.modified(rows)
+    versions = compositions.versions.copy()
+
+    compositions.assign(saved)
+
+    assert len(compositions) == len(saved) == 2 and versions.size == 3
+    assert np.all(compositions.versions != versions[:2])
+    np.testing.assert_array_equal(compositions.number_densities, saved.number_densities)
+    np.testing.assert_array_equal(compositions.references, [2, 1])
+    assert compositions.sources == saved.sources
+
+    # interned compositions are found again, and the table stays independent of the copy
+    assert compositions.intern({'Zr90': 100}, 6500.0) == 1
+    compositions.number_densities[0] = 0.0
+    assert np.all(saved.number_densities[0] >= 0.0) and np.any(saved.number_densities[0] > 0.0)
+    assert compositions.intern({'U238': 100}, 19000.0) == 2
+    assert compositions.versions[2] > versions[2]
+
+    with pytest.raises(ValueError):
+        compositions.assign(CompositionTable({}))
@@ -0,0 +1,104 @@
+"""Tests of the batched radial heat conduction of fuel rods"""
+
+import numpy as np
+import pytest
+
+from conduction import RodConduction
+from layering import equal_volume, nodalize_batch
+from node_table import NodeTable
+
+pellet_radius, clad_inner_radius, clad_outer_radius = 4.1E-3, 4.18E-3, 4.75E-3
+linear_power, coolant_temperature, heat_transfer_coefficient, gap_conductance = 2E4, 580.0, 3E4, 5000.0
+
+
+def constant(conductivity):
+
+    return lambda temperature: np.full_like(temperature, conductivity)
+
+
+def rods(radial_nodes, **options):
+
+    inner, outer, offsets = nodalize_batch(np.full(len(radial_nodes), pellet_radius), radial_nodes, equal_volume)
+
+    return RodConduction(inner, outer, offsets, clad_inner_radius, clad_outer_radius, clad_nodes=4,
+                         gap_conductance=gap_conductance, **options)
+
+
+def test_constant_conductivity_matches_the_parabolic_profile():
+
+    errors = []
+
+    for nodes in (10, 40, 160):
+        conduction = rods([nodes], fuel_conductivity=constant(3.0), clad_conductivity=constant(15.0))
+        temperature, clad_inner, clad_outer = conduction.solve(np.full(nodes, linear_power / nodes),
+                                                               coolant_temperature, heat_transfer_coefficient)
+
+        # film, cladding and gap drops, then T(r) = Ts + q'''(R^2 - r^2) / 4k in the pellet
+        expected_clad_outer = coolant_temperature + linear_power / (2 * np.pi * clad_outer_radius
+                                                                    * heat_transfer_coefficient)
+        expected_clad_inner = expected_clad_outer + linear_power * np.log(clad_outer_radius / clad_inner_radius) \
+            / (2 * np.pi * 15.0)
+        surface = expected_clad_inner + linear_power / (2 * np.pi * pellet_radius * gap_conductance)
+        radii = conduction.centre_radii[0, :nodes]
+        expected = surface + linear_power / (np.pi * pellet_radius ** 2) * (pellet_radius ** 2 - radii ** 2) / 12.0
+
+        assert clad_outer[0] == pytest.approx(expected_clad_outer, abs=1E-9)
+        assert clad_inner[0] == pytest.approx(expected_clad_inner, abs=1E-9)
+        errors.append(np.max(np.abs(temperature - expected)))
+
+    assert errors[1] < 0.01 * (expected[0] - surface)
+    assert errors[2] < errors[1] / 3 < errors[0] / 9
+
+
+def test_ragged_rods_are_solved_as_if_alone():
+
+    radial_nodes = [12, 3, 7, 1]
+    power = np.concatenate([np.linspace(1.0, 2.0, nodes) * 5000.0 / nodes for nodes in radial_nodes])
+    coolant = np.array([570.0, 580.0, 590.0, 600.0])
+
+    together = rods(radial_nodes)
+    temperature, clad_inner, clad_outer = together.solve(power, coolant, heat_transfer_coefficient, tolerance=1E-6)
+
+    assert together.nodes is None
+
+    for rod, nodes in enumerate(radial_nodes):
+        start, stop = together.offsets[rod], together.offsets[rod + 1]
+        alone = rods([nodes]).solve(power[start:stop], coolant[rod], heat_transfer_coefficient, tolerance=1E-6)
+
+        np.testing.assert_allclose(temperature[start:stop], alone[0], atol=1E-6)
+        np.testing.assert_allclose(clad_inner[rod], alone[1][0], atol=1E-6)
+        np.testing.assert_allclose(clad_outer[rod], alone[2][0], atol=1E-6)
+
+
+def table_of(materials, nodes=5):
+
+    table = NodeTable()
+    inner, outer, _ = nodalize_batch([pellet_radius], [nodes], equal_volume)
+
+    for material in materials:
+        start, stop = table.append_nodes(inner, outer, np.full(nodes, 10000.0), np.full(nodes, 900.0),
+                                         [{material: 100}] * nodes)
+        table.new_rod(start, stop)
+
+    return table
+
+
+def test_conductivity_follows_the_material_of_the_node():
+
+    table = table_of(['UO2', 'Th'])
+
+    with pytest.raises(ValueError):
+        RodConduction.from_table(table, clad_inner_radius, clad_outer_radius)
+
+    conduction = RodConduction.from_table(table, clad_inner_radius, clad_outer_radius,
+                                          conductivities={'UO2': constant(3.0), 'Th': constant(6.0)},
+                                          clad_conductivity=constant(15.0), gap_conductance=gap_conductance)
+    temperature, clad_inner, _ = conduction.solve(np.full(10, linear_power / 5), coolant_temperature,
+                                                  heat_transfer_coefficient)
+
+    assert conduction.materials == ('Th', 'UO2')
+    np.testing.assert_array_equal(conduction.nodes, np.arange(10))
+
+    # twice the conductivity, half the temperature rise in the pellet
+    surface = clad_inner + linear_power / (2 * np.pi * pellet_radius * gap_conductance)
+    np.testing.assert_allclose(temperature[:5] - surface[0], 2 * (temperature[5:] - surface[1]))
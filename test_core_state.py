@@ -0,0 +1,97 @@
+"""Tests of the CoreState views of a NodeTable and of the axial sweeps"""
+
+import numpy as np
+import pytest
+
+from benchmarks import duplex_pin
+from core_state import CoreState
+from geometry_starter import SimplifiedGeometry
+
+
+def geometry(pins, axial_nodes=4):
+
+    layout = [[pins[(row + column) % len(pins)] for column in range(3)] for row in range(3)]
+    pin_types = {'duplex': duplex_pin, 'thin': duplex_pin._replace(radial_nodes=(2, 1, 1))}
+
+    expanded = SimplifiedGeometry(pin_types, layout, axial_nodes).expand_geometry()
+    expanded.materialize()
+
+    return expanded
+
+
+def test_regular_state_is_a_view_of_the_table():
+
+    core = geometry(['duplex'])
+    table = core.node_table
+    state = CoreState.from_geometry(core, 1.0)
+
+    assert state['temperature'].shape == (core.cells, 4, 5)
+    assert np.shares_memory(state['temperature'], table.temperature)
+    assert state.nbytes < table.temperature.nbytes
+
+    fuel = core.fuel(0, 1, 2)
+    np.testing.assert_array_equal(state['outer_radius'][core.cell_index[0, 1], 2], fuel.table.outer_radius[
+        fuel.start:fuel.stop])
+
+    state['power'][core.cell_index[0, 1], 2] = 7.0
+    assert np.all(table.power[fuel.start:fuel.stop] == 7.0)
+
+
+@pytest.mark.parametrize('pins', [['duplex'], ['duplex', 'thin']])
+def test_sweep_writes_back_to_the_table(pins):
+
+    core = geometry(pins)
+    table = core.node_table
+    state = CoreState.from_geometry(core, 1.0)
+    rods = np.array([4, 1])
+    before = table.temperature.copy()
+
+    for level in state.sweep(('temperature', ), rods=rods):
+        level.fields['temperature'][:] = 1000.0 + level.index
+
+    for rod in range(state.rods):
+        for axial in range(state.axial_nodes):
+            fuel = core.fuel(*np.argwhere(core.cell_index == rod)[0], axial)
+            nodes = slice(fuel.start, fuel.stop)
+            expected = 1000.0 + axial if rod in rods else before[nodes]
+            assert np.all(table.temperature[nodes] == expected)
+
+
+def test_irregular_state_and_an_interrupted_sweep():
+
+    core = geometry(['duplex', 'thin'])
+    table = core.node_table
+    state = CoreState.from_geometry(core, 1.0)
+
+    assert state.mask.sum(axis=1).tolist() == [5, 4, 5, 4, 5, 4, 5, 4, 5]
+
+    with pytest.raises(ValueError):
+        state['power']
+
+    power = np.arange(len(table), dtype=np.float64)
+    table.power[:] = power
+
+    for level in state.sweep(('power', ), reverse=True):
+        assert level.fields['power'].shape == (state.rods, 5)
+        assert np.all(level.fields['power'][~state.mask] == 0.0)
+        level.fields['power'][:] *= 2
+        break
+
+    # only the top level was changed, and padding was not written anywhere
+    top = table.rod[np.isin(table.rod, core.cell_rods[:, -1])]
+    np.testing.assert_array_equal(np.isin(table.rod, top), table.power != power)
+    np.testing.assert_array_equal(table.power[table.power != power], 2 * power[table.power != power])
+
+    total = state.march(lambda level, carry: carry + level.fields['power'].sum(), 0.0, ('power', ))
+    assert total == pytest.approx(table.power.sum())
+
+
+def test_state_with_arrays_of_its_own():
+
+    state = CoreState(3, 2, 2, 1.0, dtype=np.float32)
+
+    for level in state.sweep(('power', ), rods=[2, 0]):
+        level.fields['power'][:] = level.index + 1
+
+    assert state['power'].dtype == np.float32
+    np.testing.assert_array_equal(state['power'][:, :, 0], [[1, 2], [0, 0], [1, 2]])
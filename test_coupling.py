@@ -0,0 +1,243 @@
+"""Tests of the PicardDriver with the stand-in solvers"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from benchmarks import duplex_pin
+from checkpoint import CheckpointWriter, latest_checkpoint
+from coupling import ArrayDeck, ExternalSolver, PicardDriver, assembly_rod_groups, read_array_deck, rod_blocks
+from geometry_starter import SimplifiedGeometry
+from instrumentation import instrumentation
+from iteration_store import IterationStore
+from node_table import NodeTable
+import stand_in_solvers
+from test_core_state import geometry
+
+script = os.path.abspath(stand_in_solvers.__file__)
+total_power = 1E4
+
+
+def core(rods=4, axial_nodes=5):
+
+    table = NodeTable()
+
+    for _ in range(rods):
+        start, stop = table.append_nodes(np.zeros(axial_nodes), np.full(axial_nodes, 4E-3),
+                                         np.full(axial_nodes, 10000.0), np.full(axial_nodes, 600.0),
+                                         [{'UO2': 100}] * axial_nodes)
+        table.new_rod(start, stop)
+
+    # a structure node outside of the rods
+    table.append_nodes([0.0], [1E-2], [6500.0], [565.0], [{'Zr90': 100}])
+
+    return table
+
+
+def driver(table, directory, **options):
+
+    neutronics = ExternalSolver([sys.executable, script, 'neutronics', '{input}', '{output}',
+                                 '--power', str(total_power)])
+    thermal_hydraulics = ExternalSolver([sys.executable, script, 'thermal-hydraulics', '{input}', '{output}',
+                                         '--coefficient', '0.6'])
+
+    return PicardDriver(table, neutronics, thermal_hydraulics, str(directory), blocks=2, workers=2,
+                        total_power=total_power, **options)
+
+
+@pytest.mark.parametrize('begins_with', ['thermal-hydraulics', 'neutronics'])
+def test_run_converges_to_the_fixed_point(tmp_path, begins_with):
+
+    table = core()
+    coupled = driver(table, tmp_path, begins_with=begins_with)
+
+    assert coupled.run(max_iterations=30)
+    assert coupled.residuals[-1][0] <= 1E-3
+
+    fuel = table.rod >= 0
+    assert np.isclose(table.power.sum(), total_power)
+    assert np.all(table.power[~fuel] == 0.0)
+    assert np.all(table.temperature[~fuel] == 565.0)
+
+    arrays = {field: getattr(table, field) for field in ('inner_radius', 'outer_radius', 'rod', 'temperature',
+                                                         'density', 'power')}
+    assert np.allclose(stand_in_solvers.neutronics(arrays, total_power)['power'], table.power, rtol=1E-3)
+
+    # decks are removed once parsed, including the neutronics deck begun for an iteration that did not run
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_kept_decks_are_complete(tmp_path):
+
+    table = core()
+    coupled = driver(table, tmp_path, keep_decks=True)
+    coupled.run(max_iterations=2)
+
+    names = sorted(os.listdir(str(tmp_path)))
+    assert 'neutronics_0000.in.npz' in names and 'neutronics_0001.out.npz' in names
+    assert 'thermal_hydraulics_0001_0001.in.npz' in names
+
+    # the deck begun during thermal-hydraulics holds every array
+    deck = read_array_deck(str(tmp_path / 'neutronics_0001.in.npz'))
+    assert set(deck) == {'inner_radius', 'outer_radius', 'composition', 'rod', 'number_densities',
+                         'reference_density', 'temperature', 'density'}
+    assert np.array_equal(deck['rod'], table.rod)
+
+
+def test_array_deck_in_parts(tmp_path):
+
+    path = str(tmp_path / 'deck.npz')
+    deck = ArrayDeck(path)
+    deck.add({'a': np.arange(3), 'b': np.eye(2)})
+    deck.add({'c': np.array([1.5])})
+    deck.close()
+
+    arrays = read_array_deck(path)
+    assert np.array_equal(arrays['a'], np.arange(3))
+    assert np.array_equal(arrays['b'], np.eye(2))
+    assert np.array_equal(arrays['c'], [1.5])
+
+    discarded = ArrayDeck(str(tmp_path / 'discarded.npz'))
+    discarded.add({'a': np.arange(3)})
+    discarded.discard()
+    assert os.listdir(str(tmp_path)) == ['deck.npz']
+
+
+def test_worker_solves_are_in_the_trace(tmp_path):
+
+    table = core()
+    coupled = driver(table, tmp_path / 'decks')
+
+    instrumentation.reset()
+    instrumentation.enable()
+
+    try:
+        coupled.run(max_iterations=2)
+    finally:
+        instrumentation.disable()
+
+    runs = [arguments['deck'] for name, _, _, _, _, arguments in instrumentation.events if name == 'solver.run']
+    workers = {arguments.get('process') for name, _, _, _, _, arguments in instrumentation.events
+               if name == 'solver.run' and arguments['deck'].startswith('thermal_hydraulics')}
+    instrumentation.reset()
+
+    assert sorted(runs) == ['neutronics_0000', 'neutronics_0001', 'thermal_hydraulics_0000_0000',
+                            'thermal_hydraulics_0000_0001', 'thermal_hydraulics_0001_0000',
+                            'thermal_hydraulics_0001_0001']
+    assert None not in workers and os.getpid() not in workers
+
+
+def test_resume_restores_the_table_and_the_store(tmp_path):
+
+    first = geometry(['duplex', 'thin'])
+    never = {'power_tolerance': 0.0, 'temperature_tolerance': 0.0}
+
+    with CheckpointWriter(str(tmp_path / 'checkpoints')) as writer, \
+            IterationStore(str(tmp_path / 'first.h5'), first.node_table) as store:
+        coupled = driver(first.node_table, tmp_path / 'decks', store=store, checkpoints=writer, geometry=first,
+                         **never)
+        coupled.run(max_iterations=3)
+        writer.wait()
+
+        assert coupled.iteration == 3
+        checkpoint = latest_checkpoint(str(tmp_path / 'checkpoints'))
+        np.testing.assert_array_equal(checkpoint.geometry().cell_rods, first.cell_rods)
+
+        # a new expansion of the same core, as after a restart
+        second = geometry(['duplex', 'thin'])
+
+        with IterationStore(str(tmp_path / 'second.h5'), second.node_table) as resumed_store:
+            resumed = driver(second.node_table, tmp_path / 'decks', store=resumed_store, geometry=second, **never)
+            compositions = second.node_table.compositions
+            versions = compositions.versions.copy()
+            resumed.resume(checkpoint)
+
+            # the compositions are copied into the table, as rows that changed
+            assert second.node_table.compositions is compositions
+            assert np.all(compositions.versions[:versions.size] != versions)
+
+            for field in NodeTable.float_fields + NodeTable.index_fields:
+                np.testing.assert_array_equal(getattr(second.node_table, field), getattr(first.node_table, field))
+
+            assert second.node_table.compositions.sources == first.node_table.compositions.sources
+            assert resumed.residuals == coupled.residuals
+            assert resumed_store.iteration == 3 and resumed_store.iterations() == [3]
+            np.testing.assert_array_equal(resumed_store.next['power'], first.node_table.power)
+
+            # the resumed run goes on exactly as the run that was not interrupted
+            coupled.run(max_iterations=1)
+            resumed.run(max_iterations=1)
+
+            assert resumed.iteration == 4 and resumed_store.iterations() == [3, 4]
+            assert resumed.residuals == coupled.residuals
+            np.testing.assert_array_equal(second.node_table.power, first.node_table.power)
+            np.testing.assert_array_equal(resumed_store.read(4, 'temperature')[:], store.read(4, 'temperature')[:])
+
+    with pytest.raises(ValueError):
+        driver(core(), tmp_path / 'decks').resume(checkpoint)
+
+    with pytest.raises(ValueError):
+        driver(core(), tmp_path / 'decks', geometry=first)
+
+
+def test_blocks_never_split_a_group_of_rods():
+
+    table = core(rods=6, axial_nodes=2)
+    groups = np.array([0, 1, 0, 2, 1, 2])
+
+    blocks = rod_blocks(table, 2, groups)
+    block_rods = [set(table.rod[nodes].tolist()) for nodes in blocks]
+
+    assert len(blocks) == 2
+    assert sorted(np.concatenate(blocks).tolist()) == np.flatnonzero(table.rod >= 0).tolist()
+    assert all({rod for rod in range(6) if groups[rod] == group} <= rods
+               for rods in block_rods for group in groups[list(rods)])
+
+    # without groups, blocks are contiguous rods and the node outside of the rods is in none
+    assert [nodes.tolist() for nodes in rod_blocks(table, 3)] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]]
+    assert len(rod_blocks(table, 10, np.zeros(6))) == 1
+
+    with pytest.raises(ValueError):
+        rod_blocks(table, 2, groups[:3])
+
+
+@pytest.mark.parametrize('symmetry, groups', [('full', 4), ('quarter', 1)])
+def test_assemblies_are_groups_of_rods(symmetry, groups):
+
+    expanded = SimplifiedGeometry({'A': duplex_pin}, [['A'] * 4] * 4, 2, symmetry).expand_geometry()
+    expanded.materialize()
+
+    rod_groups = assembly_rod_groups(expanded, 2)
+    # (assembly row, row, assembly column, column, axial level)
+    position_groups = rod_groups[expanded.position_rods()].reshape(2, 2, 2, 2, 2)
+
+    assert len(set(rod_groups.tolist())) == groups
+
+    # every position of an assembly, at every axial level, is in the group of the assembly
+    for assembly_row in range(2):
+        for assembly_column in range(2):
+            assert len(set(position_groups[assembly_row, :, assembly_column].ravel().tolist())) == 1
+
+
+def test_neutronics_deck_is_written_again_after_depletion(tmp_path):
+
+    table = core()
+    coupled = driver(table, tmp_path, begins_with='neutronics', keep_decks=True)
+    compositions = table.compositions
+
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        coupled.iterate(pool)
+
+        # depletion between the iterations rewrites a row in place, after the deck was begun
+        row = int(table.composition[0])
+        compositions.number_densities[row] *= 0.5
+        compositions.modified([row])
+
+        coupled.iterate(pool)
+
+    deck = read_array_deck(str(tmp_path / 'neutronics_0001.in.npz'))
+    np.testing.assert_array_equal(deck['number_densities'], compositions.number_densities)
+    assert set(deck) >= {'temperature', 'density', 'rod'}
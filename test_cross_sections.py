@@ -0,0 +1,70 @@
+"""Tests of the CrossSectionCache after compositions change in place"""
+
+import numpy as np
+
+from cross_sections import CrossSectionCache
+from node_table import NodeTable
+
+
+def core():
+
+    table = NodeTable()
+    table.append_nodes((0.0, 0.1, 0.2), (0.1, 0.2, 0.3), (10000.0, ) * 3, (600.0, ) * 3,
+                       ({'U235': 5, 'U238': 95}, ) * 3)
+    table.detach_compositions([2])
+
+    return table
+
+
+def cache_of(table, **options):
+
+    # the cross sections of a grid point follow the content of the row
+    def loader(row, temperature, density):
+        return np.array([table.compositions.number_densities[row].sum() * np.sqrt(temperature) * density])
+
+    return CrossSectionCache(loader, [300.0, 900.0], [9000.0, 11000.0], **options)
+
+
+def burn(table, node):
+
+    compositions = table.compositions
+    row = table.composition[node]
+    compositions.number_densities[row, compositions.column('U235')] *= 0.5
+
+    return row
+
+
+def test_rows_changed_in_place_are_interpolated_again():
+
+    table = core()
+    cache = cache_of(table, composition_table=table.compositions)
+    before = cache.update(table.composition, table.temperature, table.density).copy()
+
+    row = burn(table, 2)
+    table.compositions.modified([row])
+
+    after = cache.update(table.composition, table.temperature, table.density)
+    fresh = cache_of(table).update(table.composition, table.temperature, table.density)
+
+    np.testing.assert_allclose(after, fresh)
+    assert after[2, 0] < before[2, 0]
+    np.testing.assert_array_equal(after[:2], before[:2])
+    assert cache.refreshed == 4
+
+
+def test_invalidate_without_the_composition_table():
+
+    table = core()
+    cache = cache_of(table)
+    cache.update(table.composition, table.temperature, table.density)
+
+    # rows changed in place are not seen without invalidate
+    row = burn(table, 2)
+    stale = cache.update(table.composition, table.temperature, table.density, candidates=[0]).copy()
+
+    cache.invalidate([row])
+    after = cache.update(table.composition, table.temperature, table.density, candidates=[0])
+    fresh = cache_of(table).update(table.composition, table.temperature, table.density)
+
+    assert not np.allclose(stale, fresh)
+    np.testing.assert_allclose(after, fresh)
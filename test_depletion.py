@@ -0,0 +1,41 @@
+"""Tests of the Depleter and of the caches it refreshes"""
+
+import numpy as np
+
+from cross_sections import CrossSectionCache
+from depletion import Depleter, default_chain
+from node_table import NodeTable
+
+
+def test_depletion_refreshes_the_cross_sections():
+
+    table = NodeTable()
+    start, stop = table.append_nodes((0.0, 2E-3), (2E-3, 4E-3), (10000.0, ) * 2, (900.0, ) * 2,
+                                     ({'U235': 5, 'U238': 95}, ) * 2)
+    table.new_rod(start, stop)
+    table.power[:] = 1E4
+
+    compositions = table.compositions
+
+    def loader(row, temperature, density):
+        return compositions.number_densities[row, [compositions.column('U235')]] * np.ones(1)
+
+    cache = CrossSectionCache(loader, [600.0, 1200.0], [9000.0, 11000.0], composition_table=compositions)
+    before = cache.update(table.composition, table.temperature, table.density).copy()
+
+    fission = np.zeros((1, len(compositions.nuclides)))
+    fission[0, compositions.column('U235')] = 585.0
+    capture = np.zeros_like(fission)
+    capture[0, compositions.column('U238')] = 2.7
+
+    depleted = Depleter(default_chain(compositions.nuclides)).deplete(
+        table, {'fission': fission, 'capture': capture}, np.zeros(len(table), dtype=np.int64), 3E7)
+
+    assert depleted.tolist() == [0, 1]
+    assert np.unique(table.composition).size == 2
+
+    after = cache.update(table.composition, table.temperature, table.density)
+    expected = compositions.number_densities[table.composition, compositions.column('U235')]
+
+    np.testing.assert_allclose(after[:, 0], expected)
+    assert np.all(after[:, 0] < before[:, 0])
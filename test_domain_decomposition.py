@@ -0,0 +1,70 @@
+"""Tests of the DomainDecomposition workers and of the channel power kernel"""
+
+import numpy as np
+import pytest
+
+from domain_decomposition import DomainDecomposition, channel_power_kernel
+from geometry_channel_centered import SubchannelGeometry
+from geometry_translation import TranslationOperator
+
+
+def failing_kernel(subdomain, communicator, rod_arrays):
+
+    if subdomain.rank == 1:
+        raise ValueError('failing on purpose')
+
+    return {}, {}
+
+
+def owned_arrays_kernel(subdomain, communicator, rod_arrays):
+
+    return {'rank': np.full(subdomain.rods.size, subdomain.rank), 'power': rod_arrays['power']}, {}
+
+
+def test_persistent_workers_own_their_arrays():
+
+    geometry = SubchannelGeometry(6, 6, 0.0126, 0.0047)
+    power = np.random.default_rng(1).random(geometry.rods)
+
+    with DomainDecomposition(geometry, 3, 3) as decomposition:
+        rods, channels, values = decomposition.run(channel_power_kernel, {'power': power}, 3E6)
+        processes = [process.pid for process in decomposition._processes]
+
+        expected = TranslationOperator.from_subchannels(geometry).to_channels(power * 3E6 / power.sum())
+        np.testing.assert_allclose(channels['power'], expected)
+        np.testing.assert_allclose(rods['power'].sum(), 3E6)
+        assert values == {}
+
+        # the workers kept the power of the first run: the same shape at another scale has not changed
+        _, _, values = decomposition.run(channel_power_kernel, {'power': 2 * power}, 3E6)
+        assert values['residual'] == pytest.approx(0.0)
+
+        changed = power.copy()
+        changed[0] *= 2
+        rods, _, values = decomposition.run(channel_power_kernel, {'power': changed}, 3E6)
+        normalized = changed * 3E6 / changed.sum()
+        expected = np.linalg.norm(normalized - power * 3E6 / power.sum()) / np.linalg.norm(normalized)
+        assert isinstance(values['residual'], float) and values['residual'] == pytest.approx(expected)
+        assert set(rods) == {'power'}
+
+        # runs without arrays use the arrays the workers own
+        rods, _, _ = decomposition.run(owned_arrays_kernel)
+        np.testing.assert_array_equal(rods['power'], changed)
+        np.testing.assert_array_equal(rods['rank'], decomposition.ranks.ravel())
+        assert [process.pid for process in decomposition._processes] == processes
+
+    assert not decomposition.started
+
+
+def test_failed_worker_stops_every_worker():
+
+    geometry = SubchannelGeometry(6, 6, 0.0126, 0.0047)
+
+    with DomainDecomposition(geometry, 3, 2) as decomposition:
+        with pytest.raises(RuntimeError, match='failing on purpose'):
+            decomposition.run(failing_kernel)
+
+        assert not decomposition.started
+
+        rods, _, _ = decomposition.run(owned_arrays_kernel, {'power': np.ones(geometry.rods)})
+        np.testing.assert_array_equal(rods['power'], np.ones(geometry.rods))
@@ -0,0 +1,77 @@
+"""Tests of the precomputed sub-channel geometry of a square lattice"""
+
+import numpy as np
+import pytest
+
+from geometry_channel_centered import SubchannelGeometry
+
+pitch, radius = 1.26E-2, 4.75E-3
+
+
+def test_interior_channels():
+
+    geometry = SubchannelGeometry(3, 4, pitch, radius)
+    interior = geometry.channel(1, 2)
+
+    assert geometry.flow_area[interior] == pytest.approx(pitch ** 2 - np.pi * radius ** 2)
+    assert geometry.wetted_perimeter[interior] == pytest.approx(2 * np.pi * radius)
+    assert geometry.heated_perimeter[interior] == pytest.approx(2 * np.pi * radius)
+    assert geometry.hydraulic_diameter[interior] == pytest.approx(4 * (pitch ** 2 - np.pi * radius ** 2)
+                                                                  / (2 * np.pi * radius))
+    np.testing.assert_allclose(geometry.centroid[interior], [1.5 * pitch, 0.5 * pitch])
+
+
+def test_edge_and_corner_channels():
+
+    edge = 0.8 * pitch
+    geometry = SubchannelGeometry(3, 4, pitch, radius, edge=edge)
+
+    # a corner channel has 1 rod and 2 walls, an edge channel 2 rods and 1 wall
+    corner = geometry.channel(0, 0)
+    assert geometry.flow_area[corner] == pytest.approx(edge ** 2 - np.pi * radius ** 2 / 4)
+    assert geometry.wetted_perimeter[corner] == pytest.approx(np.pi * radius / 2 + 2 * edge)
+    assert geometry.heated_perimeter[corner] == pytest.approx(np.pi * radius / 2)
+
+    top = geometry.channel(0, 2)
+    assert geometry.flow_area[top] == pytest.approx(pitch * edge - np.pi * radius ** 2 / 2)
+    assert geometry.wetted_perimeter[top] == pytest.approx(np.pi * radius + pitch)
+
+    side = geometry.channel(1, 4)
+    assert geometry.flow_area[side] == pytest.approx(pitch * edge - np.pi * radius ** 2 / 2)
+    assert geometry.wetted_perimeter[side] == pytest.approx(np.pi * radius + pitch)
+
+    # the channels fill the box inside the walls, without the rods
+    box = (3 * pitch + 2 * edge) * (2 * pitch + 2 * edge)
+    assert geometry.flow_area.sum() == pytest.approx(box - geometry.rods * np.pi * radius ** 2)
+
+
+def test_gaps():
+
+    rows, columns = 3, 4
+    geometry = SubchannelGeometry(rows, columns, pitch, radius)
+
+    assert geometry.gap_channels.shape == (2 * rows * columns + rows + columns, 2)
+    assert np.count_nonzero(np.isclose(geometry.gap_width, pitch - 2 * radius)) == 2 * rows * columns - rows - columns
+    assert np.count_nonzero(np.isclose(geometry.gap_width, pitch / 2 - radius)) == 2 * (rows + columns)
+
+    # every gap joins neighbouring channels, and the cross flow leaves 1 and enters the other
+    first_rows, first_columns = np.divmod(geometry.gap_channels[:, 0], columns + 1)
+    second_rows, second_columns = np.divmod(geometry.gap_channels[:, 1], columns + 1)
+    assert np.all(np.abs(second_rows - first_rows) + np.abs(second_columns - first_columns) == 1)
+    np.testing.assert_array_equal(np.asarray(geometry.channel_gap.sum(axis=0)).ravel(), 0.0)
+    assert np.all(geometry.gap_length > 0.0)
+
+
+def test_rod_channel_connectivity_and_unheated_rods():
+
+    heated = np.ones((2, 2), dtype=bool)
+    heated[0, 1] = False
+    geometry = SubchannelGeometry(2, 2, pitch, radius, heated=heated)
+
+    np.testing.assert_allclose(np.asarray(geometry.rod_channel.sum(axis=1)).ravel(), 1.0)
+    assert geometry.rod_channel.getnnz(axis=1).tolist() == [4, 4, 4, 4]
+
+    centre = geometry.channel(1, 1)
+    assert geometry.heated_perimeter[centre] == pytest.approx(1.5 * np.pi * radius)
+    assert geometry.wetted_perimeter[centre] == pytest.approx(2 * np.pi * radius)
+    assert geometry.heated_perimeter.sum() == pytest.approx(3 * 2 * np.pi * radius)
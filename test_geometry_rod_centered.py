@@ -0,0 +1,83 @@
+"""Tests of the Fuel, RadialElement and RadialNode views of a NodeTable"""
+
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+from geometry_rod_centered import Fuel
+from node_table import NodeTable
+
+inner_radii = ((0.15, 0.2, 0.3), (0.34, ), (0.4096, ))
+outer_radii = ((0.2, 0.3, 0.34), (0.4096, ), (0.4106, ))
+densities = ((10270, ) * 3, (10230, ), (3000, ))
+temperatures = ((1200, ) * 3, (900, ), (600, ))
+compositions = (({'UO2': 100}, ) * 3, ({'Th': 100}, ), ({'ZrB2': 100}, ))
+
+
+def core(rods):
+
+    table = NodeTable()
+
+    return table, [Fuel(inner_radii, outer_radii, densities, temperatures, compositions, node_table=table)
+                   for _ in range(rods)]
+
+
+def test_element_nodes_are_cached_views():
+
+    table, fuels = core(2)
+    element = fuels[1].elements[0]
+
+    assert element.nodes is element.nodes
+    assert [node.index for node in element.nodes] == list(range(element.start, element.stop))
+
+    table.temperature[element.start] = 1300.0
+    assert element.nodes[0].temperature == 1300.0
+
+
+def test_deepcopy_copies_only_the_rows_of_the_fuel():
+
+    table, fuels = core(100)
+    fuel = fuels[42]
+    table.power[fuel.start:fuel.stop] = np.arange(1.0, 6.0)
+    fuel.power_update()
+
+    copied = deepcopy(fuel)
+
+    assert len(copied.table) == fuel.stop - fuel.start
+    assert len(copied.table.compositions) == 3
+    assert (copied.start, copied.stop, copied.index) == (0, 5, 0)
+    assert [element.index for element in copied.elements] == [0, 1, 2]
+    assert copied == fuel
+    assert copied.power == fuel.power == 15.0
+    assert copied.elements[0].power == fuel.elements[0].power == 6.0
+
+    copied.elements[0].nodes[0].temperature = 0.0
+    assert table.temperature[fuel.start] == 1200.0
+    assert copied != fuel
+
+
+def test_deepcopy_of_an_element():
+
+    table, fuels = core(3)
+    element = fuels[2].elements[1]
+
+    copied = deepcopy(element)
+
+    assert len(copied.table) == 1
+    assert copied == element
+    assert copied.nodes[0].density == 10230.0
+
+
+def test_fuel_without_elements_or_nodes_is_rejected():
+
+    table = NodeTable()
+
+    with pytest.raises(ValueError):
+        Fuel((), (), (), (), (), node_table=table)
+
+    with pytest.raises(ValueError):
+        Fuel(((0.1, ), ()), ((0.2, ), ()), ((1.0, ), ()), ((600.0, ), ()), (({'UO2': 100}, ), ()), node_table=table)
+
+    # nothing was appended to the table
+    assert len(table) == 0 and table.rods == 0
@@ -0,0 +1,72 @@
+"""Tests of the expansion of a SimplifiedGeometry and of its symmetries"""
+
+import numpy as np
+import pytest
+
+from benchmarks import duplex_pin
+from geometry_starter import SimplifiedGeometry
+
+pin_types = {'A': duplex_pin, 'B': duplex_pin._replace(radial_nodes=(2, 1, 1))}
+
+
+def test_quarter_symmetry_shares_mirrored_positions():
+
+    layout = [['A', 'B', 'B', 'A'],
+              ['B', None, None, 'B'],
+              ['B', None, None, 'B'],
+              ['A', 'B', 'B', 'A']]
+
+    expanded = SimplifiedGeometry(pin_types, layout, symmetry='quarter').expand_geometry()
+    index = expanded.cell_index
+
+    assert expanded.cells == 3 and expanded.pins == 12
+    assert index[0, 0] == index[0, 3] == index[3, 0] == index[3, 3]
+    assert index[0, 1] == index[0, 2] == index[3, 1] == index[3, 2]
+    assert index[1, 0] == index[2, 0] == index[1, 3] == index[2, 3]
+    assert index[0, 1] != index[1, 0]
+    assert np.all(index[1:3, 1:3] == -1)
+    assert expanded.template(3, 2).name == 'B'
+
+    assert SimplifiedGeometry(pin_types, layout).expand_geometry().cells == 12
+
+
+def test_eighth_symmetry_shares_transposed_positions():
+
+    layout = [['A'] * 5 for _ in range(5)]
+    layout[2][2] = 'B'
+
+    expanded = SimplifiedGeometry(pin_types, layout, symmetry='eighth').expand_geometry()
+    index = expanded.cell_index
+
+    # doubled distances to the centre (0, 2 or 4) in both directions, in any order
+    assert expanded.cells == 6 and expanded.pins == 25
+    assert index[0, 1] == index[1, 0] == index[4, 3] == index[3, 4] == index[0, 3]
+    assert index[0, 0] != index[0, 1]
+    assert expanded.template(2, 2).name == 'B'
+    assert np.array_equal(index, index.T)
+
+
+@pytest.mark.parametrize('symmetry, layout', [('quarter', [['A', None], ['A', 'A']]),
+                                              ('quarter', [['A', 'B'], ['A', 'A']]),
+                                              ('quarter', [['A', 'A', 'A'], ['A', 'A', 'B'], ['A', 'A', 'A']]),
+                                              ('eighth', [['A', 'B', 'A'], ['A', 'A', 'A'], ['A', 'B', 'A']]),
+                                              ('eighth', [['A', None, 'A'], ['A', 'A', 'A'], ['A', None, 'A']])])
+def test_asymmetric_layouts_are_rejected(symmetry, layout):
+
+    with pytest.raises(ValueError):
+        SimplifiedGeometry(pin_types, layout, symmetry=symmetry).expand_geometry()
+
+
+def test_invalid_layouts_are_rejected():
+
+    with pytest.raises(ValueError):
+        SimplifiedGeometry(pin_types, [['A', 'A'], ['A']])
+
+    with pytest.raises(ValueError):
+        SimplifiedGeometry(pin_types, [['A', 'A']], symmetry='eighth')
+
+    with pytest.raises(ValueError):
+        SimplifiedGeometry(pin_types, [['A', 'C']])
+
+    with pytest.raises(ValueError):
+        SimplifiedGeometry(pin_types, [['A']], symmetry='half')
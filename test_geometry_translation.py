@@ -0,0 +1,54 @@
+"""Tests of the translation of fields between rods and sub-channels"""
+
+import numpy as np
+import pytest
+
+from geometry_channel_centered import SubchannelGeometry
+from geometry_translation import TranslationOperator
+
+pitch = 1.26E-2
+
+
+def operator():
+
+    # rods of 2 sizes, so that the weights are not all equal
+    radius = np.full((3, 4), 4.75E-3)
+    radius[1, 1] = 5.5E-3
+
+    return TranslationOperator.from_subchannels(SubchannelGeometry(3, 4, pitch, radius))
+
+
+def test_to_channels_conserves_the_total():
+
+    translation = operator()
+    power = np.random.default_rng(3).uniform(1E3, 2E4, (translation.rods, 5))
+
+    channel_power = translation.to_channels(power)
+
+    assert channel_power.shape == (translation.channels, 5)
+    np.testing.assert_allclose(channel_power.sum(axis=0), power.sum(axis=0))
+    assert np.all(channel_power >= 0.0)
+
+    # every channel gets a quarter of the power of each rod at its corners
+    single = np.zeros(translation.rods)
+    single[5] = 8.0
+    assert sorted(translation.to_channels(single)[translation.to_channels(single) > 0].tolist()) == [2.0] * 4
+
+
+def test_to_rods_is_a_partition_of_unity():
+
+    translation = operator()
+
+    np.testing.assert_allclose(np.asarray(translation.weights.sum(axis=1)).ravel(), 1.0)
+    np.testing.assert_allclose(translation.to_rods(np.full(translation.channels, 580.0)), 580.0)
+
+    temperature = np.random.default_rng(4).uniform(560.0, 600.0, (translation.channels, 3))
+    rod_temperature = translation.to_rods(temperature)
+
+    # averages lie between the values of the channels around each rod
+    assert np.all(rod_temperature >= temperature.min(axis=0)) and np.all(rod_temperature <= temperature.max(axis=0))
+
+    # both directions are the same weights
+    power = np.random.default_rng(5).uniform(0.0, 1.0, translation.rods)
+    assert power @ translation.to_rods(temperature[:, 0]) == pytest.approx(translation.to_channels(power)
+                                                                           @ temperature[:, 0])
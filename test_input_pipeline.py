@@ -0,0 +1,105 @@
+"""Tests of the parsing of inputs and of the cache of expanded geometries"""
+
+import os
+
+import numpy as np
+import pytest
+
+from geometry_starter import SimplifiedGeometry
+from input_pipeline import InputError, load_input, parse_input, validate
+
+geometry_input = """
+neutronics_method = "hybrid monte carlo"
+axial_nodes = 2
+symmetry = "quarter"
+pin_types = {'fuel': {'outer_radii': (0.34, 0.4096, 0.4106), 'inner_radius': 0.15,
+                      'densities': (10270, 10230, 3000), 'temperatures': (1200, 900, 600),
+                      'compositions': ({'UO2': 100}, {'Th': 100}, {'ZrB2': 100}), 'radial_nodes': (3, 1, 1)}}
+layout = [['fuel', 'fuel'], ['fuel', 'fuel']]
+"""
+
+
+def write(path, text):
+
+    path.write_text(text)
+
+    return str(path)
+
+
+def test_literals_are_parsed_without_executing_the_input(tmp_path):
+
+    values = parse_input(write(tmp_path / 'input.py', 'temperature = 600\nradial_nodes = (4, 1)\n'
+                                                      'resonance = None  # comment\nmonk_stdv = -1E-4\n'))
+
+    assert values == {'temperature': 600, 'radial_nodes': (4, 1), 'resonance': None, 'monk_stdv': -1E-4}
+
+    parameters = validate(dict(values, neutronics_method='hybrid monte carlo'))
+    assert parameters['temperature'] == 600 and parameters['density'] == 10270
+
+    # the repository example is a valid input
+    assert validate(parse_input(os.path.join(os.path.dirname(__file__), 'input_file.py')))['resonance'] == 'full'
+
+    for text in ('import os\n', 'temperature = open("x")\n', 'temperature = density = 600\n',
+                 'temperature += 1\n', 'print("executed")\n'):
+        with pytest.raises(InputError):
+            parse_input(write(tmp_path / 'bad.py', text))
+
+    with pytest.raises(InputError):
+        validate({'temperatures': 600})
+
+    with pytest.raises(InputError):
+        validate({'neutronics_solver': 'wims11'})
+
+
+def test_cached_geometry_is_memory_mapped_and_not_expanded_again(tmp_path, monkeypatch):
+
+    path = write(tmp_path / 'input.py', geometry_input)
+    cache = str(tmp_path / 'cache')
+
+    _, expanded = load_input(path, cache)
+    assert len(os.listdir(cache)) == 1
+
+    def expand_geometry(self):
+        raise AssertionError('the geometry was expanded again')
+
+    monkeypatch.setattr(SimplifiedGeometry, 'expand_geometry', expand_geometry)
+
+    # comments and parameters other than the geometry do not change the artifact
+    write(tmp_path / 'input.py', geometry_input + 'temperature = 600  # warmer\n')
+    parameters, cached = load_input(path, cache)
+
+    assert parameters['temperature'] == 600
+    assert isinstance(cached.node_table.temperature, np.memmap)
+    assert isinstance(cached.cell_index, np.memmap)
+    assert cached.cells == expanded.cells == 1
+    np.testing.assert_array_equal(cached.cell_rods, expanded.cell_rods)
+
+    for field in ('inner_radius', 'outer_radius', 'temperature', 'composition', 'rod'):
+        np.testing.assert_array_equal(getattr(cached.node_table, field), getattr(expanded.node_table, field))
+
+    # changes are never written back to the artifact
+    cached.node_table.temperature[:] = 0.0
+    assert np.all(load_input(path, cache)[1].node_table.temperature == expanded.node_table.temperature)
+
+
+def test_changed_geometry_invalidates_the_cache(tmp_path):
+
+    path = write(tmp_path / 'input.py', geometry_input)
+    cache = str(tmp_path / 'cache')
+
+    _, first = load_input(path, cache)
+
+    write(tmp_path / 'input.py', geometry_input.replace("symmetry = \"quarter\"", "symmetry = \"full\""))
+    _, second = load_input(path, cache)
+
+    write(tmp_path / 'input.py', geometry_input.replace("'radial_nodes': (3, 1, 1)", "'radial_nodes': (5, 1, 1)"))
+    _, third = load_input(path, cache)
+
+    assert len(os.listdir(cache)) == 3
+    assert (first.cells, second.cells, third.cells) == (1, 4, 1)
+    assert len(third.node_table) == 2 * 7 and len(first.node_table) == 2 * 5
+
+    # the geometry of the first input is still cached
+    write(tmp_path / 'input.py', geometry_input)
+    assert load_input(path, cache)[1].cells == 1
+    assert len(os.listdir(cache)) == 3
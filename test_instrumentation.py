@@ -0,0 +1,71 @@
+"""Tests of the instrumentation: memory tracing, worker events and the trace export"""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import tracemalloc
+
+from instrumentation import Instrumentation, instrumentation
+
+
+def worker_block(instrumented):
+
+    with instrumentation.recording(instrumented) as events:
+        with instrumentation.timer('worker.block', size=3):
+            sum(range(1000))
+
+    return os.getpid(), events
+
+
+def test_disable_keeps_tracing_started_elsewhere():
+
+    tracemalloc.start()
+
+    try:
+        recorder = Instrumentation()
+        recorder.enable(trace_memory=True)
+        recorder.disable()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+    recorder.enable(trace_memory=True)
+    assert tracemalloc.is_tracing()
+    recorder.disable()
+    assert not tracemalloc.is_tracing()
+
+
+def test_worker_events_are_merged(tmp_path):
+
+    instrumentation.reset()
+    instrumentation.enable()
+
+    try:
+        with instrumentation.timer('parent.block'):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                worker, events = pool.submit(worker_block, instrumentation.enabled).result()
+
+        instrumentation.next_iteration()
+        instrumentation.merge(events, worker)
+
+        assert worker != os.getpid()
+        assert [event[0] for event in instrumentation.events] == ['parent.block', 'worker.block']
+        assert instrumentation.table()[1]['worker.block'][0] == 1
+
+        path = str(tmp_path / 'trace.json')
+        instrumentation.export(path)
+
+        with open(path) as trace:
+            events = {event['name']: event for event in json.load(trace)['traceEvents'] if event['ph'] == 'X'}
+
+        assert events['worker.block']['pid'] == worker
+        assert events['worker.block']['args'] == {'size': 3, 'process': worker, 'iteration': 1}
+        assert events['parent.block']['pid'] == os.getpid()
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+
+def test_recording_disabled_records_nothing():
+
+    assert worker_block(False)[1] == []
@@ -0,0 +1,81 @@
+"""Tests of the double-buffered IterationStore"""
+
+import numpy as np
+
+from iteration_store import IterationStore
+from node_table import NodeTable
+
+
+def table_of(nodes, capacity=None):
+
+    table = NodeTable(nodes if capacity is None else capacity)
+    table.append_nodes(np.zeros(nodes), np.ones(nodes), np.full(nodes, 10000.0), np.full(nodes, 600.0),
+                       [{'UO2': 100}] * nodes)
+
+    return table
+
+
+def test_advance_swaps_and_stores_iterations(tmp_path):
+
+    table = table_of(10)
+
+    with IterationStore(str(tmp_path / 'store.h5'), table, compression=None) as store:
+        store.next['temperature'][:] = 700.0
+        assert store.advance() == 1
+        assert np.all(table.temperature == 700.0)
+
+        # the next state starts from the current 1 without calling prime
+        assert np.all(store.next['temperature'] == 700.0)
+        store.next['power'][:] = 5.0
+        store.advance()
+
+        assert store.iterations() == [1, 2]
+        assert np.all(np.asarray(store.read(1, 'temperature')) == 700.0)
+        assert np.all(np.asarray(store.read(2, 'power')) == 5.0)
+        assert np.all(np.asarray(store.read(2, 'temperature')) == 700.0)
+        assert isinstance(store.read(1, 'temperature'), np.memmap)
+
+
+def test_compressed_reads_are_lazy_datasets(tmp_path):
+
+    table = table_of(10)
+
+    with IterationStore(str(tmp_path / 'store.h5'), table) as store:
+        store.next['temperature'][:] = 700.0
+        store.advance()
+
+        dataset = store.read(1, 'temperature')
+        assert not isinstance(dataset, np.ndarray)
+        assert np.all(dataset[2:5] == 700.0)
+
+
+def test_advance_without_writing_keeps_the_state(tmp_path):
+
+    table = table_of(4)
+    table.power[:] = 3.0
+
+    with IterationStore(str(tmp_path / 'store.h5'), table) as store:
+        store.advance()
+
+        assert np.all(table.power == 3.0)
+        assert np.all(table.temperature == 600.0)
+
+
+def test_table_growth_after_construction(tmp_path):
+
+    table = table_of(4, capacity=4)
+
+    with IterationStore(str(tmp_path / 'store.h5'), table) as store:
+        store.advance()
+
+        table.append_nodes(np.zeros(10), np.ones(10), np.full(10, 10000.0), np.full(10, 800.0),
+                           [{'UO2': 100}] * 10)
+        assert table.capacity > 4
+
+        next_state = store.next
+        assert next_state['temperature'].size == 14
+        next_state['temperature'][:] = 900.0
+        store.advance()
+
+        assert np.all(table.temperature == 900.0)
+        assert store.read(2, 'temperature').shape == (14, )
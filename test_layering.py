@@ -0,0 +1,50 @@
+"""Tests of the radial and axial nodalization"""
+
+import numpy as np
+import pytest
+
+from layering import (axial_power, axialize, equal_thickness, equal_thickness_batch, equal_volume,
+                      equal_volume_batch, nodalize, nodalize_batch)
+
+outer_radii = (0.34, 0.4096, 0.4106)
+inner_radii = (0.15, 0.34, 0.4096)
+radial_nodes = (3, 1, 1)
+
+
+@pytest.mark.parametrize('discretizer', (equal_volume, equal_thickness))
+def test_batch_matches_scalar_nodalization(discretizer):
+
+    batch_inner, batch_outer, offsets = nodalize_batch(outer_radii, radial_nodes, discretizer,
+                                                       inner_radii=inner_radii)
+
+    assert offsets.tolist() == [0, 3, 4, 5]
+
+    for cylinder, (outer_radius, nodes, inner_radius) in enumerate(zip(outer_radii, radial_nodes, inner_radii)):
+        scalar_inner, scalar_outer = nodalize(outer_radius, nodes, discretizer, inner_radius=inner_radius)
+        start, stop = offsets[cylinder], offsets[cylinder + 1]
+
+        np.testing.assert_allclose(batch_inner[start:stop], scalar_inner)
+        np.testing.assert_allclose(batch_outer[start:stop], scalar_outer)
+
+
+@pytest.mark.parametrize('discretizer', (equal_volume, equal_thickness, equal_volume_batch, equal_thickness_batch))
+def test_zero_nodes_are_rejected(discretizer):
+
+    with pytest.raises(ValueError):
+        nodalize_batch(outer_radii, (3, 0, 1), discretizer, inner_radii=inner_radii)
+
+
+@pytest.mark.parametrize('batch_discretizer', (equal_volume_batch, equal_thickness_batch))
+def test_batch_discretizers_reject_zero_layers(batch_discretizer):
+
+    with pytest.raises(ValueError):
+        batch_discretizer(outer_radii, (3, 0, 1), inner_radii=inner_radii)
+
+
+def test_axial_nodes():
+
+    bottoms, tops = axialize(3.6, 4, bottom=0.4)
+
+    np.testing.assert_allclose(bottoms, (0.4, 1.3, 2.2, 3.1))
+    np.testing.assert_allclose(tops, (1.3, 2.2, 3.1, 4.0))
+    np.testing.assert_allclose(axial_power((8.0, 4.0), 4), ((2.0, ) * 4, (1.0, ) * 4))
@@ -0,0 +1,49 @@
+"""Tests of the tally reading and of the PowerMap"""
+
+import numpy as np
+import pytest
+
+from power_map import PowerMap, read_tally_chunks
+
+
+def test_read_tallies_with_and_without_deviations(tmp_path):
+
+    with_deviations = tmp_path / 'monk.tally'
+    with_deviations.write_text('region power deviation\n# comment\n1 10.0 1.0\n\n2 20.0 2.0 # note\n3 5.0 0.5\n')
+    without_deviations = tmp_path / 'plain.tally'
+    without_deviations.write_text('region power\n1 10.0\n2 20.0\n3 5.0\n')
+
+    chunks = list(read_tally_chunks(str(with_deviations), chunk_lines=3))
+    assert [chunk.shape for chunk in chunks] == [(1, 3), (2, 3)]
+    np.testing.assert_array_equal(np.concatenate(chunks)[:, 2], [1.0, 2.0, 0.5])
+
+    chunks = list(read_tally_chunks(str(without_deviations)))
+    assert [chunk.shape for chunk in chunks] == [(3, 2)]
+
+    values, deviations = PowerMap([0, 0, 1, 2], np.ones(4), [1, 2, 3]).accumulate(chunks)
+    np.testing.assert_array_equal(values, [10.0, 20.0, 5.0])
+    np.testing.assert_array_equal(deviations, 0.0)
+
+
+def test_update_normalizes_over_regions_with_nodes():
+
+    # region 2 (number 30) has no nodes, and node 4 is outside every region
+    power_map = PowerMap([0, 0, 1, 1, -1], [1.0, 3.0, 1.0, 1.0, 1.0], region_ids=[10, 20, 30])
+    power = np.full(5, 100.0)
+
+    deviation = power_map.update(power, [np.array([[10, 6.0, 0.6], [20, 2.0, 0.1], [30, 50.0, 1.0]])], 400.0,
+                                 relaxation=0.5)
+
+    np.testing.assert_allclose(power, [0.5 * 100 + 0.5 * 75, 0.5 * 100 + 0.5 * 225, 0.5 * 100 + 0.5 * 50,
+                                       0.5 * 100 + 0.5 * 50, 50.0])
+    np.testing.assert_allclose(deviation, [0.1, 0.1, 0.05, 0.05, 0.0])
+
+    power = np.zeros(5)
+    power_map.update(power, [np.array([[10, 6.0], [20, 2.0], [30, 50.0]])], 400.0)
+    assert power.sum() == pytest.approx(400.0)
+
+    with pytest.raises(ValueError):
+        power_map.update(power, [np.array([[30, 50.0]])], 400.0)
+
+    with pytest.raises(ValueError):
+        power_map.accumulate([np.array([[40, 1.0]])])
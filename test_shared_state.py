@@ -0,0 +1,109 @@
+"""Tests of the SharedNodeTable segments and of the workers writing into them"""
+
+from concurrent.futures import ProcessPoolExecutor
+import gc
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from iteration_store import IterationStore
+from node_table import NodeTable
+import shared_state
+from shared_state import AttachedNodes, SharedNodeTable, map_blocks
+
+
+def table_of(nodes):
+
+    table = NodeTable(nodes)
+    table.append_nodes(np.zeros(nodes), np.ones(nodes), np.full(nodes, 10000.0), np.full(nodes, 600.0),
+                       [{'UO2': 100}] * nodes)
+
+    return table
+
+
+def double_temperature(nodes):
+
+    nodes['temperature'][:] *= 2
+    return nodes['temperature'].size
+
+
+def test_workers_write_into_the_table():
+
+    table = table_of(10)
+
+    with SharedNodeTable(table) as shared:
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            assert map_blocks(pool, double_temperature, shared, [(0, 4), (4, 10)]) == [4, 6]
+
+        assert np.all(table.temperature == 1200.0)
+
+    table.temperature[:] += 1.0
+    assert np.all(table.temperature == 1201.0)
+
+
+def test_collected_owner_leaves_the_table_usable():
+
+    table = table_of(10)
+    shared = SharedNodeTable(table)
+    name = shared.segment.name
+    table.power[:] = 3.0
+
+    del shared
+    gc.collect()
+
+    # the table got private copies before the segment was removed
+    table.power[:] += 1.0
+    assert np.all(table.power == 4.0)
+    assert np.all(table.temperature == 600.0)
+
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_columns_swapped_by_the_iteration_store_are_kept(tmp_path):
+
+    table = table_of(10)
+    table.temperature[:] = 900.0
+    shared = SharedNodeTable(table)
+    store = IterationStore(str(tmp_path / 'iterations.h5'), table, fields=('temperature', ))
+
+    store.next['temperature'][:] = 300.0
+    store.advance()
+
+    with pytest.raises(RuntimeError):
+        shared.layout
+
+    shared.close()
+
+    # the store owns its next buffers again, the table kept the current state
+    assert np.all(table.temperature == 300.0)
+    assert store._next['temperature'].base is None
+    store.advance()
+    assert np.all(table.temperature == 300.0)
+
+    store.close()
+
+
+def attached_segments(nodes):
+
+    return sorted(shared_state._attached)
+
+
+def test_workers_close_the_attachments_of_other_segments():
+
+    first, second = table_of(4), table_of(6)
+
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        with SharedNodeTable(first) as shared_first, SharedNodeTable(second) as shared_second:
+            names = shared_first.segment.name, shared_second.segment.name
+
+            assert map_blocks(pool, attached_segments, shared_first, [(0, 4)]) == [[names[0]]]
+            assert map_blocks(pool, attached_segments, shared_first, [(0, 2), (2, 4)]) == [[names[0]]] * 2
+            assert map_blocks(pool, attached_segments, shared_second, [(0, 6)]) == [[names[1]]]
+
+            # the owner process closes its own attachment with the segment
+            AttachedNodes(shared_first.layout)
+            assert names[0] in shared_state._attached
+
+        assert not shared_state._attached
@@ -0,0 +1,61 @@
+"""Tests of the AsyncSolverRunner with the stand-in thermal-hydraulics solver"""
+
+import os
+import sys
+
+import numpy as np
+
+from coupling import ExternalSolver
+from solver_runner import AsyncSolverRunner, DeckCache, deck_key
+import stand_in_solvers
+
+script = os.path.abspath(stand_in_solvers.__file__)
+
+
+def solver(coefficient):
+
+    return ExternalSolver([sys.executable, script, 'thermal-hydraulics', '{input}', '{output}',
+                           '--coefficient', str(coefficient)])
+
+
+def deck(power):
+
+    return {'power': np.full(3, power), 'rod': np.zeros(3, dtype=np.int32),
+            'temperature': np.full(3, 600.0), 'density': np.full(3, 10000.0)}
+
+
+def test_deck_key_depends_on_the_command():
+
+    assert deck_key(deck(100.0), solver(1.0).command) == deck_key(deck(100.0), solver(1.0).command)
+    assert deck_key(deck(100.0), solver(1.0).command) != deck_key(deck(100.0), solver(2.0).command)
+    assert deck_key(deck(100.0)) != deck_key(deck(200.0))
+
+
+def test_identical_decks_run_once_and_results_are_copies(tmp_path):
+
+    runner = AsyncSolverRunner(solver(1.0), str(tmp_path / 'decks'), cache=DeckCache(str(tmp_path / 'cache')))
+    results = runner.run_all({'a': deck(100.0), 'b': deck(100.0), 'c': deck(200.0)})
+
+    assert runner.runs == 2
+    assert np.all(results['a']['temperature'] == 665.0)
+    assert np.all(results['c']['temperature'] == 765.0)
+
+    results['a']['temperature'][:] = 0.0
+    assert np.all(results['b']['temperature'] == 665.0)
+
+    # solved decks come from the cache in later iterations
+    again = runner.run_all({'d': deck(200.0)})
+    assert runner.runs == 2
+    assert runner.cache.hits == 1
+    assert np.all(again['d']['temperature'] == 765.0)
+
+
+def test_solvers_sharing_a_cache_do_not_collide(tmp_path):
+
+    cache = DeckCache(str(tmp_path / 'cache'))
+    first = AsyncSolverRunner(solver(1.0), str(tmp_path / 'decks'), cache=cache)
+    second = AsyncSolverRunner(solver(2.0), str(tmp_path / 'decks'), cache=cache)
+
+    assert np.all(first.run_all({'a': deck(100.0)})['a']['temperature'] == 665.0)
+    assert np.all(second.run_all({'a': deck(100.0)})['a']['temperature'] == 765.0)
+    assert second.runs == 1
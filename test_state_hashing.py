@@ -0,0 +1,74 @@
+"""Tests of the content hashes of nodes, rods, assemblies and cores"""
+
+import numpy as np
+
+from benchmarks import core_geometry
+from state_hashing import StateHasher, composition_hashes, node_hashes, nodes_hash
+
+
+def hasher_of(pins_per_side=4, axial_nodes=2):
+
+    geometry = core_geometry(pins_per_side, axial_nodes)
+    geometry.materialize()
+
+    return geometry, StateHasher.from_geometry(geometry, assembly_size=2)
+
+
+def test_update_matches_rehash():
+
+    geometry, hasher = hasher_of()
+    table = geometry.node_table
+    before = hasher.snapshot()
+
+    changed = np.array([0, 7, 7, 40, len(table) - 1])
+    table.temperature[changed] += 10.0
+    rows = table.detach_compositions(changed[3:])
+    table.compositions.number_densities[rows, 0] *= 0.5
+    hasher.update(changed)
+    updated = hasher.snapshot()
+
+    hasher.rehash()
+    rehashed = hasher.snapshot()
+
+    assert updated == rehashed and updated != before
+    np.testing.assert_array_equal(updated.nodes, rehashed.nodes)
+    np.testing.assert_array_equal(updated.rods, rehashed.rods)
+    np.testing.assert_array_equal(updated.groups, rehashed.groups)
+
+    # changing nodes back gives the hashes of the start back
+    table.temperature[np.unique(changed)] -= 10.0
+    table.compositions.number_densities[rows, 0] *= 2
+    hasher.update(changed)
+    assert hasher.snapshot() == before
+
+
+def test_diff_tells_what_changed():
+
+    geometry, hasher = hasher_of()
+    table = geometry.node_table
+    before = hasher.snapshot()
+
+    node = int(np.flatnonzero(table.rod == 5)[1])
+    table.power[node] = 1E3
+    hasher.update([node])
+    after = hasher.snapshot()
+
+    nodes, rods, groups = before.diff(after)
+    assert nodes.tolist() == [node]
+    assert rods.tolist() == [5]
+    assert groups.tolist() == [hasher.rod_groups[5]]
+    assert [array.size for array in after.diff(hasher.snapshot())] == [0, 0, 0]
+
+
+def test_node_hashes_only_hash_the_rows_of_the_nodes():
+
+    geometry, hasher = hasher_of()
+    table = geometry.node_table
+    table.detach_compositions(np.arange(len(table)))
+
+    all_rows = composition_hashes(table.compositions)
+    np.testing.assert_array_equal(node_hashes(table, slice(3, 9)), node_hashes(table, slice(3, 9), all_rows))
+
+    # identical rods hash alike wherever their rows are
+    starts, stops = table.rod_bounds()
+    assert nodes_hash(table, starts[0], stops[0]) == nodes_hash(table, starts[1], stops[1])